@@ -0,0 +1,418 @@
+"""性能基准与压测
+
+用法:
+    python -m benchmarks.run                          # 默认 1万 条数据
+    python -m benchmarks.run --sizes 10000 1000000    # 多个数据规模
+    python -m benchmarks.run --mock-latency 0.2 --concurrency 32
+    python -m benchmarks.run --sizes 1000 --skip-load  # 含冷启动导入耗时（-X importtime）
+
+结果追加写入 benchmarks/results/history.json，并与同参数的上一次运行对比。
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmarks.seed import copy_database, seed_database, synthetic_rows
+
+RESULTS_FILE = os.path.join(os.path.dirname(__file__), "results", "history.json")
+# 与上次结果相比变慢超过该比例时标记为回归
+REGRESSION_THRESHOLD = 0.10
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """将耗时样本（秒）汇总为毫秒级统计"""
+    ordered = sorted(samples)
+
+    def pct(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000
+
+    return {
+        "n": len(ordered),
+        "min_ms": ordered[0] * 1000,
+        "median_ms": statistics.median(ordered) * 1000,
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "mean_ms": statistics.fmean(ordered) * 1000,
+    }
+
+
+def bench(fn: Callable[[], Any], repeat: int = 5, warmup: int = 1) -> Dict[str, float]:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def micro_benchmarks(db_path: str, count: int, repeat: int) -> Dict[str, Any]:
+    """分析器正则分类、数据清洗、导入、列表查询与序列化以及统计查询的微基准"""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    import main
+    from services.fetch import clean_data, import_data_to_db
+    from services.llm import ComplaintAnalyzer
+    from utils.serialization import dumps, rows_to_columns, rows_to_records
+
+    results: Dict[str, Any] = {}
+    sample = list(synthetic_rows(10000, seed=1))
+    texts = [row[1] for row in sample]
+    raw_items = [
+        {
+            "complaint_time": row[0][:19],
+            "content": f"  {row[1]}  ",
+            "user_id": row[2],
+            "complaint_category": row[3],
+        }
+        for row in sample
+    ]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        analyzer = ComplaintAnalyzer(os.path.join(tmp, "analyzer.db"))
+        results["classify_with_regex_10k"] = bench(
+            lambda: [analyzer._classify_with_regex(text) for text in texts], repeat
+        )
+        results["clean_data_10k"] = bench(lambda: clean_data(raw_items), repeat)
+
+        json_file = os.path.join(tmp, "complaints.json")
+        with open(json_file, "w", encoding="utf-8") as f:
+            json.dump(raw_items, f, ensure_ascii=False)
+        counter = iter(range(repeat + 1))
+        results["import_data_to_db_10k"] = bench(
+            lambda: import_data_to_db(
+                json_file, os.path.join(tmp, f"import_{next(counter)}.db")
+            ),
+            repeat,
+            warmup=0,
+        )
+
+    engine = create_engine(f"sqlite:///{db_path}")
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        results["read_complaints_limit100"] = bench(
+            lambda: main.query_complaints(db, skip=0, limit=100),
+            repeat,
+        )
+        results["read_complaints_limit5000"] = bench(
+            lambda: main.query_complaints(db, skip=0, limit=5000),
+            repeat,
+        )
+        results["read_complaints_deep_page"] = bench(
+            lambda: main.query_complaints(db, skip=max(0, count - 100), limit=100),
+            repeat,
+        )
+        results["get_statistics"] = bench(lambda: main.complaint_statistics(db), repeat)
+
+        for limit in (1000, 5000):
+            rows = min(limit, count)
+            legacy = bench(lambda: _serialize_orm(db, main, limit), repeat)
+            fast = bench(
+                lambda: dumps(
+                    rows_to_records(
+                        main.COMPLAINT_COLUMNS,
+                        main.query_complaints(db, skip=0, limit=limit),
+                    )
+                ),
+                repeat,
+            )
+            columnar = bench(
+                lambda: dumps(
+                    rows_to_columns(
+                        main.COMPLAINT_COLUMNS,
+                        main.query_complaints(db, skip=0, limit=limit),
+                    )
+                ),
+                repeat,
+            )
+            for name, stats in (
+                (f"serialize_orm_pydantic_{limit}", legacy),
+                (f"serialize_tuples_orjson_{limit}", fast),
+                (f"serialize_columnar_orjson_{limit}", columnar),
+            ):
+                stats["rows_per_sec"] = rows / (stats["median_ms"] / 1000)
+                results[name] = stats
+    engine.dispose()
+    return results
+
+
+def _serialize_orm(db, main, limit: int) -> bytes:
+    """原有列表接口的序列化路径：ORM实体 -> Pydantic 校验 -> jsonable_encoder -> json"""
+    from fastapi.encoders import jsonable_encoder
+
+    from utils.db import Complaint
+
+    items = [
+        main.ComplaintResponse.model_validate(c)
+        for c in db.query(Complaint).offset(0).limit(limit).all()
+    ]
+    return json.dumps(jsonable_encoder(items), ensure_ascii=False).encode("utf-8")
+
+
+async def _load_test(
+    db_path: str, requests_per_endpoint: int, concurrency: int
+) -> Dict[str, Any]:
+    import httpx
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    import main
+    from utils.cache import DATA_VERSION
+    from utils.db import data_version
+
+    engine = create_engine(
+        f"sqlite:///{db_path}", connect_args={"check_same_thread": False}
+    )
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    # ETag 和响应缓存随压测数据库的写入失效，不读写服务数据库的数据版本
+    DATA_VERSION.attach(data_version(engine))
+
+    def get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    for dependency in (main.get_db, main.get_read_db, main.get_analytics_db):
+        main.app.dependency_overrides[dependency] = get_db
+    payload = {
+        "complaint_time": "2025-01-01T00:00:00",
+        "content": "压测宽带网速慢",
+        "user_id": "bench_user",
+        "complaint_category": "宽带",
+    }
+    transport = httpx.ASGITransport(app=main.app)
+    semaphore = asyncio.Semaphore(concurrency)
+    results: Dict[str, Any] = {}
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        created = await client.post("/complaints/", json=payload)
+        complaint_id = created.json()["id"]
+
+        async def crud_cycle():
+            response = await client.post("/complaints/", json=payload)
+            new_id = response.json()["id"]
+            await client.put(f"/complaints/{new_id}", json=payload)
+            return await client.delete(f"/complaints/{new_id}")
+
+        scenarios = {
+            "GET /": lambda: client.get("/"),
+            "GET /static/js/app.js": lambda: client.get("/static/js/app.js"),
+            "GET /complaints/": lambda: client.get("/complaints/"),
+            "GET /complaints/?limit=1000": lambda: client.get(
+                "/complaints/", params={"limit": 1000}
+            ),
+            "GET /complaints/?q=": lambda: client.get(
+                "/complaints/", params={"q": "宽带"}
+            ),
+            "GET /complaints/{id}": lambda: client.get(f"/complaints/{complaint_id}"),
+            "GET /statistics/": lambda: client.get("/statistics/"),
+            "POST /analyze/": lambda: client.post(
+                "/analyze/", json={"text": "宽带网速慢"}
+            ),
+            "POST /simulate/": lambda: client.post("/simulate/"),
+            "POST+PUT+DELETE /complaints/": crud_cycle,
+            "GET /metrics": lambda: client.get("/metrics"),
+        }
+
+        for name, call in scenarios.items():
+            samples: List[float] = []
+            errors = 0
+
+            async def one():
+                nonlocal errors
+                async with semaphore:
+                    start = time.perf_counter()
+                    response = await call()
+                    samples.append(time.perf_counter() - start)
+                    if response.status_code >= 400:
+                        errors += 1
+
+            wall_start = time.perf_counter()
+            await asyncio.gather(*(one() for _ in range(requests_per_endpoint)))
+            wall = time.perf_counter() - wall_start
+            results[name] = {
+                **summarize(samples),
+                "errors": errors,
+                "rps": requests_per_endpoint / wall,
+            }
+
+        await client.delete(f"/complaints/{complaint_id}")
+
+    main.app.dependency_overrides.clear()
+    DATA_VERSION.attach(data_version(main.engine))
+    engine.dispose()
+    return results
+
+
+# 冷启动基准覆盖的入口模块：服务、命令行导入工具和分析器
+STARTUP_MODULES = ("main", "services.fetch", "services.llm")
+
+
+def parse_importtime(stderr: str) -> Dict[str, Dict[str, float]]:
+    """解析 python -X importtime 输出，返回 {模块: {"self_ms", "cumulative_ms"}}"""
+    modules: Dict[str, Dict[str, float]] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # 表头
+        modules[parts[2].strip()] = {
+            "self_ms": int(parts[0]) / 1000,
+            "cumulative_ms": int(parts[1]) / 1000,
+        }
+    return modules
+
+
+def startup_benchmarks(repeat: int) -> Dict[str, Any]:
+    """在全新子进程中用 -X importtime 测量各入口模块的导入耗时（mock 模式）
+
+    每次都是冷启动，反映工作进程启动、命令行工具和测试收集的导入开销。
+    """
+    results: Dict[str, Any] = {}
+    env = {**os.environ, "LLM_MODE": "mock"}
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for module in STARTUP_MODULES:
+        samples = []
+        for _ in range(repeat):
+            proc = subprocess.run(
+                [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                capture_output=True,
+                text=True,
+                cwd=root,
+                env=env,
+                check=True,
+            )
+            samples.append(parse_importtime(proc.stderr)[module]["cumulative_ms"] / 1000)
+        results[f"import_{module}"] = summarize(samples)
+    return results
+
+
+def load_test(db_path: str, requests_per_endpoint: int, concurrency: int):
+    """通过 httpx + ASGI transport 在进程内对每个接口进行并发压测
+
+    压测会新增投诉，因此在种子数据库的临时副本上运行，每次运行从相同的数据开始。
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        copy_path = copy_database(db_path, os.path.join(tmp, os.path.basename(db_path)))
+        return asyncio.run(_load_test(copy_path, requests_per_endpoint, concurrency))
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history() -> List[Dict[str, Any]]:
+    if not os.path.exists(RESULTS_FILE):
+        return []
+    with open(RESULTS_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_run(run: Dict[str, Any]):
+    history = load_history()
+    history.append(run)
+    os.makedirs(os.path.dirname(RESULTS_FILE), exist_ok=True)
+    with open(RESULTS_FILE, "w", encoding="utf-8") as f:
+        json.dump(history, f, ensure_ascii=False, indent=2)
+
+
+def compare(previous: Dict[str, Any], current: Dict[str, Any]) -> List[str]:
+    """对比两次运行的中位数耗时，返回回归项描述"""
+    regressions = []
+    for size, groups in current["results"].items():
+        for group, benches in groups.items():
+            for name, stats in benches.items():
+                old = previous["results"].get(size, {}).get(group, {}).get(name)
+                if not old or not old.get("median_ms"):
+                    continue
+                change = stats["median_ms"] / old["median_ms"] - 1
+                line = (
+                    f"[{size}] {group}/{name}: {old['median_ms']:.2f}ms -> "
+                    f"{stats['median_ms']:.2f}ms ({change:+.1%})"
+                )
+                print(line)
+                if change > REGRESSION_THRESHOLD:
+                    regressions.append(line)
+    return regressions
+
+
+def main_cli(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="投诉服务性能基准与压测")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=200, help="每个接口的请求数")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument(
+        "--mock-latency", type=float, default=0.0, help="模拟LLM响应延迟（秒）"
+    )
+    parser.add_argument("--skip-load", action="store_true", help="只运行微基准")
+    parser.add_argument("--skip-startup", action="store_true", help="跳过冷启动导入基准")
+    parser.add_argument("--no-save", action="store_true", help="不写入历史记录")
+    args = parser.parse_args(argv)
+
+    os.environ["LLM_MODE"] = "mock"
+    os.environ["LLM_MOCK_LATENCY"] = str(args.mock_latency)
+    logging.disable(logging.INFO)
+
+    params = {k: v for k, v in vars(args).items() if k not in ("no_save",)}
+    run: Dict[str, Any] = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "params": params,
+        "results": {},
+    }
+    if not args.skip_startup:
+        run["results"]["startup"] = {"import": startup_benchmarks(args.repeat)}
+    for size in args.sizes:
+        db_path = seed_database(size)
+        size_results: Dict[str, Any] = {
+            "micro": micro_benchmarks(db_path, size, args.repeat)
+        }
+        if not args.skip_load:
+            size_results["load"] = load_test(db_path, args.requests, args.concurrency)
+        run["results"][str(size)] = size_results
+
+    print(json.dumps(run["results"], ensure_ascii=False, indent=2))
+
+    previous = next(
+        (r for r in reversed(load_history()) if r.get("params") == params), None
+    )
+    regressions = compare(previous, run) if previous else []
+    if not args.no_save:
+        save_run(run)
+    if regressions:
+        print("性能回归:")
+        for line in regressions:
+            print("  " + line)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
@@ -0,0 +1,58 @@
+import logging
+import os
+import sqlite3
+from datetime import datetime
+
+from sqlalchemy import create_engine
+
+from services.simulate import SimulationSpec, bulk_insert, generate_batches
+from utils.db import Base
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), ".data")
+
+# 固定时间范围，保证相同规模和种子的数据完全一致
+START = datetime(2024, 1, 1)
+END = datetime(2025, 1, 1)
+
+
+def spec_for(count: int, seed: int = 0) -> SimulationSpec:
+    return SimulationSpec(count=count, start=START, end=END, seed=seed)
+
+
+def synthetic_rows(count: int, seed: int = 0):
+    """按 SIMULATION_CONFIG 生成 (complaint_time, content, user_id, complaint_category, reply) 行"""
+    for batch in generate_batches(spec_for(count, seed)):
+        yield from batch
+
+
+def seed_database(count: int, seed: int = 0) -> str:
+    """创建（或复用）包含 count 条模拟投诉的SQLite数据库，返回文件路径
+
+    条数不符（如被压测写入过）时重新生成，保证相同规模和种子的数据完全一致。
+    """
+    os.makedirs(DATA_DIR, exist_ok=True)
+    db_path = os.path.join(DATA_DIR, f"complaints_{count}_{seed}.db")
+    if os.path.exists(db_path):
+        with sqlite3.connect(db_path) as conn:
+            (existing,) = conn.execute("SELECT COUNT(*) FROM complaints").fetchone()
+        if existing == count:
+            return db_path
+        os.remove(db_path)
+
+    logger.info("生成 %d 条模拟投诉: %s", count, db_path)
+    engine = create_engine(f"sqlite:///{db_path}")
+    try:
+        Base.metadata.create_all(bind=engine)
+        bulk_insert(engine, spec_for(count, seed))
+    finally:
+        engine.dispose()
+    return db_path
+
+
+def copy_database(db_path: str, copy_path: str) -> str:
+    """通过备份API复制种子数据库，压测写入副本，种子数据库保持不变"""
+    with sqlite3.connect(db_path) as source, sqlite3.connect(copy_path) as target:
+        source.backup(target)
+    return copy_path
@@ -6,4 +6,24 @@ CREATE TABLE IF NOT EXISTS complaints (
     user_id TEXT NOT NULL,
     complaint_category TEXT NOT NULL,
     reply TEXT
-);
\ No newline at end of file
+);
+
+-- 创建incidents表（热点事件聚类）
+CREATE TABLE IF NOT EXISTS incidents (
+    id VARCHAR(32) PRIMARY KEY,
+    signature BLOB NOT NULL,
+    sample TEXT NOT NULL,
+    category TEXT,
+    size INTEGER NOT NULL,
+    first_seen DATETIME NOT NULL,
+    last_seen DATETIME NOT NULL,
+    hourly TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_incidents_last_seen ON incidents (last_seen);
+
+-- 创建data_version表（读接口缓存和ETag使用的数据版本号，只有id=1一行）
+CREATE TABLE IF NOT EXISTS data_version (
+    id INTEGER PRIMARY KEY,
+    version INTEGER NOT NULL,
+    epoch VARCHAR(16) NOT NULL
+);
@@ -0,0 +1,24 @@
+# gunicorn 多进程部署配置：gunicorn -c gunicorn.conf.py main:app
+#
+# preload_app 让主进程导入应用并完成建表等一次性启动工作后再 fork 工作进程，
+# 各工作进程通过共享缓存后端（默认 SQLite 文件，可设置 CACHE_BACKEND=redis://...）
+# 共享数据版本号和响应缓存。
+import multiprocessing
+import os
+
+# 在导入应用前设置，主进程和工作进程使用同一个共享缓存，各进程写各自的日志文件
+os.environ.setdefault("CACHE_BACKEND", "sqlite:///./data/cache.db")
+os.environ.setdefault("LOG_PER_PROCESS", "true")
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+graceful_timeout = 30
+
+
+def on_starting(server):
+    """在主进程派生工作进程前完成建表等一次性启动工作，快照等后台线程由工作进程竞选后启动"""
+    from main import prepare
+
+    prepare(background=False)
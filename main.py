@@ -1,26 +1,116 @@
 import logging
-import random
-from datetime import datetime
-from typing import Any, Dict, List, Optional
-
-from fastapi import Depends, FastAPI, HTTPException
+import os
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Literal, Optional
+
+import numpy as np
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from sqlalchemy import func
+from sqlalchemy import func, insert, or_, select
+from sqlalchemy.engine import Row
 from sqlalchemy.orm import Session
 
+from services.dispatcher import Priority, llm_priority
+from services.archive import ARCHIVE, ARCHIVE_INTERVAL, start_archiver
+from services.hotset import HOTSET, timeline_from_rows
+from services.incidents import INCIDENTS, hour_index
+from services.instrumentation import fallback_reason, record_fallback
 from services.llm import ComplaintAnalyzer
-from utils.config import SIMULATION_CONFIG
-from utils.db import Base, Complaint, SessionLocal, engine
+from services.local_llm import start_warmup
+from services.simulate import (
+    INSERT_COLUMNS,
+    SIMULATE_API_MAX_COUNT,
+    SimulationSpec,
+    bulk_insert,
+    generate_batches,
+)
+from utils.assets import REVALIDATE_CACHE_CONTROL, StaticAssets, asset_response
+from utils.cache import (
+    CACHE_REQUESTS,
+    DATA_VERSION,
+    DEFAULT_SHARED_CACHE,
+    RESPONSE_CACHE,
+    etag_matches,
+    make_etag,
+)
+from utils.compression import CompressionMiddleware
+from utils.db import (
+    AnalyticsSessionLocal,
+    Complaint,
+    ReadSessionLocal,
+    SessionLocal,
+    engine,
+    init_schema,
+    record_changes,
+    snapshot,
+)
+from utils.events import COMPLAINT_FEED, FEED_WATCHER, sse_stream
 from utils.logging import configure_logging
+from utils.metrics import REGISTRY
+from utils.profiling import SAMPLER, SWITCH, ProfiledRoute, ProfilingMiddleware, is_admin
+from utils.serialization import (
+    ORJSONBytesResponse,
+    dumps,
+    rows_to_columns,
+    rows_to_records,
+)
+from utils.tracing import RequestTracingMiddleware
+from utils.workers import acquire_leadership, export_completed, run_once
 
-# 配置日志
-configure_logging()
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+
+def prepare(background: bool = True):
+    """启动工作：配置日志、建表；background 时再启动分析快照刷新和定期归档、热点事件聚类、加载内存热数据、检查其它进程的写入
+
+    导入 main 时不配置日志也不访问数据库；服务启动时由 lifespan 调用。
+    多进程部署时启动器（serve、gunicorn 主进程）在派生工作进程前以 background=False 调用，
+    只完成建表等一次性工作：后台线程不随 fork 进入工作进程，启动器持有选举锁还会使工作进程都无法当选。
+    """
+    configure_logging()
+    # 多进程部署时建表只执行一次，快照只由一个进程刷新
+    run_once("schema", lambda: init_schema(engine))
+    if not background:
+        return
+    if snapshot is not None and acquire_leadership("snapshot"):
+        snapshot.start()
+    if ARCHIVE_INTERVAL > 0 and acquire_leadership("archive"):
+        start_archiver(engine, ARCHIVE, ARCHIVE_INTERVAL)
+    # 热点事件只由一个进程聚类并持久化，其它进程读取 incidents 表
+    if acquire_leadership("incidents"):
+        INCIDENTS.attach(engine)
+        INCIDENTS.start()
+    else:
+        INCIDENTS.follow(engine)
+    if HOTSET.enabled:
+        HOTSET.start(engine)
+    # 其它进程的写入以 reset 推送给本进程的实时推送连接
+    FEED_WATCHER.start()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    prepare()
+    # 本地模型在每个工作进程内加载，不随启动器 fork
+    if os.getenv("LLM_MODE", "online") != "mock":
+        start_warmup()
+    # 持续采样分析按工作进程开启，每个进程写出各自的堆栈文件；运行时开关通过共享缓存同步
+    if os.getenv("PROFILER_ENABLED", "false").lower() == "true":
+        SAMPLER.start()
+    SWITCH.start()
+    yield
+    SWITCH.stop()
+    SAMPLER.stop()
+    INCIDENTS.flush()
+
+
+app = FastAPI(lifespan=lifespan)
+app.router.route_class = ProfiledRoute
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -28,9 +118,13 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-app.mount("/static", StaticFiles(directory="templates/static"), name="static")
-
-Base.metadata.create_all(bind=engine)
+# 分析中间件在最内层，返回的报告同样经过压缩和耗时统计
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(RequestTracingMiddleware)
+STATIC_ASSETS = StaticAssets("templates/static")
+INDEX_PAGE = STATIC_ASSETS.render_page("templates/index.html")
+app.mount("/static", STATIC_ASSETS, name="static")
 
 
 def get_db():
@@ -41,6 +135,30 @@ def get_db():
         db.close()
 
 
+def get_read_db():
+    """GET 接口使用的只读会话"""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def get_analytics_db():
+    """统计分析使用的会话，配置快照后读取快照，否则使用只读连接"""
+    db = AnalyticsSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+@lru_cache(maxsize=1)
+def get_analyzer() -> ComplaintAnalyzer:
+    """进程内共享的投诉分析器，避免每个请求重复初始化模型客户端和数据库"""
+    return ComplaintAnalyzer()
+
+
 class ComplaintCreate(BaseModel):
     complaint_time: datetime
     content: str
@@ -56,9 +174,14 @@ class ComplaintResponse(ComplaintCreate):
         from_attributes = True
 
 
+class ProfilerToggle(BaseModel):
+    enabled: bool
+    interval: float | None = None  # 采样间隔（秒），None 表示保持不变
+
+
 @app.get("/")
-async def read_index():
-    return FileResponse("templates/index.html")
+async def read_index(request: Request):
+    return asset_response(request.scope, INDEX_PAGE, REVALIDATE_CACHE_CONTROL)
 
 
 @app.post("/complaints/", response_model=ComplaintResponse)
@@ -70,21 +193,47 @@ def create_complaint(complaint: ComplaintCreate, db: Session = Depends(get_db)):
     return db_complaint
 
 
-@app.get("/complaints/", response_model=List[ComplaintResponse])
-def read_complaints(
+# 列表接口直接查询的列，结果为普通元组，不经过ORM实体和身份映射
+COMPLAINT_COLUMNS = (
+    "id",
+    "complaint_time",
+    "content",
+    "user_id",
+    "complaint_category",
+    "reply",
+)
+
+
+def query_complaints(
+    db: Session,
     q: Optional[str] = None,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
-    analyzer: ComplaintAnalyzer = Depends(lambda: ComplaintAnalyzer()),
-):
-    base_query = db.query(Complaint)
+    analyzer: Optional[ComplaintAnalyzer] = None,
+    columns: tuple = COMPLAINT_COLUMNS,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> List[Row]:
+    """查询投诉列表，返回列元组；q 为自然语言查询，由LLM解析为过滤条件
+
+    不带 q 时归档记录排在投诉表记录之前一起分页，start/end 限定投诉时间范围
+    并跳过范围外的归档分区；start 落在内存热数据覆盖范围内时直接从内存读取。
+    自然语言查询只搜索投诉表。
+    """
+    base_query = select(*(getattr(Complaint, name) for name in columns))
+    if start is not None:
+        base_query = base_query.where(Complaint.complaint_time >= start)
+    if end is not None:
+        base_query = base_query.where(Complaint.complaint_time < end)
 
     if q:
         try:
-            filter_condition = analyzer.query_parser_chain.invoke({"query": q})
+            analyzer = analyzer or get_analyzer()
+            filter_condition = analyzer.query_parser_chain.invoke(
+                {"query": analyzer.fit_prompt("query_parser", q)}
+            )
             if filter_condition and filter_condition.strip():
-                logger.info(f"Parsed query condition: {filter_condition}")
+                logger.info("Parsed query condition: %s", filter_condition)
 
                 try:
                     from sqlalchemy import and_, not_, or_
@@ -113,29 +262,165 @@ def read_complaints(
                     condition = eval(
                         compiled_condition, {"__builtins__": None}, safe_dict
                     )
-                    base_query = base_query.filter(condition)
+                    base_query = base_query.where(condition)
                 except Exception as e:
                     logger.warning(
-                        f"Query parsing failed, falling back to simple search: {str(e)}"
+                        "Query parsing failed, falling back to simple search: %s", e
                     )
+                    record_fallback("query_parser", "invalid")
                     # 查询解析失败时回退到简单搜索
-                    base_query = base_query.filter(
+                    base_query = base_query.where(
                         Complaint.content.contains(q)
                         | Complaint.complaint_category.contains(q)
                     )
         except Exception as e:
-            logger.warning(f"查询解析失败: {str(e)}")
+            logger.warning("查询解析失败: %s", e)
+            record_fallback("query_parser", fallback_reason(e))
+    else:
+        if HOTSET.enabled and start is not None and not ARCHIVE.parts(start, end):
+            hot = HOTSET.rows(columns, start, end, skip, limit)
+            if hot is not None:
+                return hot
+        archived = ARCHIVE.rows(columns, start, end, skip, limit)
+        if archived:
+            limit -= len(archived)
+            skip = 0
+        else:
+            skip = max(0, skip - ARCHIVE.count(start, end))
+        if limit <= 0:
+            return archived
+        return archived + db.execute(base_query.offset(skip).limit(limit)).all()
+
+    return db.execute(base_query.offset(skip).limit(limit)).all()
+
+
+def complaint_statistics(
+    db: Session, start: Optional[datetime] = None, end: Optional[datetime] = None
+) -> Dict[str, int]:
+    """按分类统计投诉数量（含归档），按数量降序
+
+    内存热数据覆盖的时间段在内存中计数，数据库只统计更早的投诉。
+    """
+    query = db.query(Complaint.complaint_category, func.count(Complaint.id))
+    if start is not None:
+        query = query.filter(Complaint.complaint_time >= start)
+    if end is not None:
+        query = query.filter(Complaint.complaint_time < end)
+    counts = ARCHIVE.category_counts(start, end)
+    hot = HOTSET.category_counts(start, end) if HOTSET.enabled else None
+    if hot is not None:
+        cutoff, hot_counts = hot
+        counts.update(hot_counts)
+        if start is not None and start >= cutoff:
+            return dict(counts.most_common())
+        query = query.filter(
+            or_(Complaint.complaint_time < cutoff, Complaint.complaint_time.is_(None))
+        )
+    counts.update(dict(query.group_by(Complaint.complaint_category).all()))
+    return dict(counts.most_common())
+
+
+TIMELINE_BUCKETS = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+MAX_TIMELINE_BUCKETS = 10_000
+
+
+def complaint_timeline(
+    db: Session, start: datetime, end: datetime, width: timedelta
+) -> List[int]:
+    """[start, end) 内每 width 一个时间桶的投诉数（含归档）"""
+    buckets = -(-(end - start) // width)
+    counts = np.zeros(buckets, dtype=np.int64)
+    query = select(Complaint.complaint_time).where(
+        Complaint.complaint_time >= start, Complaint.complaint_time < end
+    )
+    hot = HOTSET.timeline(start, end, width, buckets) if HOTSET.enabled else None
+    if hot is not None:
+        cutoff, hot_counts = hot
+        counts += hot_counts
+        query = query.where(Complaint.complaint_time < cutoff)
+        if start >= cutoff:
+            return counts.tolist()
+    archived = ARCHIVE.count(start, end)
+    if archived:
+        rows = ARCHIVE.rows(("complaint_time",), start, end, 0, archived)
+        counts += timeline_from_rows((t for (t,) in rows), start, width, buckets)
+    counts += timeline_from_rows(db.execute(query).scalars(), start, width, buckets)
+    return counts.tolist()
+
+
+def cached_json(
+    request: Request, produce: Callable[[], Any], variant: str = ""
+) -> Response:
+    """读接口的条件请求与响应缓存
+
+    ETag 由数据版本号、路径和查询参数生成；If-None-Match 命中时直接返回304。
+    未命中时优先使用进程内缓存的序列化结果，数据版本变化后缓存键随之失效。
+    variant 用于区分数据版本之外的数据来源变化，例如分析快照的刷新代数。
+    """
+    version = DATA_VERSION.get()
+    query = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+    etag = make_etag(version, request.url.path, query, variant)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        CACHE_REQUESTS.inc(result="not_modified")
+        return Response(status_code=304, headers=headers)
+
+    key = (request.url.path, query, version, variant)
+    body = RESPONSE_CACHE.get(key)
+    if body is None:
+        CACHE_REQUESTS.inc(result="miss")
+        body = dumps(produce())
+        RESPONSE_CACHE.set(key, body)
+    else:
+        CACHE_REQUESTS.inc(result="hit")
+    return ORJSONBytesResponse(body, headers=headers)
+
+
+@app.get("/complaints/", response_model=List[ComplaintResponse])
+def read_complaints(
+    request: Request,
+    q: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 100,
+    fmt: Literal["records", "columns"] = Query("records", alias="format"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: Session = Depends(get_read_db),
+):
+    """format=columns 时返回按列的紧凑格式 {列名: [值, ...]}
 
-    complaints = base_query.offset(skip).limit(limit).all()
-    return complaints
+    start/end 按投诉时间 [start, end) 过滤，同时查询归档。
+    """
+
+    def produce():
+        rows = query_complaints(db, q, skip, limit, start=start, end=end)
+        if fmt == "columns":
+            return rows_to_columns(COMPLAINT_COLUMNS, rows)
+        return rows_to_records(COMPLAINT_COLUMNS, rows)
+
+    return cached_json(request, produce, f"{ARCHIVE.version}|{HOTSET.version}")
 
 
 @app.get("/complaints/{complaint_id}", response_model=ComplaintCreate)
-def read_complaint(complaint_id: int, db: Session = Depends(get_db)):
-    complaint = db.query(Complaint).filter(Complaint.id == complaint_id).first()
-    if complaint is None:
-        raise HTTPException(status_code=404, detail="Complaint not found")
-    return complaint
+def read_complaint(
+    complaint_id: int, request: Request, db: Session = Depends(get_read_db)
+):
+    columns = COMPLAINT_COLUMNS[1:]
+
+    def produce():
+        row = db.execute(
+            select(*(getattr(Complaint, name) for name in columns)).where(
+                Complaint.id == complaint_id
+            )
+        ).first()
+        if row is not None:
+            return dict(zip(columns, row))
+        archived = ARCHIVE.get(complaint_id, columns)
+        if archived is None:
+            raise HTTPException(status_code=404, detail="Complaint not found")
+        return archived
+
+    return cached_json(request, produce, ARCHIVE.version)
 
 
 @app.put("/complaints/{complaint_id}", response_model=ComplaintCreate)
@@ -163,63 +448,208 @@ def delete_complaint(complaint_id: int, db: Session = Depends(get_db)):
 
 
 @app.get("/statistics/", response_model=Dict[str, int])
-def get_statistics(db: Session = Depends(get_db)):
-    statistics = (
-        db.query(Complaint.complaint_category, func.count(Complaint.id))
-        .group_by(Complaint.complaint_category)
-        .order_by(func.count(Complaint.id).desc())
-        .all()
+def get_statistics(
+    request: Request,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    db: Session = Depends(get_analytics_db),
+):
+    """各分类投诉数，包含归档；start/end 按投诉时间 [start, end) 过滤"""
+    variant = snapshot.version if snapshot is not None else ""
+    return cached_json(
+        request,
+        lambda: complaint_statistics(db, start, end),
+        f"{variant}|{ARCHIVE.version}|{HOTSET.version}",
+    )
+
+
+@app.get("/statistics/timeline")
+def get_timeline(
+    request: Request,
+    start: datetime,
+    end: Optional[datetime] = None,
+    bucket: Literal["hour", "day"] = "hour",
+    db: Session = Depends(get_analytics_db),
+):
+    """[start, end) 内按小时或天分桶的投诉数，包含归档；end 默认为当前时间"""
+    width = TIMELINE_BUCKETS[bucket]
+    variant = snapshot.version if snapshot is not None else ""
+    if end is None:
+        # 未指定 end 时结果随时间推移变化，当前小时序号作为缓存变体
+        end = datetime.now()
+        variant = f"{variant}|{hour_index(end)}"
+    if end <= start or (end - start) / width > MAX_TIMELINE_BUCKETS:
+        raise HTTPException(status_code=400, detail="时间范围无效或分桶过多")
+    return cached_json(
+        request,
+        lambda: {
+            "start": start,
+            "bucket": bucket,
+            "counts": complaint_timeline(db, start, end, width),
+        },
+        f"{variant}|{ARCHIVE.version}|{HOTSET.version}",
     )
-    return {category: count for category, count in statistics}
+
+
+@app.get("/incidents")
+def read_incidents(
+    request: Request,
+    hours: int = Query(24, gt=0, le=INCIDENTS.window_hours),
+    min_size: int = Query(2, gt=0),
+    limit: int = Query(20, gt=0, le=200),
+):
+    """热点事件：内容相近的投诉归为一个事件，按最近 hours 小时内的投诉数降序"""
+    # 逐小时序列随整点滚动，小时序号作为缓存变体
+    variant = str(hour_index(datetime.now()))
+    return cached_json(request, lambda: INCIDENTS.top(hours, min_size, limit), variant)
 
 
 @app.post("/simulate/", response_model=List[ComplaintCreate])
-def simulate_data(db: Session = Depends(get_db)):
-    config = SIMULATION_CONFIG
-    complaints = []
-    for _ in range(10):
-        category = random.choice(config["categories"])
-        problem = random.choice(config["problems"][category])
-        complaint = Complaint(
-            complaint_time=datetime.now(),
-            content=f"我的{category}{problem}" if category != "其它" else problem,
-            user_id=f"user_{random.randint(1, 1000):04d}",
-            complaint_category=category,
-            reply=(
-                random.choice(config["replies"]) if random.random() > 0.7 else None
-            ),  # 30%概率有回复
-        )
-        db.add(complaint)
-        complaints.append(complaint)
-        logger.info(f"Generated simulated complaint: {complaint.content}")
+def simulate_data(
+    count: int = Query(10, gt=0, le=1000), db: Session = Depends(get_db)
+):
+    """生成少量模拟投诉（时间为最近一分钟内），直接返回生成的数据"""
+    now = datetime.now()
+    spec = SimulationSpec(count=count, start=now - timedelta(minutes=1), end=now)
+    rows = [
+        dict(zip(INSERT_COLUMNS, row))
+        for batch in generate_batches(spec)
+        for row in batch
+    ]
+    for row in rows:
+        row["complaint_time"] = datetime.fromisoformat(row["complaint_time"])
+    ids = db.scalars(
+        insert(Complaint).returning(Complaint.id, sort_by_parameter_order=True), rows
+    ).all()
+    for row, complaint_id in zip(rows, ids):
+        row["id"] = complaint_id
+    record_changes(db, inserted=rows)
     db.commit()
-    return complaints
+    logger.info("Generated %d simulated complaints", len(rows))
+    return rows
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """管理接口须带 X-Admin-Token，未配置 ADMIN_TOKEN 时一律拒绝"""
+    if not is_admin(x_admin_token):
+        raise HTTPException(status_code=403, detail="需要管理令牌")
+
+
+@app.post("/simulate/bulk", dependencies=[Depends(require_admin)])
+def simulate_bulk(spec: SimulationSpec, db: Session = Depends(get_db)):
+    """按参数批量生成模拟数据，向量化生成并以大事务批量写入
+
+    单次请求的条数受 SIMULATE_API_MAX_COUNT 限制，更大规模使用 python -m services.simulate。
+    """
+    if spec.count > SIMULATE_API_MAX_COUNT:
+        raise HTTPException(
+            status_code=400,
+            detail=f"单次最多生成 {SIMULATE_API_MAX_COUNT} 条，更大规模请使用命令行 python -m services.simulate",
+        )
+    started = time.perf_counter()
+    inserted = bulk_insert(db.get_bind(), spec)
+    return {"inserted": inserted, "seconds": round(time.perf_counter() - started, 3)}
+
+
+@app.get("/events/complaints")
+async def complaint_events(request: Request):
+    """以 Server-Sent Events 推送投诉的新增、修改、删除和分类计数增量"""
+    return StreamingResponse(
+        sse_stream(COMPLAINT_FEED, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/metrics")
+def metrics():
+    """以 Prometheus 文本格式导出指标"""
+    return PlainTextResponse(
+        REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@app.get("/admin/profiler", dependencies=[Depends(require_admin)])
+def profiler_status():
+    """当前工作进程的持续采样分析状态"""
+    return SAMPLER.status()
+
+
+@app.post("/admin/profiler", dependencies=[Depends(require_admin)])
+def toggle_profiler(toggle: ProfilerToggle):
+    """运行时开启或关闭所有工作进程的持续采样分析，无需重启
+
+    当前进程立即生效，其它进程在 PROFILER_POLL_INTERVAL 秒内从共享缓存读取开关。
+    """
+    if toggle.interval is not None and toggle.interval <= 0:
+        raise HTTPException(status_code=400, detail="采样间隔必须大于 0")
+    SWITCH.set(toggle.enabled, toggle.interval)
+    return SAMPLER.status()
 
 
 @app.post("/analyze/")
 def analyze_complaint(
     request: Dict[str, Any],
-    analyzer: ComplaintAnalyzer = Depends(lambda: ComplaintAnalyzer()),
+    analyzer: ComplaintAnalyzer = Depends(get_analyzer),
+    x_llm_priority: str = Header("interactive"),
 ):
-    """分析投诉内容并返回处理方法"""
+    """分析投诉内容并返回处理方法
+
+    批量调用方可通过 X-LLM-Priority: batch/background 降低优先级，
+    不与在线用户争抢模型配额。
+    """
     text = request.get("text", "")
     if not text:
         raise HTTPException(status_code=400, detail="投诉内容不能为空")
+    try:
+        priority = Priority.parse(x_llm_priority)
+    except KeyError:
+        raise HTTPException(
+            status_code=400, detail=f"无效的 X-LLM-Priority: {x_llm_priority}"
+        )
 
     try:
-        result = analyzer.analyze(text)
-        logger.info(f"Analyzer category: {result.category}, reply: {result.reply}")
+        with llm_priority(priority):
+            result = analyzer.analyze(text)
+        logger.info("Analyzer category: %s, reply length: %d", result.category, len(result.reply))
         return {
             "category": result.category,
             "reply": result.reply,
             "suggestion": f"{result.reply}",  # 添加AI建议的处理方法
         }
     except Exception as e:
-        logger.error(f"Error in analyze_complaint: {e}", exc_info=True)
+        logger.error("Error in analyze_complaint: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
-if __name__ == "__main__":
+def serve(argv: Optional[List[str]] = None):
+    """启动服务；--workers 大于1时以多进程模式运行，各进程通过共享缓存后端协同"""
+    import argparse
+
     import uvicorn
 
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    parser = argparse.ArgumentParser(description="启动智能客服服务")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "1"))
+    )
+    args = parser.parse_args(argv)
+
+    if args.workers <= 1:
+        uvicorn.run(app, host=args.host, port=args.port)
+        return
+
+    # 进程内缓存无法感知其它进程的写入，多进程时默认使用 SQLite 共享缓存；各进程写各自的日志文件
+    os.environ.setdefault("CACHE_BACKEND", DEFAULT_SHARED_CACHE)
+    os.environ.setdefault("LOG_PER_PROCESS", "true")
+    if os.environ["CACHE_BACKEND"] == "memory":
+        logger.warning("多进程模式下使用进程内缓存，各进程的读缓存可能返回过期数据")
+    # 启动器完成建表等一次性工作，工作进程跳过；后台线程由工作进程竞选后启动
+    prepare(background=False)
+    export_completed()
+    uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,483 @@
+import argparse
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from array import array
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.engine import Engine
+
+from utils.config import ARCHIVE_CONFIG, SQLALCHEMY_DATABASE_URL
+from utils.db import (
+    Complaint,
+    STREAM_BATCH_SIZE,
+    create_app_engine,
+    init_schema,
+    notify_external_write,
+    stream_rows,
+)
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_PATH = os.getenv("ARCHIVE_PATH", ARCHIVE_CONFIG["path"])
+ARCHIVE_MAX_AGE_DAYS = int(os.getenv("ARCHIVE_MAX_AGE_DAYS", ARCHIVE_CONFIG["max_age_days"]))
+ARCHIVE_COMPRESSION = os.getenv("ARCHIVE_COMPRESSION", ARCHIVE_CONFIG["compression"])
+ARCHIVE_INTERVAL = float(os.getenv("ARCHIVE_INTERVAL", ARCHIVE_CONFIG["interval"]))
+
+ARCHIVED_ROWS = REGISTRY.counter("archive_rows_total", "移入归档文件的投诉数")
+ARCHIVE_PARTS_READ = REGISTRY.counter(
+    "archive_parts_read_total", "查询读取的归档文件数：scanned 读取，pruned 按时间范围跳过", ("result",)
+)
+
+COMPLAINTS = Complaint.__table__
+ARCHIVE_COLUMNS = ("id", "complaint_time", "content", "user_id", "complaint_category", "reply")
+# SQLite 单条语句的参数个数上限较低，按块删除
+_DELETE_CHUNK = 500
+ROW_GROUP_SIZE = ARCHIVE_CONFIG["row_group_size"]
+_PARTITION = re.compile(r"year=(\d{4})[/\\]month=(\d{2})$")
+
+
+@lru_cache(maxsize=1)
+def _pyarrow():
+    """pyarrow 为可选依赖，首次读写归档时才导入，未安装时返回 None"""
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.parquet
+    except ImportError:
+        logger.warning("未安装 pyarrow，归档文件不可读写")
+        return None
+    return pyarrow
+
+
+def _schema(pa):
+    return pa.schema(
+        [
+            ("id", pa.int64()),
+            ("complaint_time", pa.timestamp("us")),
+            ("content", pa.string()),
+            ("user_id", pa.string()),
+            ("complaint_category", pa.string()),
+            ("reply", pa.string()),
+        ]
+    )
+
+
+def _month_start(moment: datetime) -> datetime:
+    return datetime(moment.year, moment.month, 1)
+
+
+def _next_month(month: datetime) -> datetime:
+    return datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+@dataclass(frozen=True)
+class ArchivePart:
+    """一个归档文件，属于某个月份分区；文件写入后不再修改"""
+
+    path: str
+    month: datetime
+
+    def overlaps(self, start: Optional[datetime], end: Optional[datetime]) -> bool:
+        return (end is None or self.month < end) and (
+            start is None or _next_month(self.month) > start
+        )
+
+    def within(self, start: Optional[datetime], end: Optional[datetime]) -> bool:
+        """整个分区都在 [start, end) 内，无需逐行过滤时间"""
+        return (start is None or self.month >= start) and (
+            end is None or _next_month(self.month) <= end
+        )
+
+
+class ComplaintArchive:
+    """按月分区的 Parquet 冷数据，提供与投诉表一致的只读查询
+
+    查询先按时间范围跳过不相交的月份分区，完全落在范围内的文件直接使用
+    文件元数据中的行数和缓存的分类计数，只有跨越范围边界的文件才逐行过滤。
+    归档行按月份、投诉时间排序，排在投诉表中的记录之前。
+    """
+
+    def __init__(self, root: str, scan_interval: float = ARCHIVE_CONFIG["scan_interval"]):
+        self.root = root
+        self.scan_interval = scan_interval
+        self._parts: List[ArchivePart] = []
+        self._scanned = float("-inf")
+        self._meta: Dict[str, Tuple[int, int, int]] = {}
+        self._categories: Dict[str, Counter] = {}
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        """重新扫描归档目录，归档任务写入新文件后调用"""
+        parts = []
+        for directory, _, files in os.walk(self.root):
+            match = _PARTITION.search(directory)
+            if match is None:
+                continue
+            month = datetime(int(match.group(1)), int(match.group(2)), 1)
+            parts.extend(
+                ArchivePart(os.path.join(directory, name), month)
+                for name in files
+                if name.endswith(".parquet")
+            )
+        with self._lock:
+            self._parts = sorted(parts, key=lambda part: (part.month, part.path))
+            self._scanned = time.monotonic()
+
+    @property
+    def version(self) -> str:
+        """归档文件数，作为读接口缓存的变体；归档只增加文件，命令行归档后缓存也会失效"""
+        return str(len(self.parts()))
+
+    def parts(
+        self, start: Optional[datetime] = None, end: Optional[datetime] = None
+    ) -> List[ArchivePart]:
+        """与时间范围 [start, end) 相交的归档文件"""
+        if time.monotonic() - self._scanned >= self.scan_interval:
+            self.refresh()
+        if self._parts and _pyarrow() is None:
+            return []
+        selected = [part for part in self._parts if part.overlaps(start, end)]
+        ARCHIVE_PARTS_READ.inc(len(self._parts) - len(selected), result="pruned")
+        return selected
+
+    def _metadata(self, part: ArchivePart) -> Tuple[int, int, int]:
+        """(行数, 最小ID, 最大ID)，从 Parquet 页脚读取并缓存"""
+        meta = self._meta.get(part.path)
+        if meta is None:
+            metadata = _pyarrow().parquet.ParquetFile(part.path).metadata
+            ids = [
+                metadata.row_group(i).column(0).statistics
+                for i in range(metadata.num_row_groups)
+            ]
+            meta = (
+                metadata.num_rows,
+                min((s.min for s in ids if s is not None), default=0),
+                max((s.max for s in ids if s is not None), default=0),
+            )
+            self._meta[part.path] = meta
+        return meta
+
+    def _read(
+        self,
+        part: ArchivePart,
+        columns: Sequence[str],
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        filters: Optional[List[Tuple[str, str, Any]]] = None,
+    ):
+        filters = list(filters or [])
+        if not part.within(start, end):
+            if start is not None:
+                filters.append(("complaint_time", ">=", start))
+            if end is not None:
+                filters.append(("complaint_time", "<", end))
+        ARCHIVE_PARTS_READ.inc(result="scanned")
+        return _pyarrow().parquet.read_table(
+            part.path, columns=list(columns), filters=filters or None
+        )
+
+    def count(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> int:
+        total = 0
+        for part in self.parts(start, end):
+            if part.within(start, end):
+                total += self._metadata(part)[0]
+            else:
+                total += self._read(part, ("id",), start, end).num_rows
+        return total
+
+    def rows(
+        self,
+        columns: Sequence[str],
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        skip: int = 0,
+        limit: int = 100,
+    ) -> List[Tuple]:
+        """按归档顺序跳过 skip 行后返回至多 limit 行列元组"""
+        result: List[Tuple] = []
+        for part in self.parts(start, end):
+            if len(result) >= limit:
+                break
+            if part.within(start, end) and skip >= self._metadata(part)[0]:
+                skip -= self._metadata(part)[0]
+                continue
+            table = self._read(part, columns, start, end)
+            if skip >= table.num_rows:
+                skip -= table.num_rows
+                continue
+            table = table.slice(skip, limit - len(result))
+            skip = 0
+            result.extend(zip(*(table.column(name).to_pylist() for name in columns)))
+        return result
+
+    def get(self, complaint_id: int, columns: Sequence[str]) -> Optional[Dict[str, Any]]:
+        """按ID查找归档记录，按文件的ID范围跳过不可能包含该ID的文件"""
+        for part in self.parts():
+            _, low, high = self._metadata(part)
+            if not low <= complaint_id <= high:
+                continue
+            table = self._read(part, columns, filters=[("id", "=", complaint_id)])
+            if table.num_rows:
+                return table.slice(0, 1).to_pylist()[0]
+        return None
+
+    def category_counts(
+        self, start: Optional[datetime] = None, end: Optional[datetime] = None
+    ) -> Counter:
+        counts: Counter = Counter()
+        for part in self.parts(start, end):
+            within = part.within(start, end)
+            cached = self._categories.get(part.path) if within else None
+            if cached is None:
+                table = self._read(part, ("complaint_category",), start, end)
+                cached = Counter(
+                    {
+                        item["values"]: item["counts"]
+                        for item in _pyarrow().compute.value_counts(table.column(0)).to_pylist()
+                    }
+                )
+                if within:
+                    self._categories[part.path] = cached
+            counts.update(cached)
+        return counts
+
+    def open_part(self, month: datetime) -> "PartWriter":
+        """在月份分区中新建归档文件，按行写入，提交后才对查询可见"""
+        pa = _pyarrow()
+        if pa is None:
+            raise RuntimeError("归档需要安装 pyarrow")
+        directory = os.path.join(self.root, f"year={month.year:04d}", f"month={month.month:02d}")
+        os.makedirs(directory, exist_ok=True)
+        # 文件名以写入时间开头，同一分区内按文件名排序即按写入先后排序
+        name = f"part-{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}.parquet"
+        return PartWriter(pa, month, os.path.join(directory, name))
+
+
+class PartWriter:
+    """增量写入一个归档文件：行攒够一个行组后写入临时文件，commit 时原子改名"""
+
+    def __init__(self, pa, month: datetime, path: str):
+        self.pa = pa
+        self.month = month
+        self.path = path
+        self.tmp_path = f"{path}.tmp"
+        self.rows = 0
+        self._schema = _schema(pa)
+        self._buffer: List[Tuple] = []
+        self._writer = self._open(self.tmp_path)
+
+    def _open(self, path: str):
+        return self.pa.parquet.ParquetWriter(path, self._schema, compression=ARCHIVE_COMPRESSION)
+
+    def add(self, row: Tuple):
+        self._buffer.append(row)
+        self.rows += 1
+        if len(self._buffer) >= ROW_GROUP_SIZE:
+            self._flush()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        columns = zip(*self._buffer)
+        self._writer.write_table(
+            self.pa.Table.from_arrays(
+                [self.pa.array(values, type=field.type) for values, field in zip(columns, self._schema)],
+                schema=self._schema,
+            ),
+            row_group_size=ROW_GROUP_SIZE,
+        )
+        self._buffer = []
+
+    def close(self):
+        if self._writer is not None:
+            self._flush()
+            self._writer.close()
+            self._writer = None
+
+    def exclude(self, ids: Sequence[int]):
+        """从已关闭的临时文件中去掉指定ID的行，按行组流式重写"""
+        pc = self.pa.compute
+        value_set = self.pa.array(list(ids), type=self.pa.int64())
+        filtered_path = f"{self.path}.filtered.tmp"
+        writer = self._open(filtered_path)
+        try:
+            for batch in self.pa.parquet.ParquetFile(self.tmp_path).iter_batches(ROW_GROUP_SIZE):
+                kept = batch.filter(pc.invert(pc.is_in(batch.column(0), value_set=value_set)))
+                if kept.num_rows:
+                    writer.write_table(self.pa.Table.from_batches([kept]), row_group_size=ROW_GROUP_SIZE)
+                self.rows -= batch.num_rows - kept.num_rows
+        finally:
+            writer.close()
+        os.replace(filtered_path, self.tmp_path)
+
+    def commit(self) -> ArchivePart:
+        os.replace(self.tmp_path, self.path)
+        return ArchivePart(self.path, self.month)
+
+    def discard(self):
+        self.close()
+        for path in (self.tmp_path, self.path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def archive_complaints(
+    engine: Engine,
+    archive: "ComplaintArchive",
+    max_age_days: int = ARCHIVE_MAX_AGE_DAYS,
+    now: Optional[datetime] = None,
+) -> int:
+    """把早于 max_age_days 天所在月份的记录移入按月分区的归档文件，返回移动的行数
+
+    按投诉时间、ID 顺序流式读取，逐月写入归档文件，每读完一个月份就删除该月份的记录
+    并提交文件；内存中只保留当前月份每行的 ID 和指纹，不随历史数据量增长。
+    读取后被其它连接修改或删除的记录不归档，修改过的留在投诉表中等下次归档。
+    文件改名后、删除提交前进程中断时，下次归档会再次写入这些记录，归档中可能出现重复行。
+    """
+    # 只归档整月，每个月份分区通常只写一次
+    cutoff = _month_start((now or datetime.now()) - timedelta(days=max_age_days))
+    moved = 0
+    part: Optional[PartWriter] = None
+    ids, fingerprints = array("q"), array("q")
+    try:
+        with engine.connect() as conn:
+            statement = (
+                select(*(COMPLAINTS.c[name] for name in ARCHIVE_COLUMNS))
+                .where(COMPLAINTS.c.complaint_time < cutoff)
+                .order_by(COMPLAINTS.c.complaint_time, COMPLAINTS.c.id)
+            )
+            for row in stream_rows(conn, statement, STREAM_BATCH_SIZE):
+                if not isinstance(row.complaint_time, datetime):
+                    continue
+                month = _month_start(row.complaint_time)
+                if part is not None and part.month != month:
+                    moved += _move_part(engine, part, ids, fingerprints)
+                    part, ids, fingerprints = None, array("q"), array("q")
+                if part is None:
+                    part = archive.open_part(month)
+                values = tuple(row)
+                part.add(values)
+                ids.append(row.id)
+                fingerprints.append(hash(values))
+        if part is not None:
+            moved += _move_part(engine, part, ids, fingerprints)
+            part = None
+    finally:
+        if part is not None:
+            part.discard()
+    if moved:
+        archive.refresh()
+        ARCHIVED_ROWS.inc(moved)
+        notify_external_write("archive", target=engine)
+    return moved
+
+
+def _move_part(engine: Engine, part: PartWriter, ids: array, fingerprints: array) -> int:
+    """删除已写入 part 的记录并提交归档文件，返回移动的行数
+
+    DELETE ... RETURNING 在同一条语句中删除并取回每行的当前值，与写入文件时的指纹比较：
+    读取后被修改的行在同一事务中按当前值插回，与已被删除的行一起从文件中去掉，
+    不会出现删除了未归档的新版本的情况。文件改名后才提交删除，提交失败时删除文件。
+    """
+    part.close()
+    columns = [COMPLAINTS.c[name] for name in ARCHIVE_COLUMNS]
+    skipped: List[int] = []
+    with engine.connect() as conn:
+        trans = conn.begin()
+        try:
+            for i in range(0, len(ids), _DELETE_CHUNK):
+                expected = dict(zip(ids[i : i + _DELETE_CHUNK], fingerprints[i : i + _DELETE_CHUNK]))
+                deleted = conn.execute(
+                    delete(COMPLAINTS).where(COMPLAINTS.c.id.in_(list(expected))).returning(*columns)
+                ).all()
+                changed = [row for row in deleted if hash(tuple(row)) != expected[row.id]]
+                if changed:
+                    conn.execute(insert(COMPLAINTS), [row._asdict() for row in changed])
+                kept = {row.id for row in deleted} - {row.id for row in changed}
+                skipped.extend(set(expected) - kept)
+            if skipped:
+                logger.info("%d 条投诉在读取后被修改或删除，本次不归档", len(skipped))
+                part.exclude(skipped)
+            if not part.rows:
+                part.discard()
+                trans.commit()
+                return 0
+            part.commit()
+        except BaseException:
+            trans.rollback()
+            part.discard()
+            raise
+        try:
+            trans.commit()
+        except BaseException:
+            part.discard()
+            raise
+    logger.info("归档 %d 条投诉到 %s", part.rows, part.path)
+    return part.rows
+
+
+def vacuum(engine: Engine):
+    """SQLite 删除记录后空闲页留在文件中供后续写入复用，VACUUM 把文件收缩到实际大小"""
+    if engine.dialect.name != "sqlite":
+        return
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.exec_driver_sql("VACUUM")
+
+
+def start_archiver(engine: Engine, archive: "ComplaintArchive", interval: float) -> threading.Thread:
+    """在后台线程中定期归档，多进程部署时只由一个进程执行"""
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                archive_complaints(engine, archive)
+            except Exception:
+                logger.exception("定期归档失败")
+
+    thread = threading.Thread(target=run, name="complaint-archiver", daemon=True)
+    thread.start()
+    return thread
+
+
+# 服务进程使用的归档目录
+ARCHIVE = ComplaintArchive(ARCHIVE_PATH)
+
+
+def main(argv: Optional[List[str]] = None):
+    from utils.logging import configure_logging
+
+    parser = argparse.ArgumentParser(description="把旧投诉移入按月分区的 Parquet 归档")
+    parser.add_argument("--db-url", default=SQLALCHEMY_DATABASE_URL, help="数据库URL")
+    parser.add_argument("--path", default=ARCHIVE_PATH, help="归档目录")
+    parser.add_argument(
+        "--older-than-days", type=int, default=ARCHIVE_MAX_AGE_DAYS, help="归档早于该天数的投诉"
+    )
+    parser.add_argument("--vacuum", action="store_true", help="归档后收缩 SQLite 数据库文件")
+    args = parser.parse_args(argv)
+
+    configure_logging()
+    target = create_app_engine(args.db_url)
+    try:
+        init_schema(target)
+        started = time.perf_counter()
+        moved = archive_complaints(target, ComplaintArchive(args.path), args.older_than_days)
+        if args.vacuum:
+            vacuum(target)
+        logger.info("归档完成：%d 条，用时 %.2f 秒", moved, time.perf_counter() - started)
+    finally:
+        target.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,456 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import urljoin, urlsplit
+
+import httpx
+
+from utils.config import CRAWLER_CONFIG
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+CRAWL_REQUESTS = REGISTRY.counter(
+    "crawler_requests_total", "爬虫请求数，按结果区分（200、not_modified、error 等）", ("status",)
+)
+CRAWL_ITEMS = REGISTRY.counter(
+    "crawler_items_total", "爬取到的投诉数：imported 写入数据库，duplicate 已导入过", ("result",)
+)
+CRAWL_IMPORT_LAG = REGISTRY.histogram(
+    "crawler_import_lag_seconds", "投诉从页面抓取到写入数据库的延迟"
+)
+
+# (页面中的投诉记录, 页面中需要继续抓取的链接)
+ParseResult = Tuple[List[Dict[str, Any]], List[str]]
+Parser = Callable[[str, httpx.Response], ParseResult]
+Sink = Callable[[List[Dict[str, Any]]], int]
+
+_ITEM_KEYS = ("items", "complaints", "data")
+_LINK_KEYS = ("next", "links")
+
+
+def parse_json_page(url: str, response: httpx.Response) -> ParseResult:
+    """默认解析器：页面为投诉记录数组，或 {"items": [...], "next": "下一页"} 形式的对象
+
+    链接可以是相对地址，按页面地址解析为绝对地址。
+    """
+    body = response.json()
+    if isinstance(body, list):
+        return body, []
+    items = next((body[key] for key in _ITEM_KEYS if isinstance(body.get(key), list)), [])
+    links: List[str] = []
+    for key in _LINK_KEYS:
+        value = body.get(key)
+        if isinstance(value, str):
+            links.append(value)
+        elif isinstance(value, list):
+            links.extend(v for v in value if isinstance(v, str))
+    return items, [urljoin(url, link) for link in links]
+
+
+def item_digest(item: Dict[str, Any]) -> str:
+    """投诉记录的摘要，用于跨页面、跨次爬取去重"""
+    key = "\x1f".join(
+        str(item.get(name, "")) for name in ("complaint_time", "user_id", "content")
+    )
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+class Checkpoint:
+    """爬取状态：各页面的条件请求校验值和页面中的链接、本轮已完成和待抓取的页面、已导入记录的摘要
+
+    页面返回 304 时按保存的链接继续抓取，未变化的目录页之后的新页面不会被漏掉。
+    先写临时文件再原子替换，进程中断后从上次保存的待抓取页面继续。
+    一轮爬取完成后清空页面进度，只保留校验值和记录摘要。
+    """
+
+    def __init__(self, path: Optional[str], max_digests: int = CRAWLER_CONFIG["max_item_digests"]):
+        self.path = path
+        self.max_digests = max_digests
+        self.validators: Dict[str, Dict[str, str]] = {}
+        self.links: Dict[str, List[str]] = {}
+        self.done: Set[str] = set()
+        self.pending: List[str] = []
+        self.digests: "OrderedDict[str, None]" = OrderedDict()
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            self.validators = state.get("validators", {})
+            self.links = state.get("links", {})
+            self.done = set(state.get("done", []))
+            self.pending = state.get("pending", [])
+            self.digests = OrderedDict.fromkeys(state.get("digests", []))
+
+    def seen(self, digest: str) -> bool:
+        return digest in self.digests
+
+    def add_digests(self, digests: Iterable[str]):
+        for digest in digests:
+            self.digests[digest] = None
+        while len(self.digests) > self.max_digests:
+            self.digests.popitem(last=False)
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        state = {
+            "validators": self.validators,
+            "links": self.links,
+            "done": sorted(self.done),
+            "pending": self.pending,
+            "digests": list(self.digests),
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+class HostLimiter:
+    """每个站点的并发上限和请求间隔（礼貌延迟）"""
+
+    def __init__(self, per_host: int, delay: float):
+        self.per_host = per_host
+        self.delay = delay
+        self._slots: Dict[str, asyncio.Semaphore] = {}
+        self._next_start: Dict[str, float] = {}
+
+    async def acquire(self, host: str):
+        slot = self._slots.setdefault(host, asyncio.Semaphore(self.per_host))
+        await slot.acquire()
+        # 预约下一个可用时间点，同一站点的请求按 delay 间隔依次发出
+        now = time.monotonic()
+        start = max(now, self._next_start.get(host, now))
+        self._next_start[host] = start + self.delay
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    def release(self, host: str):
+        self._slots[host].release()
+
+
+@dataclass
+class CrawlStats:
+    pages: int = 0
+    not_modified: int = 0
+    errors: int = 0
+    imported: int = 0
+    duplicates: int = 0
+    seconds: float = 0.0
+    resumed: bool = False
+
+
+@dataclass
+class _Completed:
+    """已处理但记录尚未写入数据库的页面，写入后才在检查点中标记完成"""
+
+    url: str
+    validators: Optional[Dict[str, str]] = None
+    links: Optional[List[str]] = None
+    digests: List[str] = field(default_factory=list)
+
+
+class Crawler:
+    """基于 httpx.AsyncClient 的并发爬虫，抓取结果分批直接写入数据库
+
+    - 共享连接池，按站点限制并发并保持请求间隔
+    - 带 If-None-Match / If-Modified-Since 的条件请求，未变化的页面返回 304 后不再解析，
+      按检查点中保存的链接继续抓取
+    - 记录攒够 batch_size 条或每隔 flush_interval 秒写入一次，不经过中间文件
+    - 页面的记录写入数据库后才在检查点中标记完成，中断后从未完成的页面继续
+    - 只跟随种子地址所在站点的链接
+    """
+
+    def __init__(
+        self,
+        seeds: List[str],
+        sink: Sink,
+        parser: Parser = parse_json_page,
+        checkpoint: Optional[Checkpoint] = None,
+        max_connections: int = CRAWLER_CONFIG["max_connections"],
+        per_host: int = CRAWLER_CONFIG["per_host"],
+        delay: float = CRAWLER_CONFIG["delay"],
+        timeout: float = CRAWLER_CONFIG["timeout"],
+        max_retries: int = CRAWLER_CONFIG["max_retries"],
+        batch_size: int = CRAWLER_CONFIG["batch_size"],
+        flush_interval: float = CRAWLER_CONFIG["flush_interval"],
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ):
+        self.seeds = seeds
+        self.sink = sink
+        self.parser = parser
+        self.checkpoint = checkpoint or Checkpoint(None)
+        self.max_connections = max_connections
+        self.hosts = HostLimiter(per_host, delay)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.transport = transport
+        self.allowed_hosts = {urlsplit(url).netloc for url in seeds}
+        self.stats = CrawlStats()
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+        self._enqueued: Set[str] = set()
+        self._buffer: List[Dict[str, Any]] = []
+        self._buffer_digests: Set[str] = set()
+        self._completed: List[_Completed] = []
+        self._oldest_fetch: Optional[float] = None
+        self._flush_lock = asyncio.Lock()
+
+    def _enqueue(self, url: str):
+        url = url.split("#", 1)[0]
+        if url in self._enqueued or urlsplit(url).netloc not in self.allowed_hosts:
+            return
+        self._enqueued.add(url)
+        self._queue.put_nowait(url)
+
+    async def _get(self, client: httpx.AsyncClient, url: str) -> Optional[httpx.Response]:
+        """发送条件请求，对网络错误、429 和 5xx 退避重试"""
+        headers = {}
+        validators = self.checkpoint.validators.get(url, {})
+        if "etag" in validators:
+            headers["If-None-Match"] = validators["etag"]
+        if "last_modified" in validators:
+            headers["If-Modified-Since"] = validators["last_modified"]
+
+        host = urlsplit(url).netloc
+        for attempt in range(self.max_retries + 1):
+            retry_after = None
+            await self.hosts.acquire(host)
+            try:
+                response = await client.get(url, headers=headers)
+            except httpx.TransportError as e:
+                logger.warning("抓取 %s 失败（第%d次）: %s", url, attempt + 1, e)
+                CRAWL_REQUESTS.inc(status="transport_error")
+            else:
+                if response.status_code != 429 and response.status_code < 500:
+                    return response
+                CRAWL_REQUESTS.inc(status=str(response.status_code))
+                retry_after = response.headers.get("Retry-After")
+            finally:
+                self.hosts.release(host)
+            if attempt < self.max_retries:
+                try:
+                    wait = float(retry_after)
+                except (TypeError, ValueError):
+                    wait = random.uniform(0, min(10.0, 0.5 * 2**attempt))
+                await asyncio.sleep(wait)
+        return None
+
+    async def _process(self, client: httpx.AsyncClient, url: str):
+        response = await self._get(client, url)
+        if response is None:
+            self.stats.errors += 1
+            self._completed.append(_Completed(url))
+            return
+        self.stats.pages += 1
+        if response.status_code == 304:
+            CRAWL_REQUESTS.inc(status="not_modified")
+            self.stats.not_modified += 1
+            self._completed.append(_Completed(url))
+            for link in self.checkpoint.links.get(url, []):
+                self._enqueue(link)
+            return
+        CRAWL_REQUESTS.inc(status=str(response.status_code))
+        if response.status_code != 200:
+            logger.warning("抓取 %s 返回 %d，跳过", url, response.status_code)
+            self.stats.errors += 1
+            self._completed.append(_Completed(url))
+            return
+
+        try:
+            items, links = self.parser(url, response)
+        except ValueError as e:
+            logger.warning("解析 %s 失败: %s", url, e)
+            self.stats.errors += 1
+            self._completed.append(_Completed(url))
+            return
+        validators = {}
+        if response.headers.get("ETag"):
+            validators["etag"] = response.headers["ETag"]
+        if response.headers.get("Last-Modified"):
+            validators["last_modified"] = response.headers["Last-Modified"]
+
+        digests = []
+        for item in items:
+            digest = item_digest(item)
+            if self.checkpoint.seen(digest) or digest in self._buffer_digests:
+                self.stats.duplicates += 1
+                CRAWL_ITEMS.inc(result="duplicate")
+                continue
+            self._buffer.append(item)
+            self._buffer_digests.add(digest)
+            digests.append(digest)
+        if digests and self._oldest_fetch is None:
+            self._oldest_fetch = time.monotonic()
+        # 只有带校验值的页面会返回 304，只为这些页面保存链接
+        self._completed.append(_Completed(url, validators, links if validators else None, digests))
+        for link in links:
+            self._enqueue(link)
+        if len(self._buffer) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        """写入缓冲的记录，再把这些记录所属的页面在检查点中标记为完成
+
+        写入失败时记录和页面放回缓冲，之后的写入重试；异常继续抛出，页面不会被标记为完成。
+        """
+        async with self._flush_lock:
+            items, self._buffer = self._buffer, []
+            completed, self._completed = self._completed, []
+            oldest, self._oldest_fetch = self._oldest_fetch, None
+            self._buffer_digests.difference_update(d for c in completed for d in c.digests)
+            if items:
+                # 数据库写入是同步调用，放到线程中执行，不阻塞其它页面的抓取
+                try:
+                    imported = await asyncio.to_thread(self.sink, items)
+                except Exception:
+                    self._buffer[:0] = items
+                    self._completed[:0] = completed
+                    self._buffer_digests.update(d for c in completed for d in c.digests)
+                    if oldest is not None:
+                        self._oldest_fetch = oldest
+                    self.checkpoint.pending = sorted(self._enqueued - self.checkpoint.done)
+                    self.checkpoint.save()
+                    raise
+                self.stats.imported += imported
+                CRAWL_ITEMS.inc(len(items), result="imported")
+                if oldest is not None:
+                    CRAWL_IMPORT_LAG.observe(time.monotonic() - oldest)
+            for page in completed:
+                self.checkpoint.done.add(page.url)
+                if page.validators:
+                    self.checkpoint.validators[page.url] = page.validators
+                if page.links is not None:
+                    self.checkpoint.links[page.url] = page.links
+                self.checkpoint.add_digests(page.digests)
+            self.checkpoint.pending = sorted(self._enqueued - self.checkpoint.done)
+            self.checkpoint.save()
+
+    async def _worker(self, client: httpx.AsyncClient):
+        while True:
+            url = await self._queue.get()
+            try:
+                await self._process(client, url)
+            except Exception:
+                logger.exception("处理页面 %s 时出错", url)
+                self.stats.errors += 1
+            finally:
+                self._queue.task_done()
+
+    async def _periodic_flush(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("写入抓取的记录失败，稍后重试")
+                self.stats.errors += 1
+
+    async def run(self) -> CrawlStats:
+        started = time.perf_counter()
+        if self.checkpoint.pending:
+            # 上次爬取中断，从未完成的页面继续
+            self.stats.resumed = True
+            self._enqueued.update(self.checkpoint.done)
+            start_urls = self.checkpoint.pending
+            logger.info("从检查点继续，剩余 %d 个页面", len(start_urls))
+        else:
+            self.checkpoint.done.clear()
+            start_urls = self.seeds
+        for url in start_urls:
+            self._enqueue(url)
+
+        limits = httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_connections,
+        )
+        async with httpx.AsyncClient(
+            limits=limits,
+            timeout=self.timeout,
+            headers={"User-Agent": CRAWLER_CONFIG["user_agent"]},
+            follow_redirects=True,
+            transport=self.transport,
+        ) as client:
+            tasks = [
+                asyncio.create_task(self._worker(client)) for _ in range(self.max_connections)
+            ]
+            tasks.append(asyncio.create_task(self._periodic_flush()))
+            try:
+                await self._queue.join()
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+        # 最后一次写入失败时直接抛出，检查点保留未完成的页面，下次从中断处继续
+        await self.flush()
+
+        # 本轮完成，清空页面进度，下次从种子地址开始并使用条件请求
+        self.checkpoint.done.clear()
+        self.checkpoint.pending = []
+        self.checkpoint.save()
+        self.stats.seconds = time.perf_counter() - started
+        return self.stats
+
+
+def crawl(seeds: List[str], db_url: Optional[str] = None, **options) -> CrawlStats:
+    """抓取种子地址并导入数据库，db_url 未指定时写入应用数据库"""
+    from services.fetch import import_records
+    from utils.db import create_app_engine, init_schema
+
+    checkpoint = Checkpoint(options.pop("checkpoint", CRAWLER_CONFIG["checkpoint"]))
+    target = create_app_engine(db_url) if db_url else None
+    try:
+        if target is not None:
+            init_schema(target)
+        crawler = Crawler(seeds, partial(import_records, target=target), checkpoint=checkpoint, **options)
+        return asyncio.run(crawler.run())
+    finally:
+        if target is not None:
+            target.dispose()
+
+
+def main(argv: Optional[List[str]] = None):
+    from utils.logging import configure_logging
+
+    parser = argparse.ArgumentParser(description="抓取投诉页面并直接导入数据库")
+    parser.add_argument("seeds", nargs="+", help="种子地址")
+    parser.add_argument("--db-url", help="目标数据库，默认使用应用配置")
+    parser.add_argument("--checkpoint", default=CRAWLER_CONFIG["checkpoint"], help="检查点文件")
+    parser.add_argument("--per-host", type=int, default=CRAWLER_CONFIG["per_host"])
+    parser.add_argument("--delay", type=float, default=CRAWLER_CONFIG["delay"])
+    parser.add_argument("--max-connections", type=int, default=CRAWLER_CONFIG["max_connections"])
+    args = parser.parse_args(argv)
+
+    configure_logging()
+    stats = crawl(
+        args.seeds,
+        args.db_url,
+        checkpoint=args.checkpoint,
+        per_host=args.per_host,
+        delay=args.delay,
+        max_connections=args.max_connections,
+    )
+    logger.info(
+        "爬取完成：%d 个页面（%d 个未变化），导入 %d 条，重复 %d 条，错误 %d 个，用时 %.2f 秒",
+        stats.pages,
+        stats.not_modified,
+        stats.imported,
+        stats.duplicates,
+        stats.errors,
+        stats.seconds,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,324 @@
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, Deque, Dict, Iterator, Optional, Tuple
+
+from utils.config import LLM_DISPATCH_CONFIG
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+QUEUE_DEPTH = REGISTRY.gauge(
+    "llm_queue_depth", "等待发往模型端点的LLM调用数", ("priority",)
+)
+QUEUE_WAIT = REGISTRY.histogram(
+    "llm_queue_wait_seconds", "LLM调用在调度队列中的等待时间", ("priority",)
+)
+DISPATCHED = REGISTRY.counter(
+    "llm_dispatch_total",
+    "LLM调度结果：granted 放行，shed 超过截止时间被丢弃",
+    ("priority", "outcome"),
+)
+
+
+class Priority(IntEnum):
+    """LLM调用的优先级，数值越小越优先"""
+
+    INTERACTIVE = 0  # 用户请求：/analyze/、自然语言查询
+    BATCH = 1  # 批量回填、重新分类
+    BACKGROUND = 2  # 后台任务
+
+    @classmethod
+    def parse(cls, value: str) -> "Priority":
+        return cls[value.strip().upper()]
+
+
+class LoadShedError(RuntimeError):
+    """排队等待超过截止时间，调用被放弃，调用方回退到正则分类或模板回复"""
+
+
+_current: ContextVar[Tuple[Priority, Optional[str]]] = ContextVar(
+    "llm_priority", default=(Priority.INTERACTIVE, None)
+)
+
+
+@contextmanager
+def llm_priority(priority: Priority, flow: Optional[str] = None) -> Iterator[None]:
+    """设置当前上下文中LLM调用的优先级
+
+    flow 标识同一优先级内的调用来源（如某个回填任务），同级的多个来源轮流放行。
+    未设置时为 interactive，来源为处理链名称。
+    """
+    token = _current.set((priority, flow))
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def estimate_tokens(value: Any) -> int:
+    """粗略估算文本的 token 数：按 UTF-8 字节数 / 3，中文约一字一 token，英文偏保守"""
+    if isinstance(value, dict):
+        value = " ".join(str(v) for v in value.values())
+    return math.ceil(len(str(value).encode("utf-8")) / 3)
+
+
+class TokenBucket:
+    """令牌桶：按 rate（每秒）补充，最多积攒 capacity；rate 为 0 表示不限制"""
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = capacity if capacity is not None else per_minute
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rate <= 0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """还需等待多久才累计到 amount 个令牌"""
+        if self.unlimited:
+            return 0.0
+        self._refill(now)
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+    def fit(self, amount: float) -> float:
+        """单次调用超过桶容量时按满桶计算，避免永远等不到"""
+        return amount if self.unlimited else min(amount, self.capacity)
+
+    def take(self, amount: float):
+        if not self.unlimited:
+            self.tokens -= self.fit(amount)
+
+
+@dataclass
+class _Ticket:
+    priority: Priority
+    flow: str
+    tokens: int
+    deadline: float
+    enqueued_at: float = field(default_factory=time.monotonic)
+    granted: bool = False
+    event: threading.Event = field(default_factory=threading.Event)
+
+
+class LLMDispatcher:
+    """按优先级调度发往同一模型端点的调用，同时受每分钟请求数和 token 数限制
+
+    - 不同优先级严格按 interactive > batch > background 放行
+    - 同一优先级内按来源（flow）轮流放行，一个大批量任务不会饿死其它任务
+    - 预计排队时间或实际等待超过该优先级的截止时间时抛出 LoadShedError，
+      调用方回退到正则分类和模板回复，用户请求的延迟不受后台回填影响
+
+    没有独立的调度线程：等待中的调用被唤醒或超时后由自身推进队列。
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = LLM_DISPATCH_CONFIG["requests_per_minute"],
+        tokens_per_minute: float = LLM_DISPATCH_CONFIG["tokens_per_minute"],
+        deadlines: Optional[Dict[Priority, float]] = None,
+    ):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.deadlines = deadlines or {
+            p: LLM_DISPATCH_CONFIG["deadlines"][p.name.lower()] for p in Priority
+        }
+        # 每个优先级一个有序字典：flow -> 该来源的排队调用，字典顺序即轮转顺序
+        self._queues: Dict[Priority, "OrderedDict[str, Deque[_Ticket]]"] = {
+            p: OrderedDict() for p in Priority
+        }
+        self._depth: Dict[Priority, int] = {p: 0 for p in Priority}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "LLMDispatcher":
+        """从环境变量读取限额和截止时间，未设置的项使用配置默认值"""
+        deadlines = {
+            p: float(
+                os.getenv(
+                    f"LLM_DEADLINE_{p.name}",
+                    LLM_DISPATCH_CONFIG["deadlines"][p.name.lower()],
+                )
+            )
+            for p in Priority
+        }
+        return cls(
+            requests_per_minute=float(
+                os.getenv("LLM_RPM", LLM_DISPATCH_CONFIG["requests_per_minute"])
+            ),
+            tokens_per_minute=float(
+                os.getenv("LLM_TPM", LLM_DISPATCH_CONFIG["tokens_per_minute"])
+            ),
+            deadlines=deadlines,
+        )
+
+    def depth(self, priority: Optional[Priority] = None) -> int:
+        with self._lock:
+            if priority is None:
+                return sum(self._depth.values())
+            return self._depth[priority]
+
+    def acquire(self, tokens: int, flow: str):
+        """按当前上下文的优先级排队，放行后返回，超过截止时间抛出 LoadShedError"""
+        priority, context_flow = _current.get()
+        now = time.monotonic()
+        ticket = _Ticket(
+            priority=priority,
+            flow=context_flow or flow,
+            tokens=tokens,
+            deadline=now + self.deadlines[priority],
+        )
+        label = priority.name.lower()
+        with self._lock:
+            if self._expected_wait(ticket, now) > self.deadlines[priority]:
+                DISPATCHED.inc(priority=label, outcome="shed")
+                raise LoadShedError(f"LLM调度队列预计等待超过 {self.deadlines[priority]} 秒")
+            self._enqueue(ticket)
+            wait = self._dispatch(now)
+
+        while not ticket.event.is_set():
+            remaining = ticket.deadline - time.monotonic()
+            if remaining <= 0:
+                with self._lock:
+                    if not ticket.granted:
+                        self._remove(ticket)
+                        DISPATCHED.inc(priority=label, outcome="shed")
+                        raise LoadShedError(
+                            f"LLM调用排队超过 {self.deadlines[priority]} 秒截止时间"
+                        )
+                break
+            ticket.event.wait(min(remaining, wait) if wait else remaining)
+            with self._lock:
+                wait = self._dispatch(time.monotonic())
+
+        QUEUE_WAIT.observe(time.monotonic() - ticket.enqueued_at, priority=label)
+        DISPATCHED.inc(priority=label, outcome="granted")
+
+    def try_acquire(self, tokens: int) -> bool:
+        """不排队：没有排队的调用且配额立即可用时扣减配额并返回 True，否则返回 False"""
+        priority, _ = _current.get()
+        now = time.monotonic()
+        with self._lock:
+            if self._head() is not None or max(
+                self.requests.wait_time(1, now),
+                self.tokens.wait_time(self.tokens.fit(tokens), now),
+            ) > 0:
+                return False
+            self.requests.take(1)
+            self.tokens.take(tokens)
+        DISPATCHED.inc(priority=priority.name.lower(), outcome="granted")
+        return True
+
+    def _expected_wait(self, ticket: _Ticket, now: float) -> float:
+        """估算排在同级及更高优先级调用之后需要等待的时间"""
+        ahead = [
+            t
+            for p in Priority
+            if p <= ticket.priority
+            for queue in self._queues[p].values()
+            for t in queue
+        ]
+        return max(
+            self.requests.wait_time(len(ahead) + 1, now),
+            self.tokens.wait_time(sum(t.tokens for t in ahead) + ticket.tokens, now),
+        )
+
+    def _enqueue(self, ticket: _Ticket):
+        self._queues[ticket.priority].setdefault(ticket.flow, deque()).append(ticket)
+        self._depth[ticket.priority] += 1
+        QUEUE_DEPTH.set(self._depth[ticket.priority], priority=ticket.priority.name.lower())
+
+    def _remove(self, ticket: _Ticket):
+        flows = self._queues[ticket.priority]
+        queue = flows.get(ticket.flow)
+        if queue is None or ticket not in queue:
+            return
+        queue.remove(ticket)
+        if not queue:
+            del flows[ticket.flow]
+        self._depth[ticket.priority] -= 1
+        QUEUE_DEPTH.set(self._depth[ticket.priority], priority=ticket.priority.name.lower())
+
+    def _dispatch(self, now: float) -> float:
+        """在锁内按顺序放行队首调用，直到限额不足；返回队首还需等待的秒数"""
+        while True:
+            head = self._head()
+            if head is None:
+                return 0.0
+            wait = max(
+                self.requests.wait_time(1, now),
+                self.tokens.wait_time(self.tokens.fit(head.tokens), now),
+            )
+            if wait > 0:
+                return wait
+            self.requests.take(1)
+            self.tokens.take(head.tokens)
+            self._remove(head)
+            # 该来源移到轮转队尾
+            flows = self._queues[head.priority]
+            if head.flow in flows:
+                flows.move_to_end(head.flow)
+            head.granted = True
+            head.event.set()
+
+    def _head(self) -> Optional[_Ticket]:
+        for priority in Priority:
+            flows = self._queues[priority]
+            if flows:
+                return next(iter(flows.values()))[0]
+        return None
+
+
+class DispatchedChain:
+    """发出调用前经过调度器排队和限流，对外保持 invoke 接口
+
+    与 ResilientChain 组合时把 admit 传给 ResilientChain，每次重试和对冲请求都申请配额。
+    """
+
+    def __init__(
+        self, chain: Any, name: str, dispatcher: LLMDispatcher, prompt_tokens: int = 0
+    ):
+        self.chain = chain
+        self.name = name
+        self.dispatcher = dispatcher
+        # 提示词模板和预留的生成长度也计入 token 估算
+        self.overhead = prompt_tokens + LLM_DISPATCH_CONFIG["completion_tokens"]
+
+    def admit(self, input: Any, wait: bool = True) -> bool:
+        """为一次请求申请配额；wait 为 False 时不排队，配额不能立即满足时返回 False"""
+        tokens = estimate_tokens(input) + self.overhead
+        if not wait:
+            return self.dispatcher.try_acquire(tokens)
+        self.dispatcher.acquire(tokens, flow=self.name)
+        return True
+
+    def invoke(self, input: Any, config: Optional[Dict[str, Any]] = None) -> Any:
+        self.admit(input)
+        return self.chain.invoke(input, config=config)
+
+
+# 与熔断器一样按模型端点共享，限额是整个端点的配额
+_dispatchers: Dict[str, LLMDispatcher] = {}
+_dispatchers_lock = threading.Lock()
+
+
+def get_dispatcher(name: str) -> LLMDispatcher:
+    """获取（必要时创建）指定模型端点的共享调度器"""
+    with _dispatchers_lock:
+        dispatcher = _dispatchers.get(name)
+        if dispatcher is None:
+            dispatcher = _dispatchers[name] = LLMDispatcher.from_env()
+        return dispatcher
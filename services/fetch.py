@@ -1,13 +1,32 @@
 import json
 import logging
 import os
-import sqlite3
 from datetime import datetime
 
+from sqlalchemy import delete, insert, select, update
+
+from utils.db import (
+    Complaint,
+    bulk_write,
+    create_app_engine,
+    engine,
+    init_schema,
+    notify_external_write,
+    stream_rows,
+)
 from utils.logging import configure_logging
 
-# 配置日志
-configure_logging()
+logger = logging.getLogger(__name__)
+
+COMPLAINTS = Complaint.__table__
+IMPORT_COLUMNS = ("complaint_time", "content", "user_id", "complaint_category")
+
+
+def _parse_time(value):
+    """接受 datetime 或 "%Y-%m-%d %H:%M:%S" 字符串"""
+    if isinstance(value, str):
+        return datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+    return value
 
 
 def clean_data(data):
@@ -40,72 +59,82 @@ def clean_data(data):
                 }
             )
         except Exception as e:
-            logging.error(f"清洗数据项时发生错误: {str(e)}")
+            logger.error("清洗数据项时发生错误: %s", e)
             continue
 
     return cleaned_data
 
 
-def import_data_to_db():
+def _target_engine(db_path=None, db_url=None):
+    """返回 (引擎, 是否需要调用方释放)；未指定时使用应用配置的数据库"""
+    if db_url:
+        return create_app_engine(db_url), True
+    if db_path:
+        return create_app_engine(f"sqlite:///{db_path}"), True
+    return engine, False
+
+
+def import_records(records, target=None):
+    """清洗一批投诉记录并批量写入数据库，返回写入条数；文件导入和爬虫共用
+
+    target 为 None 时写入应用数据库，提交后使缓存失效并通知写入的观察者；
+    写入其它数据库时只递增该库的数据版本。
+    """
+    cleaned_data = clean_data(records)
+    logger.info("清洗后的数据条数: %s", len(cleaned_data))
+    if not cleaned_data:
+        return 0
+    with (target or engine).begin() as conn:
+        bulk_write(
+            conn,
+            [
+                (
+                    item["complaint_time"],
+                    item["content"],
+                    item["user_id"],
+                    item["complaint_category"],
+                )
+                for item in cleaned_data
+            ],
+            columns=IMPORT_COLUMNS,
+        )
+    notify_external_write("import", inserts_only=True, target=target)
+    return len(cleaned_data)
+
+
+def import_data_to_db(json_file="./data/complaints.json", db_path=None, db_url=None):
     """
-    从JSON文件读取投诉数据，进行清洗后导入到数据库
+    从JSON文件（或每行一条记录的JSONL文件）读取投诉数据，进行清洗后导入到数据库
+
+    db_path 指定 SQLite 文件，db_url 指定任意数据库，都未指定时使用 DATABASE_URL。
+    PostgreSQL 上使用 COPY 批量写入。
     """
+    target = None
+    owns_engine = False
     try:
         # 读取JSON文件
-        json_file = "./data/complaints.json"
         if not os.path.exists(json_file):
-            logging.error(f"JSON文件不存在: {json_file}")
+            logger.error("JSON文件不存在: %s", json_file)
             return False
 
         with open(json_file, "r", encoding="utf-8") as f:
-            data = json.load(f)
-
-        # 数据清洗
-        cleaned_data = clean_data(data)
-        logging.info(f"清洗后的数据条数: {len(cleaned_data)}")
-
-        # 连接到数据库
-        conn = sqlite3.connect("data/complaints.db")
-        cursor = conn.cursor()
-
-        # 创建表（如果不存在）
-        cursor.execute(
-            """
-            CREATE TABLE IF NOT EXISTS complaints (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                complaint_time DATETIME,
-                content TEXT,
-                user_id TEXT,
-                complaint_category TEXT
-            )
-        """
-        )
-
-        # 插入数据
-        for item in cleaned_data:
-            cursor.execute(
-                """
-                INSERT INTO complaints (complaint_time, content, user_id, complaint_category)
-                VALUES (?, ?, ?, ?)
-            """,
-                (
-                    item["complaint_time"],
-                    item["content"],
-                    item["user_id"],
-                    item["complaint_category"],
-                ),
-            )
+            if json_file.endswith(".jsonl"):
+                data = [json.loads(line) for line in f if line.strip()]
+            else:
+                data = json.load(f)
 
-        conn.commit()
-        logging.info(f"成功导入 {len(cleaned_data)} 条数据到数据库")
+        target, owns_engine = _target_engine(db_path, db_url)
+        init_schema(target)
+        imported = import_records(data, target if owns_engine else None)
+        logger.info("成功导入 %s 条数据到数据库", imported)
         return True
 
     except Exception as e:
-        logging.error(f"导入数据到数据库时发生错误: {str(e)}")
+        logger.error("导入数据到数据库时发生错误: %s", e)
         return False
     finally:
-        if "conn" in locals():
-            conn.close()
+        if owns_engine:
+            target.dispose()
 
 
 def create_complaint(complaint_time, content, user_id, complaint_category):
@@ -113,41 +142,34 @@ def create_complaint(complaint_time, content, user_id, complaint_category):
     创建新的投诉记录
     """
     try:
-        conn = sqlite3.connect("data/complaints.db")
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            INSERT INTO complaints (complaint_time, content, user_id, complaint_category)
-            VALUES (?, ?, ?, ?)
-        """,
-            (complaint_time, content, user_id, complaint_category),
-        )
-        conn.commit()
-        logging.info(f"成功创建投诉记录，用户: {user_id}")
+        row = {
+            "complaint_time": _parse_time(complaint_time),
+            "content": content,
+            "user_id": user_id,
+            "complaint_category": complaint_category,
+        }
+        with engine.begin() as conn:
+            conn.execute(insert(COMPLAINTS).values(**row))
+        notify_external_write(inserts_only=True)
+        logger.info("成功创建投诉记录，用户: %s", user_id)
         return True
     except Exception as e:
-        logging.error(f"创建投诉记录时发生错误: {str(e)}")
+        logger.error("创建投诉记录时发生错误: %s", e)
         return False
-    finally:
-        conn.close()
 
 
 def read_complaints():
     """
-    读取所有投诉记录
+    读取所有投诉记录，分批从数据库拉取
     """
     try:
-        conn = sqlite3.connect("data/complaints.db")
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM complaints")
-        complaints = cursor.fetchall()
-        logging.info(f"成功读取 {len(complaints)} 条投诉记录")
+        with engine.connect() as conn:
+            complaints = [tuple(row) for row in stream_rows(conn, select(COMPLAINTS))]
+        logger.info("成功读取 %s 条投诉记录", len(complaints))
         return complaints
     except Exception as e:
-        logging.error(f"读取投诉记录时发生错误: {str(e)}")
+        logger.error("读取投诉记录时发生错误: %s", e)
         return []
-    finally:
-        conn.close()
 
 
 def update_complaint(
@@ -161,36 +183,28 @@ def update_complaint(
     更新投诉记录
     """
     try:
-        conn = sqlite3.connect("data/complaints.db")
-        cursor = conn.cursor()
-        update_fields = []
-        values = []
+        values = {}
         if complaint_time:
-            update_fields.append("complaint_time = ?")
-            values.append(complaint_time)
+            values["complaint_time"] = _parse_time(complaint_time)
         if content:
-            update_fields.append("content = ?")
-            values.append(content)
+            values["content"] = content
         if user_id:
-            update_fields.append("user_id = ?")
-            values.append(user_id)
+            values["user_id"] = user_id
         if complaint_category:
-            update_fields.append("complaint_category = ?")
-            values.append(complaint_category)
-
-        if update_fields:
-            values.append(complaint_id)
-            query = f"UPDATE complaints SET {', '.join(update_fields)} WHERE id = ?"
-            cursor.execute(query, values)
-            conn.commit()
-            logging.info(f"成功更新投诉记录，ID: {complaint_id}")
+            values["complaint_category"] = complaint_category
+
+        if values:
+            with engine.begin() as conn:
+                conn.execute(
+                    update(COMPLAINTS).where(COMPLAINTS.c.id == complaint_id).values(values)
+                )
+            notify_external_write()
+            logger.info("成功更新投诉记录，ID: %s", complaint_id)
             return True
         return False
     except Exception as e:
-        logging.error(f"更新投诉记录时发生错误: {str(e)}")
+        logger.error("更新投诉记录时发生错误: %s", e)
         return False
-    finally:
-        conn.close()
 
 
 def delete_complaint(complaint_id):
@@ -198,23 +212,21 @@ def delete_complaint(complaint_id):
     删除投诉记录
     """
     try:
-        conn = sqlite3.connect("data/complaints.db")
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM complaints WHERE id = ?", (complaint_id,))
-        conn.commit()
-        logging.info(f"成功删除投诉记录，ID: {complaint_id}")
+        with engine.begin() as conn:
+            conn.execute(delete(COMPLAINTS).where(COMPLAINTS.c.id == complaint_id))
+        notify_external_write()
+        logger.info("成功删除投诉记录，ID: %s", complaint_id)
         return True
     except Exception as e:
-        logging.error(f"删除投诉记录时发生错误: {str(e)}")
+        logger.error("删除投诉记录时发生错误: %s", e)
         return False
-    finally:
-        conn.close()
 
 
 if __name__ == "__main__":
-    logging.info("开始处理投诉数据...")
+    configure_logging()
+    logger.info("开始处理投诉数据...")
     success = import_data_to_db()
     if success:
-        logging.info("投诉数据处理完成。")
+        logger.info("投诉数据处理完成。")
     else:
-        logging.error("投诉数据处理失败。")
+        logger.error("投诉数据处理失败。")
@@ -0,0 +1,399 @@
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+
+from utils.config import HOTSET_CONFIG
+from utils.db import FEED_COLUMNS, Complaint, add_write_observer, data_version, stream_rows
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+HOTSET_DAYS = int(os.getenv("HOTSET_DAYS", HOTSET_CONFIG["days"]))
+HOTSET_RELOAD_INTERVAL = float(
+    os.getenv("HOTSET_RELOAD_INTERVAL", HOTSET_CONFIG["reload_interval"])
+)
+
+HOTSET_ROWS = REGISTRY.gauge("hotset_rows", "内存热数据中的投诉数")
+HOTSET_BYTES = REGISTRY.gauge("hotset_bytes", "内存热数据占用的字节数（列数组和文本缓冲区）")
+HOTSET_QUERIES = REGISTRY.counter(
+    "hotset_queries_total", "列表和统计查询的数据来源：hot 内存热数据，database 回退到数据库", ("source",)
+)
+HOTSET_RELOAD = REGISTRY.histogram("hotset_reload_seconds", "内存热数据全量加载耗时")
+
+# 时间列以 1970-01-01 起的微秒数存放；投诉时间为不带时区的本地时间，按原值换算
+_EPOCH = datetime(1970, 1, 1)
+_US = timedelta(microseconds=1)
+
+
+def to_us(moment: datetime) -> int:
+    return (moment - _EPOCH) // _US
+
+
+def bucket_counts(times_us: np.ndarray, start_us: int, width_us: int, buckets: int) -> np.ndarray:
+    """把时间（微秒）按 width_us 分桶计数，范围外的时间忽略"""
+    index = (times_us - start_us) // width_us
+    index = index[(index >= 0) & (index < buckets)]
+    return np.bincount(index, minlength=buckets)
+
+
+class _Dictionary:
+    """字典编码：每个不同的值对应一个 int32 编号，None 也作为一个值"""
+
+    def __init__(self):
+        self.values: List[Optional[str]] = []
+        self._codes: Dict[Optional[str], int] = {}
+
+    def encode(self, value: Optional[str]) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class HotColumns:
+    """按列存放的近期投诉，行按 id 升序
+
+    时间为 int64 微秒，分类和用户为字典编码，内容和回复是共享 UTF-8 缓冲区中的
+    [起, 止) 偏移（None 记为 -1）。删除只清除存活标记，更新把新文本追加到缓冲区末尾，
+    留下的空间在下次全量加载时回收。包含投诉时间不早于 cutoff 的全部投诉。
+    """
+
+    _ARRAYS = {
+        "ids": np.int64,
+        "ts": np.int64,
+        "category": np.int32,
+        "user": np.int32,
+        "content_start": np.int64,
+        "content_end": np.int64,
+        "reply_start": np.int64,
+        "reply_end": np.int64,
+        "alive": np.bool_,
+    }
+
+    def __init__(self, cutoff: datetime, capacity: int = 1024):
+        self.cutoff = cutoff
+        self.size = 0
+        for name, dtype in self._ARRAYS.items():
+            setattr(self, name, np.zeros(capacity, dtype))
+        self.categories = _Dictionary()
+        self.users = _Dictionary()
+        self.text = bytearray()
+
+    @property
+    def max_id(self) -> int:
+        return int(self.ids[self.size - 1]) if self.size else 0
+
+    @property
+    def live_rows(self) -> int:
+        return int(np.count_nonzero(self.alive[: self.size]))
+
+    @property
+    def nbytes(self) -> int:
+        arrays = sum(getattr(self, name).nbytes for name in self._ARRAYS)
+        return arrays + len(self.text)
+
+    def _reserve(self, n: int):
+        needed = self.size + n
+        capacity = len(self.ids)
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2)
+        for name in self._ARRAYS:
+            old = getattr(self, name)
+            new = np.zeros(capacity, old.dtype)
+            new[: self.size] = old[: self.size]
+            setattr(self, name, new)
+
+    def _store_text(self, value: Optional[str]) -> Tuple[int, int]:
+        if value is None:
+            return -1, -1
+        start = len(self.text)
+        self.text += value.encode("utf-8")
+        return start, len(self.text)
+
+    def _text(self, start: int, end: int) -> Optional[str]:
+        return None if start < 0 else self.text[start:end].decode("utf-8")
+
+    def _set(self, i: int, row: Sequence[Any]):
+        """row 按 FEED_COLUMNS 排列：id、时间、内容、用户、分类、回复"""
+        _, moment, content, user_id, category, reply = row
+        self.ts[i] = to_us(moment)
+        self.content_start[i], self.content_end[i] = self._store_text(content)
+        self.user[i] = self.users.encode(user_id)
+        self.category[i] = self.categories.encode(category)
+        self.reply_start[i], self.reply_end[i] = self._store_text(reply)
+        self.alive[i] = True
+
+    def append(self, rows: Sequence[Sequence[Any]]):
+        """追加 id 大于现有所有行的投诉"""
+        self._reserve(len(rows))
+        for row in rows:
+            i = self.size
+            self.ids[i] = row[0]
+            self._set(i, row)
+            self.size += 1
+
+    def find(self, complaint_id: int) -> Optional[int]:
+        i = int(np.searchsorted(self.ids[: self.size], complaint_id))
+        if i < self.size and self.ids[i] == complaint_id:
+            return i
+        return None
+
+    def covers(self, moment: Optional[datetime]) -> bool:
+        return moment is not None and moment >= self.cutoff
+
+    def apply(self, changes: Dict[str, Any]) -> bool:
+        """应用 ORM 提交的更新和删除，无法就地应用时返回 False
+
+        新增由读取时按 id 增量补齐；更新的行不在内存中且不比已有行新时，
+        说明较早的投诉被改到了时间窗口内，需要全量重新加载。
+        """
+        for complaint_id in changes.get("deleted", ()):
+            i = self.find(complaint_id)
+            if i is not None:
+                self.alive[i] = False
+        for record in changes.get("updated", ()):
+            row = tuple(record.get(name) for name in FEED_COLUMNS)
+            in_window = row[1] is not None and row[1] >= self.cutoff
+            i = self.find(row[0])
+            if i is not None:
+                if in_window:
+                    self._set(i, row)
+                else:
+                    self.alive[i] = False
+            elif in_window and row[0] <= self.max_id:
+                return False
+        return True
+
+    def mask(self, start: Optional[datetime], end: Optional[datetime]) -> np.ndarray:
+        n = self.size
+        mask = self.alive[:n].copy()
+        if start is not None and start > self.cutoff:
+            mask &= self.ts[:n] >= to_us(start)
+        if end is not None:
+            mask &= self.ts[:n] < to_us(end)
+        return mask
+
+    def rows(self, columns: Sequence[str], index: np.ndarray) -> List[tuple]:
+        values = []
+        for name in columns:
+            if name == "id":
+                values.append(self.ids[index].tolist())
+            elif name == "complaint_time":
+                values.append(self.ts[index].astype("datetime64[us]").tolist())
+            elif name == "user_id":
+                values.append([self.users.values[c] for c in self.user[index].tolist()])
+            elif name == "complaint_category":
+                values.append(
+                    [self.categories.values[c] for c in self.category[index].tolist()]
+                )
+            elif name in ("content", "reply"):
+                starts = getattr(self, f"{name}_start")[index].tolist()
+                ends = getattr(self, f"{name}_end")[index].tolist()
+                values.append([self._text(s, e) for s, e in zip(starts, ends)])
+            else:
+                raise ValueError(f"未知的列: {name}")
+        return list(zip(*values))
+
+
+class ComplaintHotSet:
+    """最近 days 天投诉的进程内列式副本，列表、统计和按时间分桶计数都在 NumPy 上向量化完成
+
+    - 启动后在后台线程加载，每隔 reload_interval 秒全量重新加载一次，滚动时间窗口
+    - 读取时发现数据版本变化，按 id 补齐新增的投诉（各写路径提交后都会递增数据版本）
+    - 本进程 ORM 会话提交的更新和删除通过写入观察者就地应用；
+      语句级更新、删除和归档等无法得知具体行的写入，标记为过期并立即触发重新加载，
+      重新加载完成前查询回退到数据库
+    - 多进程部署时每个进程各有一份；其它进程的新增在读取时补齐，
+      其它进程的更新和删除最多滞后一个 reload_interval
+    """
+
+    def __init__(self, days: int = HOTSET_DAYS, reload_interval: float = HOTSET_RELOAD_INTERVAL):
+        self.days = days
+        self.reload_interval = reload_interval
+        self.engine: Optional[Engine] = None
+        self.generation = 0
+        self._data: Optional[HotColumns] = None
+        self._version: Optional[int] = None
+        self._stale = False
+        self._reloading = False
+        self._pending: List[Optional[Dict[str, Any]]] = []
+        self._lock = threading.RLock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.days > 0
+
+    @property
+    def version(self) -> str:
+        """加载代数，作为读接口缓存的变体：重新加载会滚动时间窗口"""
+        return str(self.generation)
+
+    def attach(self, engine: Engine):
+        if self.engine is None:
+            add_write_observer(self._on_write)
+        self.engine = engine
+
+    def start(self, engine: Engine):
+        """在后台线程加载并定期重新加载；已在运行时直接返回"""
+        self.attach(engine)
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="hotset", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.reload()
+            except Exception:
+                logger.exception("加载内存热数据失败")
+            self._wake.wait(self.reload_interval)
+            self._wake.clear()
+
+    def _select(self, cutoff: datetime, after_id: int = 0):
+        columns = [getattr(Complaint, name) for name in FEED_COLUMNS]
+        return (
+            select(*columns)
+            .where(Complaint.complaint_time >= cutoff, Complaint.id > after_id)
+            .order_by(Complaint.id)
+        )
+
+    def reload(self, now: Optional[datetime] = None):
+        """从数据库全量加载最近 days 天的投诉，替换现有副本"""
+        started = time.perf_counter()
+        with self._lock:
+            self._reloading = True
+            self._pending = []
+        try:
+            version = data_version(self.engine).get()
+            data = HotColumns((now or datetime.now()) - timedelta(days=self.days))
+            with self.engine.connect() as conn:
+                batch = []
+                for row in stream_rows(conn, self._select(data.cutoff)):
+                    batch.append(row)
+                    if len(batch) >= 10_000:
+                        data.append(batch)
+                        batch = []
+                data.append(batch)
+        except BaseException:
+            with self._lock:
+                self._reloading = False
+            raise
+        with self._lock:
+            # 加载期间提交的更新和删除在新副本上重放，新增由下次读取补齐
+            stale = False
+            for changes in self._pending:
+                stale = stale or changes is None or not data.apply(changes)
+            self._data = data
+            self._version = version
+            self._stale = stale
+            self._reloading = False
+            self._pending = []
+            self.generation += 1
+        if stale:
+            self._wake.set()
+        HOTSET_ROWS.set(data.live_rows)
+        HOTSET_BYTES.set(data.nbytes)
+        HOTSET_RELOAD.observe(time.perf_counter() - started)
+        logger.info("内存热数据加载完成：%d 条投诉，%d 字节", data.live_rows, data.nbytes)
+
+    def _on_write(self, changes: Optional[Dict[str, Any]]):
+        with self._lock:
+            if self._reloading:
+                self._pending.append(changes)
+            if self._data is None or self._stale:
+                return
+            if changes is None or not self._data.apply(changes):
+                self._stale = True
+                self._wake.set()
+
+    def _current(self) -> Optional[HotColumns]:
+        """同步到最新数据版本的副本；未加载或已过期时返回 None，由调用方回退到数据库"""
+        with self._lock:
+            data = self._data
+            if data is None or self._stale:
+                return None
+            version = data_version(self.engine).get()
+            if version != self._version:
+                try:
+                    with self.engine.connect() as conn:
+                        data.append(
+                            conn.execute(self._select(data.cutoff, data.max_id)).all()
+                        )
+                except Exception as e:
+                    logger.warning("补齐内存热数据失败: %s", e)
+                    return None
+                self._version = version
+                HOTSET_ROWS.set(data.live_rows)
+            return data
+
+    def rows(
+        self,
+        columns: Sequence[str],
+        start: datetime,
+        end: Optional[datetime] = None,
+        skip: int = 0,
+        limit: int = 100,
+    ) -> Optional[List[tuple]]:
+        """[start, end) 内的投诉，按 id 排序分页；start 早于覆盖范围或副本不可用时返回 None"""
+        with self._lock:
+            data = self._current()
+            if data is None or not data.covers(start):
+                HOTSET_QUERIES.inc(source="database")
+                return None
+            index = np.flatnonzero(data.mask(start, end))[skip : skip + limit]
+            HOTSET_QUERIES.inc(source="hot")
+            return data.rows(columns, index)
+
+    def category_counts(
+        self, start: Optional[datetime] = None, end: Optional[datetime] = None
+    ) -> Optional[Tuple[datetime, Counter]]:
+        """(覆盖起始时间 cutoff, [max(start, cutoff), end) 内各分类的投诉数)，副本不可用时返回 None"""
+        with self._lock:
+            data = self._current()
+            if data is None:
+                HOTSET_QUERIES.inc(source="database")
+                return None
+            codes = data.category[: data.size][data.mask(start, end)]
+            counts = np.bincount(codes, minlength=len(data.categories.values))
+            HOTSET_QUERIES.inc(source="hot")
+            return data.cutoff, Counter(
+                {data.categories.values[c]: n for c, n in enumerate(counts.tolist()) if n}
+            )
+
+    def timeline(
+        self, start: datetime, end: datetime, width: timedelta, buckets: int
+    ) -> Optional[Tuple[datetime, np.ndarray]]:
+        """(覆盖起始时间 cutoff, 从 start 起每 width 一个时间桶的投诉数)，只统计覆盖范围内的部分；
+        副本不可用时返回 None"""
+        with self._lock:
+            data = self._current()
+            if data is None:
+                HOTSET_QUERIES.inc(source="database")
+                return None
+            times = data.ts[: data.size][data.mask(start, end)]
+            HOTSET_QUERIES.inc(source="hot")
+            return data.cutoff, bucket_counts(times, to_us(start), width // _US, buckets)
+
+
+def timeline_from_rows(
+    times: Iterable[Optional[datetime]], start: datetime, width: timedelta, buckets: int
+) -> np.ndarray:
+    """数据库读出的投诉时间分桶计数，与内存副本的结果相加"""
+    values = np.array([t for t in times if t is not None], dtype="datetime64[us]")
+    return bucket_counts(values.astype(np.int64), to_us(start), width // _US, buckets)
+
+
+HOTSET = ComplaintHotSet()
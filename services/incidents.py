@@ -0,0 +1,486 @@
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+import zlib
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
+
+from utils.config import INCIDENT_CONFIG
+from utils.db import Complaint, Incident, data_version
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+INCIDENTS_TABLE = Incident.__table__
+COMPLAINTS = Complaint.__table__
+
+CLUSTERED = REGISTRY.counter(
+    "incident_complaints_total",
+    "热点事件聚类处理的投诉数：joined 归入已有事件，new 新建事件，skipped 超出时间窗口",
+    ("result",),
+)
+ACTIVE_INCIDENTS = REGISTRY.gauge("incidents_active", "内存中时间窗口内的热点事件数")
+
+# Mersenne 素数 2^31-1：哈希值与系数都小于它，a*x+b 不会超出 int64
+_PRIME = (1 << 31) - 1
+# 向量化计算签名时每块的文本数，限制中间矩阵大小
+_CHUNK = 1024
+_WHITESPACE = re.compile(r"\s+")
+
+BandKey = Tuple[int, bytes]
+
+
+def hour_index(moment: datetime) -> int:
+    """时间所在的小时序号，用于按小时计数"""
+    return int(moment.timestamp() // 3600)
+
+
+def _to_datetime(value: Any, default: datetime) -> datetime:
+    if isinstance(value, datetime):
+        return value.astimezone().replace(tzinfo=None) if value.tzinfo else value
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            pass
+    return default
+
+
+class MinHasher:
+    """字符分片的 MinHash 签名，一批文本一次向量化计算"""
+
+    def __init__(self, num_perm: int, shingle_size: int, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.a = rng.integers(1, _PRIME, size=num_perm, dtype=np.int64)
+        self.b = rng.integers(0, _PRIME, size=num_perm, dtype=np.int64)
+
+    def _shingles(self, text: str) -> np.ndarray:
+        k = self.shingle_size
+        pieces = {text} if len(text) <= k else {text[i : i + k] for i in range(len(text) - k + 1)}
+        # crc32 跨进程稳定，持久化的签名重启后仍可比较
+        return np.fromiter(
+            (zlib.crc32(p.encode("utf-8")) & _PRIME for p in pieces),
+            dtype=np.int64,
+            count=len(pieces),
+        )
+
+    def signatures(self, texts: List[str]) -> np.ndarray:
+        """返回 (文本数, num_perm) 的签名矩阵"""
+        out = np.empty((len(texts), self.num_perm), dtype=np.uint32)
+        for start in range(0, len(texts), _CHUNK):
+            shingles = [self._shingles(t) for t in texts[start : start + _CHUNK]]
+            offsets = np.cumsum([0] + [len(s) for s in shingles[:-1]])
+            values = (np.outer(self.a, np.concatenate(shingles)) + self.b[:, None]) % _PRIME
+            out[start : start + len(shingles)] = np.minimum.reduceat(values, offsets, axis=1).T
+        return out
+
+
+@dataclass
+class _Incident:
+    id: str
+    signature: np.ndarray
+    sample: str
+    first_seen: datetime
+    last_seen: datetime
+    size: int = 0
+    categories: Counter = field(default_factory=Counter)
+    hourly: Dict[int, int] = field(default_factory=dict)
+    keys: List[BandKey] = field(default_factory=list)
+    indexed: int = 0
+
+    @property
+    def category(self) -> Optional[str]:
+        common = self.categories.most_common(1)
+        return common[0][0] if common else None
+
+    def add(self, moment: datetime, category: Optional[str], oldest_hour: int):
+        self.size += 1
+        if category:
+            self.categories[category] += 1
+        self.first_seen = min(self.first_seen, moment)
+        self.last_seen = max(self.last_seen, moment)
+        hour = hour_index(moment)
+        if hour not in self.hourly:
+            for stale in [h for h in self.hourly if h < oldest_hour]:
+                del self.hourly[stale]
+        self.hourly[hour] = self.hourly.get(hour, 0) + 1
+
+    @classmethod
+    def from_row(cls, row: Any) -> "_Incident":
+        return cls(
+            id=row.id,
+            signature=np.frombuffer(row.signature, dtype=np.uint32).copy(),
+            sample=row.sample,
+            first_seen=row.first_seen,
+            last_seen=row.last_seen,
+            size=row.size,
+            categories=Counter({row.category: row.size}) if row.category else Counter(),
+            hourly={int(h): n for h, n in json.loads(row.hourly or "{}").items()},
+        )
+
+    def summary(self, hours_range: range) -> Optional[Dict[str, Any]]:
+        """hours_range 内的逐小时计数和趋势，范围内没有投诉时返回 None"""
+        series = [self.hourly.get(h, 0) for h in hours_range]
+        recent = sum(series)
+        if not recent:
+            return None
+        return {
+            "id": self.id,
+            "sample": self.sample,
+            "category": self.category,
+            "size": self.size,
+            "recent": recent,
+            "trend": series[-1] - (series[-2] if len(series) > 1 else 0),
+            "hourly": series,
+            "first_seen": self.first_seen,
+            "last_seen": self.last_seen,
+        }
+
+    def to_row(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "signature": self.signature.tobytes(),
+            "sample": self.sample,
+            "category": self.category,
+            "size": self.size,
+            "first_seen": self.first_seen,
+            "last_seen": self.last_seen,
+            "hourly": json.dumps(self.hourly),
+        }
+
+
+def _summaries(
+    incidents: Iterable[_Incident], hours_range: range, min_size: int
+) -> List[Dict[str, Any]]:
+    result = []
+    for incident in incidents:
+        summary = incident.summary(hours_range) if incident.size >= min_size else None
+        if summary is not None:
+            result.append(summary)
+    return result
+
+
+class IncidentTracker:
+    """增量聚类新增投诉，把内容相近的投诉归为同一热点事件
+
+    每条投诉计算 MinHash 签名并按 LSH 分段查桶，只与同桶的事件比较，
+    单条插入的开销与已有投诉数无关；同一批内相同内容只计算一次。
+    只聚类时间窗口内的投诉，批量导入的历史数据直接跳过。
+
+    多进程部署时只有一个进程（attach）聚类：读取时发现数据版本变化，按 id 从投诉表补齐新增投诉，
+    其它工作进程和命令行的写入同样被聚类；分桶和事件计数保存在内存中，定期写入 incidents 表，
+    重启后从表中恢复。其它进程（follow）直接读取 incidents 表，最多滞后一个 flush_interval，
+    且只包含至少 persist_min_size 条投诉的事件。
+    """
+
+    def __init__(
+        self,
+        shingle_size: int = INCIDENT_CONFIG["shingle_size"],
+        num_perm: int = INCIDENT_CONFIG["num_perm"],
+        bands: int = INCIDENT_CONFIG["bands"],
+        threshold: float = INCIDENT_CONFIG["threshold"],
+        window_hours: int = INCIDENT_CONFIG["window_hours"],
+        max_indexed: int = INCIDENT_CONFIG["max_indexed"],
+        persist_min_size: int = INCIDENT_CONFIG["persist_min_size"],
+        flush_interval: float = INCIDENT_CONFIG["flush_interval"],
+    ):
+        if num_perm % bands:
+            raise ValueError("num_perm 必须是 bands 的整数倍")
+        self.hasher = MinHasher(num_perm, shingle_size)
+        self.bands = bands
+        self.threshold = threshold
+        self.window_hours = window_hours
+        self.max_indexed = max_indexed
+        self.persist_min_size = persist_min_size
+        self.flush_interval = flush_interval
+        self.engine: Optional[Engine] = None
+        self.leader = False
+        self._max_id: Optional[int] = None
+        self._since: Optional[datetime] = None
+        self._version: Optional[int] = None
+        self._sync_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._incidents: Dict[str, _Incident] = {}
+        self._buckets: Dict[BandKey, str] = {}
+        self._dirty: set = set()
+        self._flushed = time.monotonic()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "IncidentTracker":
+        return cls(
+            threshold=float(os.getenv("INCIDENT_THRESHOLD", INCIDENT_CONFIG["threshold"])),
+            window_hours=int(
+                os.getenv("INCIDENT_WINDOW_HOURS", INCIDENT_CONFIG["window_hours"])
+            ),
+            flush_interval=float(
+                os.getenv("INCIDENT_FLUSH_INTERVAL", INCIDENT_CONFIG["flush_interval"])
+            ),
+        )
+
+    def __len__(self) -> int:
+        return len(self._incidents)
+
+    def _band_keys(self, signature: np.ndarray) -> List[BandKey]:
+        return [
+            (i, band.tobytes())
+            for i, band in enumerate(signature.reshape(self.bands, -1))
+        ]
+
+    def _index(self, incident: _Incident, keys: List[BandKey]):
+        """登记签名的分桶；已被占用的桶保留原事件，避免事件之间互相抢桶"""
+        added = False
+        for key in keys:
+            if key not in self._buckets:
+                self._buckets[key] = incident.id
+                incident.keys.append(key)
+                added = True
+        if added:
+            incident.indexed += 1
+
+    def _match(self, signature: np.ndarray, keys: List[BandKey]) -> Optional[_Incident]:
+        candidates = list({self._buckets[key] for key in keys if key in self._buckets})
+        if not candidates:
+            return None
+        # 签名各位相等的比例即 Jaccard 相似度的估计
+        matrix = np.stack([self._incidents[i].signature for i in candidates])
+        scores = np.count_nonzero(matrix == signature, axis=1)
+        best = int(scores.argmax())
+        if scores[best] < self.threshold * signature.size:
+            return None
+        return self._incidents[candidates[best]]
+
+    def observe(self, rows: Iterable[Dict[str, Any]]):
+        """聚类一批已提交的新增投诉，行至少包含 complaint_time、content、complaint_category"""
+        now = datetime.now()
+        cutoff = now - timedelta(hours=self.window_hours)
+        # 按归一化后的内容分组，相同内容只计算一次签名；samples 保留首条原文
+        groups: Dict[str, List[Tuple[datetime, Optional[str]]]] = {}
+        samples: Dict[str, str] = {}
+        skipped = 0
+        for row in rows:
+            raw = row.get("content") or ""
+            content = _WHITESPACE.sub("", raw.lower())
+            moment = _to_datetime(row.get("complaint_time"), now)
+            if not content or moment < cutoff:
+                skipped += 1
+                continue
+            groups.setdefault(content, []).append((moment, row.get("complaint_category")))
+            samples.setdefault(content, raw)
+        if skipped:
+            CLUSTERED.inc(skipped, result="skipped")
+        if not groups:
+            return
+
+        contents = list(groups)
+        signatures = self.hasher.signatures(contents)
+        oldest_hour = hour_index(cutoff)
+        with self._lock:
+            for content, signature in zip(contents, signatures):
+                members = groups[content]
+                keys = self._band_keys(signature)
+                incident = self._match(signature, keys)
+                if incident is None:
+                    first = min(moment for moment, _ in members)
+                    incident = _Incident(
+                        id=uuid.uuid4().hex[:16],
+                        signature=signature,
+                        sample=samples[content],
+                        first_seen=first,
+                        last_seen=first,
+                    )
+                    self._incidents[incident.id] = incident
+                    self._index(incident, keys)
+                    CLUSTERED.inc(result="new")
+                    CLUSTERED.inc(len(members) - 1, result="joined")
+                else:
+                    if incident.indexed < self.max_indexed:
+                        self._index(incident, keys)
+                    CLUSTERED.inc(len(members), result="joined")
+                for moment, category in members:
+                    incident.add(moment, category, oldest_hour)
+                self._dirty.add(incident.id)
+            ACTIVE_INCIDENTS.set(len(self._incidents))
+
+        if time.monotonic() - self._flushed >= self.flush_interval:
+            self.flush()
+
+    def top(
+        self, hours: int = 24, min_size: int = 2, limit: int = 20, now: Optional[datetime] = None
+    ) -> List[Dict[str, Any]]:
+        """最近 hours 小时内投诉最多的事件
+
+        hourly 为逐小时投诉数（由远到近），trend 为最近一小时相对前一小时的变化。
+        """
+        now = now or datetime.now()
+        current = hour_index(now)
+        hours_range = range(current - hours + 1, current + 1)
+        if self.engine is not None and not self.leader:
+            result = _summaries(self._persisted(now - timedelta(hours=hours)), hours_range, min_size)
+        else:
+            self.sync()
+            with self._lock:
+                result = _summaries(self._incidents.values(), hours_range, min_size)
+        result.sort(key=lambda item: (item["recent"], item["last_seen"]), reverse=True)
+        return result[:limit]
+
+    def _persisted(self, since: datetime) -> List[_Incident]:
+        """聚类进程写入 incidents 表的事件，供其它工作进程读取"""
+        try:
+            with self.engine.connect() as conn:
+                rows = conn.execute(
+                    select(INCIDENTS_TABLE).where(INCIDENTS_TABLE.c.last_seen >= since)
+                ).all()
+        except DBAPIError as e:
+            logger.warning("读取热点事件失败: %s", e)
+            return []
+        return [_Incident.from_row(row) for row in rows]
+
+    def _prune(self, cutoff: datetime):
+        """移除超出时间窗口的事件及其分桶"""
+        for incident in [i for i in self._incidents.values() if i.last_seen < cutoff]:
+            for key in incident.keys:
+                if self._buckets.get(key) == incident.id:
+                    del self._buckets[key]
+            del self._incidents[incident.id]
+            self._dirty.discard(incident.id)
+        ACTIVE_INCIDENTS.set(len(self._incidents))
+
+    def attach(self, engine: Engine):
+        """由本进程聚类：绑定持久化的数据库并恢复时间窗口内的事件
+
+        上次持久化之后提交的投诉在首次同步时按投诉时间补齐。
+        """
+        self.engine = engine
+        self.leader = True
+        cutoff = datetime.now() - timedelta(hours=self.window_hours)
+        self._since = cutoff
+        try:
+            with engine.connect() as conn:
+                rows = conn.execute(
+                    select(INCIDENTS_TABLE).where(INCIDENTS_TABLE.c.last_seen >= cutoff)
+                ).all()
+        except DBAPIError as e:
+            logger.warning("加载热点事件失败: %s", e)
+            return
+        with self._lock:
+            for row in rows:
+                self._since = max(self._since, row.last_seen)
+                if row.id in self._incidents:
+                    continue
+                incident = _Incident.from_row(row)
+                if incident.signature.size != self.hasher.num_perm:
+                    continue  # 签名参数已修改，旧事件无法比较
+                self._incidents[incident.id] = incident
+                self._index(incident, self._band_keys(incident.signature))
+            ACTIVE_INCIDENTS.set(len(self._incidents))
+        logger.info("恢复 %d 个热点事件", len(rows))
+
+    def follow(self, engine: Engine):
+        """由其它进程聚类：top 直接读取 incidents 表"""
+        self.engine = engine
+        self.leader = False
+
+    def sync(self):
+        """数据版本变化时按 id 补齐新增的投诉（各写路径提交后都会递增数据版本）"""
+        if not self.leader:
+            return
+        version = data_version(self.engine).get()
+        with self._sync_lock:
+            if version == self._version:
+                return
+            cutoff = datetime.now() - timedelta(hours=self.window_hours)
+            if self._max_id is None:
+                condition = COMPLAINTS.c.complaint_time > self._since
+            else:
+                condition = COMPLAINTS.c.id > self._max_id
+            try:
+                with self.engine.connect() as conn:
+                    max_id = conn.scalar(select(func.max(COMPLAINTS.c.id))) or 0
+                    rows = conn.execute(
+                        select(
+                            COMPLAINTS.c.complaint_time,
+                            COMPLAINTS.c.content,
+                            COMPLAINTS.c.complaint_category,
+                        ).where(
+                            condition,
+                            COMPLAINTS.c.id <= max_id,
+                            COMPLAINTS.c.complaint_time >= cutoff,
+                        )
+                    ).mappings().all()
+            except DBAPIError as e:
+                logger.warning("补齐热点事件失败: %s", e)
+                return
+            self._max_id = max_id
+            self._version = version
+            self.observe(rows)
+
+    def start(self):
+        """在后台线程中定期补齐新增投诉并持久化，已在运行时直接返回"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        def run():
+            while True:
+                time.sleep(self.flush_interval)
+                try:
+                    self.sync()
+                    self.flush()
+                except Exception:
+                    logger.exception("同步热点事件失败")
+
+        self._thread = threading.Thread(target=run, name="incidents", daemon=True)
+        self._thread.start()
+
+    def flush(self):
+        """把有变化的事件写入数据库并清理超出时间窗口的事件
+
+        由聚类按 flush_interval 触发，已有写入正在进行时直接返回。
+        """
+        if not self.leader or not self._flush_lock.acquire(blocking=False):
+            return
+        try:
+            cutoff = datetime.now() - timedelta(hours=self.window_hours)
+            with self._lock:
+                self._prune(cutoff)
+                records = [
+                    self._incidents[i].to_row()
+                    for i in self._dirty
+                    if self._incidents[i].size >= self.persist_min_size
+                ]
+                self._dirty.clear()
+                self._flushed = time.monotonic()
+            with self.engine.begin() as conn:
+                for record in records:
+                    result = conn.execute(
+                        update(INCIDENTS_TABLE)
+                        .where(INCIDENTS_TABLE.c.id == record["id"])
+                        .values(record)
+                    )
+                    if result.rowcount == 0:
+                        conn.execute(insert(INCIDENTS_TABLE).values(record))
+                conn.execute(delete(INCIDENTS_TABLE).where(INCIDENTS_TABLE.c.last_seen < cutoff))
+        except DBAPIError as e:
+            logger.warning("保存热点事件失败，下次写入时重试: %s", e)
+            with self._lock:
+                self._dirty.update(r["id"] for r in records)
+        finally:
+            self._flush_lock.release()
+
+
+# 服务进程的热点事件，启动时由 main.prepare 决定本进程聚类还是读取 incidents 表
+INCIDENTS = IncidentTracker.from_env()
@@ -0,0 +1,130 @@
+import logging
+import time
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+from services.dispatcher import LoadShedError
+from services.resilience import CallTimeoutError, CircuitOpenError
+from utils.metrics import REGISTRY, record_timing
+
+if TYPE_CHECKING:
+    from langchain_core.outputs import LLMResult
+
+logger = logging.getLogger(__name__)
+
+CHAIN_LATENCY = REGISTRY.histogram(
+    "llm_chain_latency_seconds",
+    "LLM处理链调用耗时（含重试与对冲）",
+    ("chain", "outcome"),
+)
+PROMPT_TOKENS = REGISTRY.counter(
+    "llm_prompt_tokens_total", "发送给模型的提示词token数", ("chain",)
+)
+COMPLETION_TOKENS = REGISTRY.counter(
+    "llm_completion_tokens_total", "模型生成的token数", ("chain",)
+)
+CACHE_HITS = REGISTRY.counter(
+    "llm_cache_hits_total", "命中LangChain模型缓存的调用次数", ("chain",)
+)
+FALLBACKS = REGISTRY.counter(
+    "llm_fallbacks_total", "LLM调用失败后回退到正则或模板的次数", ("chain", "reason")
+)
+
+
+def record_fallback(chain: str, reason: str):
+    """记录一次回退到正则分类或模板回复"""
+    FALLBACKS.inc(chain=chain, reason=reason)
+
+
+def fallback_reason(exc: BaseException) -> str:
+    """回退原因：调度器丢弃的调用记为 shed，其余异常记为 error"""
+    return "shed" if isinstance(exc, LoadShedError) else "error"
+
+
+def _outcome(exc: BaseException) -> str:
+    if isinstance(exc, LoadShedError):
+        return "shed"
+    if isinstance(exc, CircuitOpenError):
+        return "circuit_open"
+    if isinstance(exc, (CallTimeoutError, TimeoutError)):
+        return "timeout"
+    return "error"
+
+
+@lru_cache(maxsize=1)
+def _token_usage_handler_class() -> type:
+    """回调基类来自 langchain_core，首次创建在线处理链时才导入"""
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class TokenUsageHandler(BaseCallbackHandler):
+        """从模型回调中统计 token 用量和缓存命中"""
+
+        def __init__(self, chain: str):
+            self.chain = chain
+
+        def on_llm_end(self, response: "LLMResult", **kwargs: Any) -> None:
+            prompt_tokens = completion_tokens = 0
+            cached = False
+            for generations in response.generations:
+                for generation in generations:
+                    message = getattr(generation, "message", None)
+                    usage = getattr(message, "usage_metadata", None) or {}
+                    # LangChain 在缓存命中时将 total_cost 置为 0，真实响应不含该字段
+                    cached = cached or "total_cost" in usage
+                    prompt_tokens += usage.get("input_tokens", 0)
+                    completion_tokens += usage.get("output_tokens", 0)
+
+            if not prompt_tokens and not completion_tokens and response.llm_output:
+                token_usage = response.llm_output.get("token_usage") or {}
+                prompt_tokens = token_usage.get("prompt_tokens", 0)
+                completion_tokens = token_usage.get("completion_tokens", 0)
+
+            if cached:
+                CACHE_HITS.inc(chain=self.chain)
+                return
+            if prompt_tokens:
+                PROMPT_TOKENS.inc(prompt_tokens, chain=self.chain)
+            if completion_tokens:
+                COMPLETION_TOKENS.inc(completion_tokens, chain=self.chain)
+
+    return TokenUsageHandler
+
+
+def __getattr__(name: str) -> Any:
+    if name == "TokenUsageHandler":
+        return _token_usage_handler_class()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class InstrumentedChain:
+    """记录处理链的调用耗时、结果和 token 用量
+
+    耗时同时写入当前请求的 Server-Timing 记录（条目名 llm-<chain>）。
+    """
+
+    def __init__(self, chain: Any, name: str):
+        self.chain = chain
+        self.name = name
+        self._handler = (
+            _token_usage_handler_class()(name)
+            if getattr(chain, "accepts_callbacks", True)
+            else None
+        )
+
+    def invoke(self, input: Any, config: Optional[Dict[str, Any]] = None) -> Any:
+        config = dict(config or {})
+        if self._handler is not None:
+            config["callbacks"] = list(config.get("callbacks") or []) + [self._handler]
+        config.setdefault("run_name", self.name)
+
+        start = time.perf_counter()
+        outcome = "ok"
+        try:
+            return self.chain.invoke(input, config=config)
+        except Exception as e:
+            outcome = _outcome(e)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            CHAIN_LATENCY.observe(elapsed, chain=self.name, outcome=outcome)
+            record_timing(f"llm-{self.name}", elapsed)
@@ -1,41 +1,73 @@
+import importlib
 import logging
 import os
 import re
-import sqlite3
+import time
 from contextlib import contextmanager
 from datetime import datetime
 from typing import Any, Dict, Generator, Optional
 
-from dotenv import load_dotenv
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import PromptTemplate
-from langchain_core.runnables import Runnable, RunnablePassthrough
-from langchain_openai import ChatOpenAI
 from pydantic import BaseModel, Field, SecretStr
 from pydantic.functional_validators import AfterValidator
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import DBAPIError
 from typing_extensions import Annotated
 
-from utils.logging import configure_logging
+from services.dispatcher import DispatchedChain, estimate_tokens, get_dispatcher
+from services.instrumentation import InstrumentedChain, fallback_reason, record_fallback
+from services.local_llm import LOCAL_FALLBACKS, LocalChain, get_local_model, local_timeout
+from services.prompt_budget import PromptBudget
+from services.resilience import ResilientChain, ResiliencePolicy, get_circuit_breaker
+from utils.db import Complaint, create_app_engine, engine, init_schema, notify_external_write
+from utils.workers import run_once
 
-# 配置日志
-configure_logging()
 logger = logging.getLogger(__name__)
 
+# LangChain/OpenAI 客户端导入耗时数秒，延迟到首次创建在线模型链时再加载；
+# mock 模式、命令行工具和测试不会导入。仍可通过 services.llm.ChatOpenAI 访问和 patch。
+_LAZY_IMPORTS = {
+    "ChatOpenAI": ("langchain_openai", "ChatOpenAI"),
+    "PromptTemplate": ("langchain_core.prompts", "PromptTemplate"),
+    "RunnablePassthrough": ("langchain_core.runnables", "RunnablePassthrough"),
+    "StrOutputParser": ("langchain_core.output_parsers", "StrOutputParser"),
+}
+
+
+def __getattr__(name: str) -> Any:
+    try:
+        module_name, attr = _LAZY_IMPORTS[name]
+    except KeyError:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
+    value = getattr(importlib.import_module(module_name), attr)
+    globals()[name] = value
+    return value
+
+
+def _lazy(name: str) -> Any:
+    """按名称取延迟导入的对象，已被 patch 替换时返回替换后的对象"""
+    return globals()[name] if name in globals() else __getattr__(name)
+
 try:
     from utils.config import (
+        ANALYSIS_PROMPT,
         CLASSIFICATION_PROMPT,
         PRODUCT_PATTERNS,
         QUERY_PARSER_PROMPT,
         REPLY_PROMPT,
         REPLY_TEMPLATES,
+        VALID_CATEGORIES,
     )
 
     logger.info("成功加载配置文件")
 except ImportError as e:
-    logger.error(f"加载配置文件失败: {e}")
+    logger.error("加载配置文件失败: %s", e)
     raise
 
 
+COMPLAINTS = Complaint.__table__
+
+
 # Pydantic 模型定义
 class ComplaintAnalysisResult(BaseModel):
     category: str = Field(..., description="投诉分类结果")
@@ -43,6 +75,13 @@ class ComplaintAnalysisResult(BaseModel):
     complaint_id: Optional[int] = Field(None, description="投诉记录ID")
 
 
+class ComplaintAnalysisOutput(BaseModel):
+    """合并分析链的结构化输出，只包含模型能给出的分类和回复"""
+
+    category: str = Field(..., description="投诉分类结果")
+    reply: str = Field(..., description="生成的回复文本")
+
+
 class ComplaintRecord(BaseModel):
     id: int
     content: str
@@ -60,23 +99,55 @@ def validate_non_empty_text(v: str) -> str:
 NonEmptyString = Annotated[str, AfterValidator(validate_non_empty_text)]
 
 
+class MockChain:
+    """mock 模式的处理链，接口与 Runnable.invoke 一致，不依赖 LangChain"""
+
+    # 不产生模型回调，InstrumentedChain 无需挂载 token 统计
+    accepts_callbacks = False
+
+    def __init__(self, value: Any, latency: float = 0.0):
+        self.value = value
+        self.latency = latency
+
+    def invoke(self, input: Any, config: Optional[Dict[str, Any]] = None) -> Any:
+        logger.debug("模拟处理输入: %s", input)
+        if self.latency > 0:
+            time.sleep(self.latency)
+        return self.value
+
+
 class ComplaintAnalyzer:
     def __init__(self, db_path: Optional[str] = None):
         """初始化投诉分析器
 
         Args:
-            db_path: 数据库文件路径，默认为./data/complaints.db
+            db_path: SQLite 数据库文件路径，默认使用 DATABASE_URL 配置的数据库
         """
+        from dotenv import load_dotenv
+
         load_dotenv()
         self.mode = os.getenv("LLM_MODE", "online")
-        logger.info(f"初始化 ComplaintAnalyzer, 模式: {self.mode}")
+        # 合并模式：单次LLM调用同时返回分类和回复
+        self.combined = os.getenv("LLM_COMBINED", "false").lower() in (
+            "1",
+            "true",
+            "yes",
+        )
+        logger.info("初始化 ComplaintAnalyzer, 模式: %s", self.mode)
 
         self.api_key = os.getenv("API_KEY")
         self.base_url = os.getenv("BASE_URL")
         self.model_name = os.getenv("MODEL_NAME")
-        self.db_path = db_path or "./data/complaints.db"
+        # 未指定路径时使用应用的数据库（DATABASE_URL），指定时打开独立的 SQLite 文件
+        self.db_path = db_path
+        self._owns_engine = db_path is not None
+        self.engine = (
+            create_app_engine(f"sqlite:///{db_path}") if self._owns_engine else engine
+        )
         self.product_patterns: Dict[str, re.Pattern] = PRODUCT_PATTERNS
         self.templates: Dict[str, str] = REPLY_TEMPLATES
+        # 发送给模型前清理并截断投诉文本
+        self.prompt_budget = PromptBudget.from_env()
 
         # 初始化LLM链
         self._init_chains()
@@ -88,15 +159,37 @@ class ComplaintAnalyzer:
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         """退出上下文时清理资源"""
-        pass
+        if self._owns_engine:
+            self.engine.dispose()
 
     def _init_chains(self):
         """初始化LangChain处理链"""
-        if self.mode != "mock" and self.api_key and self.model_name:
+        # 远程调用失败、超时或熔断时改用的本地处理链，仅使用远程模型且配置了本地模型时启用
+        self.local_chains: Dict[str, Any] = {}
+        local_chains = self._local_chains() if self.mode == "local" else {}
+        if self.mode == "local" and not local_chains:
+            logger.warning("LLM_MODE=local 但未配置本地模型，改用 mock 模式")
+            self.mode = "mock"
+
+        if self.mode == "local":
+            # 本地CPU推理，不经过远程端点的熔断和调度
+            self.classification_chain = local_chains["classification"]
+            self.reply_chain = local_chains["reply"]
+            self.query_parser_chain = local_chains["query_parser"]
+            self.analysis_chain = None
+        elif self.mode != "mock" and self.api_key and self.model_name:
+            ChatOpenAI = _lazy("ChatOpenAI")
+            PromptTemplate = _lazy("PromptTemplate")
+            RunnablePassthrough = _lazy("RunnablePassthrough")
+            StrOutputParser = _lazy("StrOutputParser")
+            policy = ResiliencePolicy.from_env()
+            # 超时与重试由 ResilientChain 统一控制，客户端自身不再重试
             self.llm = ChatOpenAI(
                 model=self.model_name,
                 api_key=SecretStr(self.api_key),
                 base_url=self.base_url,
+                timeout=policy.timeout,
+                max_retries=0,
             )
 
             # 分类链
@@ -122,58 +215,139 @@ class ComplaintAnalyzer:
                 | self.llm
                 | StrOutputParser()
             )
+
+            # 分类与回复合并链（结构化输出）
+            self.analysis_chain = PromptTemplate.from_template(
+                ANALYSIS_PROMPT
+            ) | self.llm.with_structured_output(
+                ComplaintAnalysisOutput, method="function_calling"
+            )
+
+            # 所有链共享同一模型端点的熔断器和调度器；每次重试和对冲请求都经调度器申请配额，
+            # 排队在单次调用的截止时间之外进行，被丢弃的调用也不计入熔断
+            endpoint = f"{self.base_url}|{self.model_name}"
+            breaker = get_circuit_breaker(endpoint)
+            dispatcher = get_dispatcher(endpoint)
+            for attr, prompt in (
+                ("classification_chain", CLASSIFICATION_PROMPT),
+                ("reply_chain", REPLY_PROMPT),
+                ("query_parser_chain", QUERY_PARSER_PROMPT),
+                ("analysis_chain", ANALYSIS_PROMPT),
+            ):
+                name = attr.removesuffix("_chain")
+                dispatched = DispatchedChain(
+                    getattr(self, attr), name, dispatcher, prompt_tokens=estimate_tokens(prompt)
+                )
+                setattr(
+                    self,
+                    attr,
+                    ResilientChain(
+                        dispatched.chain, name, breaker, policy, admit=dispatched.admit
+                    ),
+                )
+            self.local_chains = {
+                name: InstrumentedChain(chain, f"{name}_local")
+                for name, chain in self._local_chains().items()
+            }
         else:
             # Mock处理链
             self.classification_chain = self._mock_chain("其它")
             self.reply_chain = self._mock_chain(self.templates["其它"])
             self.query_parser_chain = self._mock_chain("")
-
-    def _mock_chain(self, default_value: Any) -> Runnable:
+            self.analysis_chain = None
+
+        # 记录各链的耗时与token用量
+        for attr in (
+            "classification_chain",
+            "reply_chain",
+            "query_parser_chain",
+            "analysis_chain",
+        ):
+            chain = getattr(self, attr)
+            if chain is not None:
+                setattr(self, attr, InstrumentedChain(chain, attr.removesuffix("_chain")))
+
+    def _local_chains(self) -> Dict[str, LocalChain]:
+        """基于本地模型的处理链，未配置或加载失败时返回空字典"""
+        try:
+            model = get_local_model()
+        except Exception as e:
+            logger.error("加载本地模型失败: %s", e)
+            return {}
+        if model is None:
+            return {}
+        timeout = local_timeout()
+        return {
+            "classification": LocalChain(model, CLASSIFICATION_PROMPT, "text", timeout),
+            "reply": LocalChain(model, REPLY_PROMPT, "text", timeout),
+            "query_parser": LocalChain(model, QUERY_PARSER_PROMPT, "query", timeout),
+        }
+
+    def _invoke(self, name: str, input: Any) -> Any:
+        """调用处理链；远程模型调用失败时，如配置了本地模型则改用本地模型"""
+        try:
+            return getattr(self, f"{name}_chain").invoke(input)
+        except Exception as e:
+            local = self.local_chains.get(name)
+            if local is None:
+                raise
+            logger.warning("远程模型调用失败（%s），改用本地模型", e)
+            LOCAL_FALLBACKS.inc(chain=name, reason=fallback_reason(e))
+            return local.invoke(input)
+
+    def fit_prompt(self, chain: str, text: str) -> str:
+        """清理并截断填入 chain 提示词的文本；查询语句只合并空白，不改写内容"""
+        if self.mode == "mock":  # mock 处理链不使用输入
+            return text
+        return self.prompt_budget.fit(chain, text, clean=chain != "query_parser")
+
+    def _mock_chain(self, default_value: Any) -> "MockChain":
         """创建模拟处理链"""
-        from langchain_core.runnables import RunnableLambda
-
-        def mock_invoke(input_data: Any) -> str:
-            logger.debug(f"模拟处理输入: {input_data}")
-            return default_value
-
-        return RunnableLambda(mock_invoke)
+        # 可选的模拟延迟（秒），用于压测时模拟模型响应时间
+        return MockChain(default_value, float(os.getenv("LLM_MOCK_LATENCY", "0")))
 
     @contextmanager
-    def db_connection(self) -> Generator[sqlite3.Connection, None, None]:
-        """数据库连接上下文管理器"""
+    def db_connection(self) -> Generator[Any, None, None]:
+        """数据库连接上下文管理器，返回连接池中的 DBAPI 连接"""
         conn = None
         try:
-            conn = sqlite3.connect(self.db_path)
+            conn = self.engine.raw_connection()
             yield conn
-        except sqlite3.Error as e:
-            logger.error(f"数据库连接错误: {e}")
+        except self.engine.dialect.dbapi.Error as e:
+            logger.error("数据库连接错误: %s", e)
             raise
+        except DBAPIError as e:
+            logger.error("数据库连接错误: %s", e.orig)
+            raise e.orig from e
         finally:
             if conn:
                 conn.close()
 
+    @contextmanager
+    def _transaction(self) -> Generator[Connection, None, None]:
+        """在一个事务中执行 SQLAlchemy Core 语句，出错时抛出驱动原始异常"""
+        try:
+            with self.engine.begin() as conn:
+                yield conn
+        except DBAPIError as e:
+            logger.error("数据库操作错误: %s", e.orig)
+            raise e.orig from e
+
     def _init_db(self):
-        """初始化数据库表结构"""
-        with self.db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                CREATE TABLE IF NOT EXISTS complaints (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    complaint_time DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                    content TEXT NOT NULL,
-                    user_id TEXT NOT NULL DEFAULT 'anonymous',
-                    complaint_category TEXT NOT NULL,
-                    reply TEXT
-                )
-                """
-            )
-            conn.commit()
-            logger.info("数据库初始化完成")
+        """初始化数据库表结构；共享应用数据库时与服务启动共用一次性的建表任务"""
+        try:
+            if self._owns_engine:
+                init_schema(self.engine)
+            else:
+                run_once("schema", lambda: init_schema(self.engine))
+        except DBAPIError as e:
+            logger.error("数据库连接错误: %s", e.orig)
+            raise e.orig from e
+        logger.info("数据库初始化完成")
 
     def classify_complaint(self, text: NonEmptyString) -> str:
         """分类客户投诉文本，返回产品类别"""
-        logger.debug(f"开始分类投诉文本: {text[:50]}...")
+        logger.debug("开始分类投诉文本: %s...", text[:50])
 
         # 优先使用正则表达式进行精确匹配
         regex_result = self._classify_with_regex(text)
@@ -183,17 +357,20 @@ class ComplaintAnalyzer:
         # 如果正则未匹配到，且不是mock模式，使用LLM进行分类
         if self.mode != "mock" and self.classification_chain:
             try:
-                result = self.classification_chain.invoke(text)
+                result = self._invoke(
+                    "classification", self.fit_prompt("classification", text)
+                )
                 llm_result = result.strip()
                 # 确保LLM结果在有效范围内
-                valid_categories = ["手机", "宽带", "固话", "其它"]
-                if llm_result in valid_categories:
+                if llm_result in VALID_CATEGORIES:
                     return llm_result
                 else:
-                    logger.warning(f"LLM返回了无效分类: {llm_result}，使用'其它'")
+                    logger.warning("LLM返回了无效分类: %s，使用'其它'", llm_result)
+                    record_fallback("classification", "invalid")
                     return "其它"
             except Exception as e:
-                logger.error(f"分类投诉时出错: {e}")
+                logger.error("分类投诉时出错: %s", e)
+                record_fallback("classification", fallback_reason(e))
 
         return "其它"
 
@@ -211,7 +388,7 @@ class ComplaintAnalyzer:
         if not category:
             category = self.classify_complaint(text)
 
-        logger.debug(f"为类别'{category}'生成回复")
+        logger.debug("为类别'%s'生成回复", category)
 
         # 其它分类直接返回模板回复
         if category in ("其它", "其它分类"):
@@ -221,10 +398,13 @@ class ComplaintAnalyzer:
             return self.templates.get(category, self.templates["其它"])
 
         try:
-            result = self.reply_chain.invoke({"text": text, "category": category})
+            result = self._invoke(
+                "reply", {"text": self.fit_prompt("reply", text), "category": category}
+            )
             return result.strip()
         except Exception as e:
-            logger.error(f"生成回复时出错: {e}")
+            logger.error("生成回复时出错: %s", e)
+            record_fallback("reply", fallback_reason(e))
             return self.templates.get(category, self.templates["其它"])
 
     def analyze(self, text: NonEmptyString) -> ComplaintAnalysisResult:
@@ -232,52 +412,76 @@ class ComplaintAnalyzer:
         if not text or not isinstance(text, str):
             raise ValueError("文本内容不能为空")
 
-        logger.info(f"开始分析投诉: {text[:50]}...")
+        logger.info("开始分析投诉: %s...", text[:50])
+        if self.combined and self.mode != "mock" and self.analysis_chain:
+            result = self._analyze_combined(text)
+            if result is not None:
+                return result
+
         category = self.classify_complaint(text)
         reply = self.generate_reply(text, category)
         return ComplaintAnalysisResult(
             category=category, reply=reply, complaint_id=None
         )
 
+    def _analyze_combined(self, text: str) -> Optional[ComplaintAnalysisResult]:
+        """单次LLM调用同时完成分类和回复，解析失败时返回None以回退到两步流程"""
+        try:
+            result = self.analysis_chain.invoke({"text": self.fit_prompt("analysis", text)})
+        except Exception as e:
+            logger.warning("合并分析调用失败，回退到两步流程: %s", e)
+            record_fallback("analysis", fallback_reason(e))
+            return None
+
+        if not isinstance(result, ComplaintAnalysisOutput):
+            logger.warning("合并分析返回了无效结构: %r，回退到两步流程", result)
+            record_fallback("analysis", "invalid")
+            return None
+
+        category = result.category.strip()
+        reply = result.reply.strip()
+        if category not in VALID_CATEGORIES or not reply:
+            logger.warning("合并分析返回了无效分类: %s，回退到两步流程", category)
+            record_fallback("analysis", "invalid")
+            return None
+
+        # 与两步流程保持一致：其它分类使用模板回复
+        if category == "其它":
+            reply = self.templates["其它"]
+        return ComplaintAnalysisResult(
+            category=category, reply=reply, complaint_id=None
+        )
+
     def create_complaint(self, text: str, category: str, reply: str) -> int:
         """创建新的投诉记录并返回ID"""
-        with self.db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                INSERT INTO complaints (content, complaint_category, reply)
-                VALUES (?, ?, ?)
-                """,
-                (text, category, reply),
+        with self._transaction() as conn:
+            result = conn.execute(
+                insert(COMPLAINTS).values(
+                    content=text, complaint_category=category, reply=reply
+                )
             )
-            conn.commit()
-            last_id = cursor.lastrowid
-            if last_id is None:
-                raise ValueError("未能获取新创建的投诉ID")
-            return last_id
+            last_id = result.inserted_primary_key[0]
+        if last_id is None:
+            raise ValueError("未能获取新创建的投诉ID")
+        # 使用独立数据库文件时只递增该库的数据版本，不通知服务进程内的观察者
+        notify_external_write(inserts_only=True, target=self.engine)
+        return last_id
 
     def get_complaint(self, complaint_id: int) -> Optional[ComplaintRecord]:
         """获取单个投诉记录"""
-        with self.db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                SELECT id, content, complaint_category, reply, complaint_time
-                FROM complaints WHERE id = ?
-                """,
-                (complaint_id,),
-            )
-            row = cursor.fetchone()
-            if not row:
-                return None
-
-            return ComplaintRecord(
-                id=row[0],
-                content=row[1],
-                complaint_category=row[2],
-                reply=row[3],
-                complaint_time=datetime.strptime(row[4], "%Y-%m-%d %H:%M:%S"),
-            )
+        with self._transaction() as conn:
+            row = conn.execute(
+                select(
+                    COMPLAINTS.c.id,
+                    COMPLAINTS.c.content,
+                    COMPLAINTS.c.complaint_category,
+                    COMPLAINTS.c.reply,
+                    COMPLAINTS.c.complaint_time,
+                ).where(COMPLAINTS.c.id == complaint_id)
+            ).first()
+        if not row:
+            return None
+        return ComplaintRecord(**row._mapping)
 
     def update_complaint(
         self,
@@ -290,36 +494,26 @@ class ComplaintAnalyzer:
         if not any([content, complaint_category, reply]):
             raise ValueError("至少需要提供一个更新字段")
 
-        updates = []
-        params = []
+        values = {}
         if content is not None:
-            updates.append("content = ?")
-            params.append(content)
+            values["content"] = content
         if complaint_category is not None:
-            updates.append("complaint_category = ?")
-            params.append(complaint_category)
+            values["complaint_category"] = complaint_category
         if reply is not None:
-            updates.append("reply = ?")
-            params.append(reply)
-
-        params.append(complaint_id)
-
-        with self.db_connection() as conn:
-            cursor = conn.cursor()
-            set_clause = ", ".join(updates)
-            query = f"""
-                UPDATE complaints
-                SET {set_clause}
-                WHERE id = ?
-            """
-            cursor.execute(query, params)
-            conn.commit()
-            return cursor.rowcount > 0
+            values["reply"] = reply
+
+        with self._transaction() as conn:
+            result = conn.execute(
+                update(COMPLAINTS).where(COMPLAINTS.c.id == complaint_id).values(values)
+            )
+        if result.rowcount > 0:
+            notify_external_write(target=self.engine)
+        return result.rowcount > 0
 
     def delete_complaint(self, complaint_id: int) -> bool:
         """删除投诉记录"""
-        with self.db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM complaints WHERE id = ?", (complaint_id,))
-            conn.commit()
-            return cursor.rowcount > 0
+        with self._transaction() as conn:
+            result = conn.execute(delete(COMPLAINTS).where(COMPLAINTS.c.id == complaint_id))
+        if result.rowcount > 0:
+            notify_external_write(target=self.engine)
+        return result.rowcount > 0
@@ -0,0 +1,269 @@
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Protocol, Tuple
+
+from services.resilience import CallTimeoutError, ResiliencePolicy
+from utils.config import LOCAL_LLM_CONFIG
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+LOCAL_BATCH_SIZE = REGISTRY.histogram(
+    "local_llm_batch_size",
+    "本地模型每批合并生成的请求数（去重后）",
+    buckets=(1, 2, 4, 8, 16, 32),
+)
+LOCAL_FALLBACKS = REGISTRY.counter(
+    "llm_local_fallbacks_total", "远程模型调用失败后改用本地模型的次数", ("chain", "reason")
+)
+
+
+class LocalBackend(Protocol):
+    """本地推理后端：一次生成一批提示词的结果，调用方保证同一时刻只有一个批次"""
+
+    def generate_batch(self, prompts: List[str], max_tokens: int) -> List[str]: ...
+
+
+def default_threads() -> int:
+    """推理线程数：本进程可用的核数（遵守 CPU 亲和性限制）按工作进程数均分"""
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+    workers = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+    return max(1, cores // workers)
+
+
+class LlamaCppBackend:
+    """通过 llama-cpp-python 在 CPU 上运行 GGUF 量化模型
+
+    llama.cpp 的单个上下文不能并发使用，批内请求依次生成；
+    启用提示词缓存后，共用同一提示词模板前缀的请求复用已计算的 KV 缓存。
+    """
+
+    def __init__(self, model_path: str, threads: int, context_size: int):
+        try:
+            from llama_cpp import Llama, LlamaRAMCache
+        except ImportError as e:
+            raise RuntimeError("使用 GGUF 本地模型需要安装 llama-cpp-python") from e
+
+        self.llm = Llama(
+            model_path=model_path,
+            n_ctx=context_size,
+            n_threads=threads,
+            n_threads_batch=threads,
+            verbose=False,
+        )
+        self.llm.set_cache(LlamaRAMCache())
+
+    def generate_batch(self, prompts: List[str], max_tokens: int) -> List[str]:
+        results = []
+        for prompt in prompts:
+            response = self.llm.create_chat_completion(
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=max_tokens,
+                temperature=0,
+            )
+            results.append(response["choices"][0]["message"]["content"] or "")
+        return results
+
+
+class ChatModelBackend:
+    """任意 LangChain 聊天模型，一批提示词通过 batch 一次提交"""
+
+    def __init__(self, model: Any):
+        self.model = model
+
+    @classmethod
+    def from_spec(cls, spec: str, max_tokens: int) -> "ChatModelBackend":
+        """按 "提供方:模型名" 创建，如 "ollama:qwen2.5:0.5b"，需安装对应的 LangChain 集成包"""
+        from langchain.chat_models import init_chat_model
+
+        return cls(init_chat_model(spec, temperature=0, max_tokens=max_tokens))
+
+    def generate_batch(self, prompts: List[str], max_tokens: int) -> List[str]:
+        messages = self.model.batch(prompts)
+        return [getattr(m, "content", m) for m in messages]
+
+
+class LocalModel:
+    """常驻内存的本地模型，把并发到达的请求合并成批次生成
+
+    单个后台线程按顺序执行批次：CPU 推理已用满推理线程，多个批次并行只会互相争抢核心。
+    线程在首次生成时启动，多进程部署时每个工作进程各自加载模型。
+    """
+
+    def __init__(
+        self,
+        backend: LocalBackend,
+        max_tokens: int = LOCAL_LLM_CONFIG["max_tokens"],
+        max_batch: int = LOCAL_LLM_CONFIG["max_batch"],
+        batch_wait: float = LOCAL_LLM_CONFIG["batch_wait"],
+    ):
+        self.backend = backend
+        self.max_tokens = max_tokens
+        self.max_batch = max_batch
+        self.batch_wait = batch_wait
+        self._queue: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="local-llm", daemon=True
+                )
+                self._thread.start()
+
+    def submit(self, prompt: str) -> Future:
+        self._ensure_worker()
+        future: Future = Future()
+        self._queue.put((prompt, future))
+        return future
+
+    def generate(self, prompt: str, timeout: Optional[float] = None) -> str:
+        """生成结果；超过 timeout 秒抛出 CallTimeoutError，尚未开始生成的请求不再进入批次"""
+        future = self.submit(prompt)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise CallTimeoutError(f"本地模型生成超过 {timeout} 秒截止时间") from None
+
+    def warmup(self):
+        """生成一个短结果，把模型权重载入内存并初始化推理线程"""
+        start = time.perf_counter()
+        self.generate("你好")
+        logger.info("本地模型预热完成，用时 %.2f 秒", time.perf_counter() - start)
+
+    def _collect(self) -> List[Tuple[str, Future]]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.batch_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(
+                    self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                )
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            # 相同的提示词只生成一次
+            pending: Dict[str, List[Future]] = {}
+            for prompt, future in batch:
+                if future.set_running_or_notify_cancel():
+                    pending.setdefault(prompt, []).append(future)
+            if not pending:
+                continue
+            prompts = list(pending)
+            LOCAL_BATCH_SIZE.observe(len(prompts))
+            try:
+                results = self.backend.generate_batch(prompts, self.max_tokens)
+            except Exception as e:
+                logger.error("本地模型生成失败: %s", e)
+                for futures in pending.values():
+                    for future in futures:
+                        future.set_exception(e)
+                continue
+            for prompt, result in zip(prompts, results):
+                for future in pending[prompt]:
+                    future.set_result(result)
+            if len(results) < len(prompts):
+                # 后端返回的结果少于提示词时，没有结果的请求明确失败，不让调用方一直等待
+                logger.error("本地模型返回 %d 条结果，少于 %d 条提示词", len(results), len(prompts))
+                error = RuntimeError("本地模型未返回该提示词的结果")
+                for prompt in prompts[len(results):]:
+                    for future in pending[prompt]:
+                        future.set_exception(error)
+
+
+class LocalChain:
+    """用本地模型执行提示词模板，接口与 Runnable.invoke 一致
+
+    input 为字典时按键填充模板，否则填充 input_key 对应的占位符。
+    超过 timeout 秒未生成时抛出 CallTimeoutError，调用方回退到正则分类和模板回复。
+    """
+
+    # 本地模型不产生 LangChain 回调，InstrumentedChain 无需挂载 token 统计
+    accepts_callbacks = False
+
+    def __init__(
+        self, model: LocalModel, template: str, input_key: str, timeout: Optional[float] = None
+    ):
+        self.model = model
+        self.template = template
+        self.input_key = input_key
+        self.timeout = timeout
+
+    def invoke(self, input: Any, config: Optional[Dict[str, Any]] = None) -> str:
+        values = input if isinstance(input, dict) else {self.input_key: input}
+        return self.model.generate(self.template.format(**values), self.timeout)
+
+
+def local_timeout() -> float:
+    """本地生成的截止时间：LOCAL_LLM_TIMEOUT，未设置时与远程调用的 LLM_TIMEOUT 相同"""
+    value = _config("timeout", "LOCAL_LLM_TIMEOUT")
+    return ResiliencePolicy.from_env().timeout if value is None else float(value)
+
+
+def _config(name: str, env: str) -> Any:
+    value = os.getenv(env)
+    return LOCAL_LLM_CONFIG[name] if value in (None, "") else value
+
+
+_LOAD_LOCK = threading.Lock()
+
+
+def get_local_model() -> Optional[LocalModel]:
+    """进程内共享的本地模型；未配置 LOCAL_MODEL_PATH 或 LOCAL_CHAT_MODEL 时返回 None"""
+    # 预热线程和首个请求可能同时加载，加锁保证模型只加载一次
+    with _LOAD_LOCK:
+        return _load_local_model()
+
+
+@lru_cache(maxsize=1)
+def _load_local_model() -> Optional[LocalModel]:
+    model_path = _config("model_path", "LOCAL_MODEL_PATH")
+    chat_model = _config("chat_model", "LOCAL_CHAT_MODEL")
+    max_tokens = int(_config("max_tokens", "LOCAL_LLM_MAX_TOKENS"))
+    if model_path:
+        threads = int(_config("threads", "LOCAL_LLM_THREADS")) or default_threads()
+        logger.info("加载本地模型 %s，推理线程数 %d", model_path, threads)
+        backend: LocalBackend = LlamaCppBackend(
+            model_path, threads, int(_config("context_size", "LOCAL_LLM_CONTEXT"))
+        )
+    elif chat_model:
+        logger.info("使用本地聊天模型 %s", chat_model)
+        backend = ChatModelBackend.from_spec(chat_model, max_tokens)
+    else:
+        return None
+    return LocalModel(
+        backend,
+        max_tokens=max_tokens,
+        max_batch=int(_config("max_batch", "LOCAL_LLM_MAX_BATCH")),
+        batch_wait=float(_config("batch_wait", "LOCAL_LLM_BATCH_WAIT")),
+    )
+
+
+def start_warmup():
+    """在后台线程加载并预热本地模型，不阻塞服务启动"""
+
+    def warm():
+        try:
+            model = get_local_model()
+            if model is not None:
+                model.warmup()
+        except Exception:
+            logger.exception("本地模型加载失败")
+
+    threading.Thread(target=warm, name="local-llm-warmup", daemon=True).start()
@@ -0,0 +1,214 @@
+import logging
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, List
+
+from services.dispatcher import estimate_tokens
+from utils.config import PROMPT_BOILERPLATE_PATTERNS, PROMPT_BUDGET_CONFIG
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+PROMPT_TEXT_TOKENS = REGISTRY.histogram(
+    "llm_prompt_text_tokens",
+    "填入提示词的投诉文本 token 数，按清理截断前（raw）和后（fitted）区分",
+    ("chain", "stage"),
+    buckets=TOKEN_BUCKETS,
+)
+PROMPT_TRUNCATIONS = REGISTRY.counter(
+    "llm_prompt_truncations_total", "超出预算被截断的投诉文本数", ("chain",)
+)
+
+OMITTED_MARK = "……（中间省略）……"
+
+_ZERO_WIDTH = re.compile("[\u200b-\u200d\u2060\ufeff]")
+_SPACES = re.compile("[ \t\u00a0\u3000]+")
+_BLANK_LINES = re.compile(r"\n{3,}")
+_DIGITS = re.compile(r"\d+")
+_SENTENCE = re.compile(r"(?<=[。！？!?；;])")
+# 连续重复 4 次以上的短片段（如"急急急急急"、"！！！！！！"）只保留 3 次，不处理数字
+_RUN = re.compile(r"(\D{1,8}?)\1{3,}")
+
+
+class Tokenizer:
+    """本地分词器：优先使用 tiktoken 编码，不可用时按字节数估算（与调度器一致）"""
+
+    def __init__(self, encoding: Any = None):
+        self.encoding = encoding
+
+    def count(self, text: str) -> int:
+        if self.encoding is None:
+            return estimate_tokens(text)
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def head(self, text: str, limit: int) -> str:
+        """开头不超过 limit 个 token 的部分"""
+        if limit <= 0:
+            return ""
+        if self.encoding is None:
+            return _fit_bytes(text, limit * 3, from_end=False)
+        tokens = self.encoding.encode(text, disallowed_special=())
+        # 多字节字符可能被切在 token 边界上，去掉解码出的残缺字符
+        return self.encoding.decode(tokens[:limit]).rstrip("\ufffd")
+
+    def tail(self, text: str, limit: int) -> str:
+        """结尾不超过 limit 个 token 的部分"""
+        if limit <= 0:
+            return ""
+        if self.encoding is None:
+            return _fit_bytes(text, limit * 3, from_end=True)
+        tokens = self.encoding.encode(text, disallowed_special=())
+        return self.encoding.decode(tokens[-limit:]).lstrip("\ufffd")
+
+
+def _fit_bytes(text: str, max_bytes: int, from_end: bool) -> str:
+    chars = reversed(text) if from_end else text
+    size = 0
+    kept: List[str] = []
+    for char in chars:
+        size += len(char.encode("utf-8"))
+        if size > max_bytes:
+            break
+        kept.append(char)
+    return "".join(reversed(kept)) if from_end else "".join(kept)
+
+
+@lru_cache(maxsize=4)
+def get_tokenizer(name: str) -> Tokenizer:
+    """按编码名加载 tiktoken 分词器；首次使用需下载编码文件，
+    离线部署可预先放入 TIKTOKEN_CACHE_DIR，或设置 PROMPT_TOKENIZER=estimate 直接估算"""
+    if name == "estimate":
+        return Tokenizer()
+    try:
+        import tiktoken
+
+        return Tokenizer(tiktoken.get_encoding(name))
+    except Exception as e:
+        logger.warning("加载分词器 %s 失败，按字节数估算 token: %s", name, e)
+        return Tokenizer()
+
+
+def normalize_whitespace(text: str) -> str:
+    """去掉零宽字符，合并行内空白，去掉行首尾空白并合并多余空行"""
+    text = _ZERO_WIDTH.sub("", text.replace("\r\n", "\n").replace("\r", "\n"))
+    lines = [_SPACES.sub(" ", line).strip() for line in text.split("\n")]
+    return _BLANK_LINES.sub("\n\n", "\n".join(lines)).strip()
+
+
+def strip_boilerplate(text: str, patterns: List[re.Pattern]) -> str:
+    for pattern in patterns:
+        text = pattern.sub("", text)
+    return text
+
+
+def collapse_repetition(text: str, max_repeat: int) -> str:
+    """相同的行和句子最多保留 max_repeat 次，连续省略的行合并为一条说明
+
+    比较时忽略数字，只有时间戳、序号不同的日志行视为相同。
+    """
+    seen_lines: Counter = Counter()
+    seen_sentences: Counter = Counter()
+    lines: List[str] = []
+    omitted = 0
+    for line in text.split("\n"):
+        key = _DIGITS.sub("#", line)
+        if line:
+            seen_lines[key] += 1
+        if line and seen_lines[key] > max_repeat:
+            omitted += 1
+            continue
+        if omitted:
+            lines.append(f"（省略{omitted}行重复内容）")
+            omitted = 0
+        sentences = []
+        for sentence in _SENTENCE.split(line):
+            key = _DIGITS.sub("#", sentence)
+            seen_sentences[key] += 1
+            if seen_sentences[key] <= max_repeat:
+                sentences.append(sentence)
+        lines.append(_RUN.sub(r"\1\1\1", "".join(sentences)))
+    if omitted:
+        lines.append(f"（省略{omitted}行重复内容）")
+    return "\n".join(lines)
+
+
+@dataclass
+class PromptBudget:
+    """填入提示词前清理投诉文本并按处理链截断到 token 预算
+
+    只处理模板中的可变部分：模板固定在前、文本在后，截断不影响提示词前缀，
+    模型服务端的提示词缓存仍能命中。
+    """
+
+    budgets: Dict[str, int] = field(
+        default_factory=lambda: dict(PROMPT_BUDGET_CONFIG["budgets"])
+    )
+    tokenizer_name: str = PROMPT_BUDGET_CONFIG["tokenizer"]
+    max_repeat: int = PROMPT_BUDGET_CONFIG["max_repeat"]
+    head_ratio: float = PROMPT_BUDGET_CONFIG["head_ratio"]
+    boilerplate: List[re.Pattern] = field(
+        default_factory=lambda: list(PROMPT_BOILERPLATE_PATTERNS)
+    )
+
+    @classmethod
+    def from_env(cls) -> "PromptBudget":
+        """从环境变量读取预算，如 PROMPT_BUDGET_CLASSIFICATION=128，未设置的项使用配置默认值"""
+        budgets = {
+            chain: int(os.getenv(f"PROMPT_BUDGET_{chain.upper()}", budget))
+            for chain, budget in PROMPT_BUDGET_CONFIG["budgets"].items()
+        }
+        return cls(
+            budgets=budgets,
+            tokenizer_name=os.getenv("PROMPT_TOKENIZER", cls.tokenizer_name),
+            max_repeat=int(os.getenv("PROMPT_MAX_REPEAT", cls.max_repeat)),
+        )
+
+    @property
+    def tokenizer(self) -> Tokenizer:
+        return get_tokenizer(self.tokenizer_name)
+
+    def clean(self, text: str) -> str:
+        """清理投诉文本：删除固定内容、合并空白和重复内容"""
+        text = normalize_whitespace(strip_boilerplate(text, self.boilerplate))
+        return normalize_whitespace(collapse_repetition(text, self.max_repeat))
+
+    def fit(self, chain: str, text: str, clean: bool = True) -> str:
+        """清理并截断 chain 使用的文本，记录处理前后的 token 数
+
+        clean 为 False 时只合并空白，用于查询语句等不能改写内容的输入。
+        清理后为空时返回只合并空白的原文，避免向模型发送空内容。
+        """
+        tokenizer = self.tokenizer
+        raw_tokens = tokenizer.count(text)
+        fitted = normalize_whitespace(text)
+        if clean:
+            fitted = self.clean(text) or fitted
+        budget = self.budgets.get(chain, 0)
+        tokens = tokenizer.count(fitted)
+        if budget > 0 and tokens > budget:
+            fitted = self._truncate(fitted, budget)
+            tokens = tokenizer.count(fitted)
+            PROMPT_TRUNCATIONS.inc(chain=chain)
+        PROMPT_TEXT_TOKENS.observe(raw_tokens, chain=chain, stage="raw")
+        PROMPT_TEXT_TOKENS.observe(tokens, chain=chain, stage="fitted")
+        if tokens < raw_tokens:
+            logger.debug("%s 提示词文本 %d -> %d tokens", chain, raw_tokens, tokens)
+        return fitted
+
+    def _truncate(self, text: str, budget: int) -> str:
+        """保留开头和结尾，中间替换为省略说明；投诉的诉求通常在开头，结尾常是补充说明"""
+        tokenizer = self.tokenizer
+        available = budget - tokenizer.count(OMITTED_MARK)
+        if available <= 0:
+            return tokenizer.head(text, budget)
+        head = int(available * self.head_ratio)
+        return (
+            tokenizer.head(text, head).rstrip()
+            + OMITTED_MARK
+            + tokenizer.tail(text, available - head).lstrip()
+        )
+
@@ -0,0 +1,274 @@
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, Optional
+
+from utils.config import LLM_RESILIENCE_CONFIG
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitOpenError(RuntimeError):
+    """熔断器处于打开状态，调用被直接拒绝"""
+
+
+class CallTimeoutError(TimeoutError):
+    """单次调用超过截止时间"""
+
+
+@dataclass
+class ResiliencePolicy:
+    """LLM调用的超时、重试与对冲策略"""
+
+    timeout: float = LLM_RESILIENCE_CONFIG["timeout"]
+    max_retries: int = LLM_RESILIENCE_CONFIG["max_retries"]
+    backoff_base: float = LLM_RESILIENCE_CONFIG["backoff_base"]
+    backoff_max: float = LLM_RESILIENCE_CONFIG["backoff_max"]
+    hedge_delay: Optional[float] = LLM_RESILIENCE_CONFIG["hedge_delay"]
+
+    @classmethod
+    def from_env(cls) -> "ResiliencePolicy":
+        """从环境变量读取策略，未设置的项使用配置默认值"""
+        hedge_delay = os.getenv("LLM_HEDGE_DELAY")
+        return cls(
+            timeout=float(os.getenv("LLM_TIMEOUT", cls.timeout)),
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", cls.max_retries)),
+            backoff_base=float(os.getenv("LLM_BACKOFF_BASE", cls.backoff_base)),
+            backoff_max=float(os.getenv("LLM_BACKOFF_MAX", cls.backoff_max)),
+            hedge_delay=float(hedge_delay) if hedge_delay else cls.hedge_delay,
+        )
+
+    def backoff(self, attempt: int) -> float:
+        """计算第attempt次重试前的等待时间（指数退避 + 全抖动）"""
+        ceiling = min(self.backoff_max, self.backoff_base * (2**attempt))
+        return random.uniform(0, ceiling)
+
+
+class CircuitBreaker:
+    """基于滑动窗口错误率的熔断器
+
+    closed: 正常放行；错误率超过阈值后进入 open，直接拒绝调用；
+    open 持续 reset_timeout 秒后进入 half-open，只放行一个探测请求，
+    探测成功则恢复 closed，失败则重新 open。
+    """
+
+    def __init__(
+        self,
+        failure_rate: float = LLM_RESILIENCE_CONFIG["breaker_failure_rate"],
+        window: int = LLM_RESILIENCE_CONFIG["breaker_window"],
+        min_calls: int = LLM_RESILIENCE_CONFIG["breaker_min_calls"],
+        reset_timeout: float = LLM_RESILIENCE_CONFIG["breaker_reset_timeout"],
+    ):
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self._state = "closed"
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def _maybe_half_open(self):
+        if (
+            self._state == "open"
+            and time.monotonic() - self._opened_at >= self.reset_timeout
+        ):
+            self._state = "half_open"
+            self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        """判断当前是否允许发起调用"""
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == "closed":
+                return True
+            if self._state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state == "half_open":
+                logger.info("熔断器探测成功，恢复为 closed")
+                self._state = "closed"
+                self._outcomes.clear()
+            self._outcomes.append(True)
+
+    def record_failure(self):
+        with self._lock:
+            if self._state == "half_open":
+                self._trip()
+                return
+            self._outcomes.append(False)
+            failures = self._outcomes.count(False)
+            if (
+                len(self._outcomes) >= self.min_calls
+                and failures / len(self._outcomes) >= self.failure_rate
+            ):
+                self._trip()
+
+    def _trip(self):
+        logger.warning("LLM错误率过高，熔断器打开 %.0f 秒", self.reset_timeout)
+        self._state = "open"
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+        self._outcomes.clear()
+
+    def reset(self):
+        with self._lock:
+            self._state = "closed"
+            self._outcomes.clear()
+            self._probe_in_flight = False
+
+
+# 熔断器按模型端点共享：ComplaintAnalyzer 每个请求都会重新创建，
+# 熔断状态必须跨实例保存才有意义
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+# 用于执行带截止时间的调用；超时的调用在后台自然结束，不阻塞请求线程
+_executor = ThreadPoolExecutor(
+    max_workers=LLM_RESILIENCE_CONFIG["max_workers"], thread_name_prefix="llm-call"
+)
+
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    """获取（必要时创建）指定名称的共享熔断器"""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker()
+        return breaker
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """判断异常是否值得重试：超时、连接错误、429 和 5xx 可重试，
+    解析错误及其它 4xx 说明请求本身有问题，重试无益"""
+    if isinstance(exc, CircuitOpenError):
+        return False
+    status_code = getattr(exc, "status_code", None)
+    if isinstance(status_code, int):
+        return status_code in (408, 429) or status_code >= 500
+    return not isinstance(exc, (ValueError, TypeError, KeyError))
+
+
+class ResilientChain:
+    """为 LangChain 处理链增加截止时间、有界重试、熔断和对冲请求
+
+    对外保持与被包装链相同的 invoke 接口，调用方原有的异常回退逻辑
+    （正则分类、模板回复）在熔断或超时时直接生效。
+
+    admit(input, wait) 在每次请求（包括重试和对冲请求）发出前调用，用于向调度器申请配额：
+    重试前在截止时间之外排队，排队被丢弃时直接抛出、不计入熔断；
+    对冲请求以 wait=False 调用，返回 False（配额不能立即满足）时不发出对冲请求。
+    """
+
+    def __init__(
+        self,
+        chain: Any,
+        name: str,
+        breaker: Optional[CircuitBreaker] = None,
+        policy: Optional[ResiliencePolicy] = None,
+        admit: Optional[Callable[[Any, bool], bool]] = None,
+    ):
+        self.chain = chain
+        self.name = name
+        self.breaker = breaker or CircuitBreaker()
+        self.policy = policy or ResiliencePolicy()
+        self.admit = admit
+
+    def invoke(self, input: Any, config: Optional[Dict[str, Any]] = None) -> Any:
+        last_error: Optional[BaseException] = None
+        for attempt in range(self.policy.max_retries + 1):
+            if self.admit is not None:
+                # 熔断器打开时不占用配额；先排队再占用半开状态的探测名额，
+                # 排队被丢弃时探测名额不会一直被占用
+                if self.breaker.state == "open":
+                    raise CircuitOpenError(f"{self.name}: 熔断器已打开，跳过LLM调用")
+                self.admit(input, True)
+            if not self.breaker.allow():
+                raise CircuitOpenError(f"{self.name}: 熔断器已打开，跳过LLM调用")
+            try:
+                result = self._call_with_deadline(
+                    lambda: self.chain.invoke(input, config=config),
+                    lambda: self.admit is None or self.admit(input, False),
+                )
+            except Exception as e:
+                last_error = e
+                if not is_retryable(e):
+                    # 请求本身无效，不计入端点错误率
+                    self.breaker.record_success()
+                    raise
+                self.breaker.record_failure()
+                if attempt < self.policy.max_retries:
+                    delay = self.policy.backoff(attempt)
+                    logger.warning(
+                        "%s 调用失败(第%d次): %s，%.2f秒后重试",
+                        self.name,
+                        attempt + 1,
+                        e,
+                        delay,
+                    )
+                    time.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+        assert last_error is not None
+        raise last_error
+
+    def _call_with_deadline(
+        self, fn: Callable[[], Any], admit_hedge: Callable[[], bool] = lambda: True
+    ) -> Any:
+        """在截止时间内执行调用，启用对冲时在延迟后并发发出第二个请求"""
+        deadline = time.monotonic() + self.policy.timeout
+        futures = [_submit(fn)]
+        hedge_delay = self.policy.hedge_delay
+        if hedge_delay is not None and hedge_delay < self.policy.timeout:
+            done, _ = wait(futures, timeout=hedge_delay)
+            if not done:
+                if admit_hedge():
+                    logger.debug("%s 超过 %.2f 秒未返回，发出对冲请求", self.name, hedge_delay)
+                    futures.append(_submit(fn))
+                else:
+                    logger.debug("%s 配额不足，不发出对冲请求", self.name)
+
+        pending = set(futures)
+        error: Optional[BaseException] = None
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                exc = future.exception()
+                if exc is None:
+                    _cancel(pending)
+                    return future.result()
+                error = exc
+        _cancel(pending)
+        if error is not None and not pending:
+            raise error
+        raise CallTimeoutError(f"{self.name}: 调用超过 {self.policy.timeout} 秒截止时间")
+
+
+def _submit(fn: Callable[[], Any]):
+    # 复制调用方上下文，保证请求级上下文变量在工作线程中可见
+    return _executor.submit(contextvars.copy_context().run, fn)
+
+
+def _cancel(futures):
+    for future in futures:
+        future.cancel()
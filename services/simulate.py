@@ -0,0 +1,236 @@
+import argparse
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from pydantic import BaseModel, Field, model_validator
+from sqlalchemy.engine import Engine
+
+from utils.config import SIMULATION_CONFIG
+from utils.db import INSERT_COLUMNS, bulk_write, notify_external_write
+
+logger = logging.getLogger(__name__)
+
+# 接口单次生成的条数上限
+SIMULATE_API_MAX_COUNT = int(
+    os.getenv("SIMULATE_API_MAX_COUNT", SIMULATION_CONFIG["api_max_count"])
+)
+
+# (complaint_time, content, user_id, complaint_category, reply)
+Row = Tuple[str, str, str, str, Optional[str]]
+
+
+class SimulationSpec(BaseModel):
+    """批量模拟数据的生成参数"""
+
+    count: int = Field(..., gt=0, le=50_000_000, description="生成条数")
+    start: Optional[datetime] = Field(None, description="起始时间，默认结束时间前30天")
+    end: Optional[datetime] = Field(None, description="结束时间，默认当前时间")
+    category_weights: Optional[Dict[str, float]] = Field(
+        None, description="各分类权重，默认均匀分布"
+    )
+    user_cardinality: int = Field(1000, gt=0, description="不同用户数")
+    reply_rate: float = Field(0.3, ge=0, le=1, description="有回复的比例")
+    seed: Optional[int] = Field(None, description="随机种子，相同种子生成相同数据")
+    batch_size: int = Field(50_000, gt=0, le=1_000_000, description="每批条数")
+
+    @model_validator(mode="after")
+    def _check(self):
+        if self.category_weights:
+            unknown = set(self.category_weights) - set(SIMULATION_CONFIG["categories"])
+            if unknown:
+                raise ValueError(f"未知分类: {', '.join(sorted(unknown))}")
+            if sum(self.category_weights.values()) <= 0:
+                raise ValueError("分类权重之和必须大于0")
+        if self.start and self.end and self.start >= self.end:
+            raise ValueError("起始时间必须早于结束时间")
+        return self
+
+    def time_range(self) -> Tuple[datetime, datetime]:
+        end = self.end or datetime.now()
+        start = self.start or end - timedelta(days=30)
+        return start, end
+
+
+def _content_table() -> Tuple[List[str], List[np.ndarray]]:
+    """预先拼好每个分类下所有问题的投诉文本，生成时只需按下标取值"""
+    categories = list(SIMULATION_CONFIG["categories"])
+    contents = []
+    for category in categories:
+        problems = SIMULATION_CONFIG["problems"][category]
+        contents.append(
+            np.array(
+                [f"我的{category}{p}" if category != "其它" else p for p in problems],
+                dtype=object,
+            )
+        )
+    return categories, contents
+
+
+def generate_batches(spec: SimulationSpec) -> Iterator[List[Row]]:
+    """按批生成模拟投诉，每批内部使用 NumPy 向量化抽样
+
+    时间范围按批次均分，批内时间排序，生成的数据整体按时间递增。
+    """
+    rng = np.random.default_rng(spec.seed)
+    categories, contents = _content_table()
+    weights = np.array(
+        [
+            (spec.category_weights or {}).get(c, 0.0 if spec.category_weights else 1.0)
+            for c in categories
+        ],
+        dtype=float,
+    )
+    weights /= weights.sum()
+    replies = np.array([r for r in SIMULATION_CONFIG["replies"] if r], dtype=object)
+    width = max(4, len(str(spec.user_cardinality)))
+
+    start, end = spec.time_range()
+    start_us = np.datetime64(start, "us").astype(np.int64)
+    span_us = np.datetime64(end, "us").astype(np.int64) - start_us
+
+    produced = 0
+    while produced < spec.count:
+        n = min(spec.batch_size, spec.count - produced)
+        lo = start_us + span_us * produced // spec.count
+        hi = start_us + span_us * (produced + n) // spec.count
+        stamps = np.sort(rng.integers(lo, max(hi, lo + 1), size=n))
+        times = np.char.replace(
+            np.datetime_as_string(stamps.astype("datetime64[us]"), unit="us"), "T", " "
+        )
+
+        category_idx = rng.choice(len(categories), size=n, p=weights)
+        content = np.empty(n, dtype=object)
+        category = np.empty(n, dtype=object)
+        for i, name in enumerate(categories):
+            mask = category_idx == i
+            hits = int(mask.sum())
+            if hits:
+                content[mask] = contents[i][rng.integers(0, len(contents[i]), size=hits)]
+                category[mask] = name
+
+        user_ids = np.char.add(
+            "user_",
+            np.char.zfill(
+                rng.integers(1, spec.user_cardinality + 1, size=n).astype(str), width
+            ),
+        )
+
+        reply = np.full(n, None, dtype=object)
+        reply_mask = rng.random(n) < spec.reply_rate
+        reply[reply_mask] = replies[rng.integers(0, len(replies), size=int(reply_mask.sum()))]
+
+        yield list(
+            zip(times.tolist(), content.tolist(), user_ids.tolist(), category.tolist(), reply.tolist())
+        )
+        produced += n
+
+
+def bulk_insert(
+    engine: Engine, spec: SimulationSpec, rows_per_transaction: int = 500_000
+) -> int:
+    """生成并批量写入数据库，在大事务中提交，返回写入条数
+
+    PostgreSQL 上使用 COPY，其它数据库使用 executemany。
+    """
+    inserted = 0
+    uncommitted = 0
+    conn = engine.connect()
+    try:
+        trans = conn.begin()
+        for batch in generate_batches(spec):
+            bulk_write(conn, batch, INSERT_COLUMNS)
+            inserted += len(batch)
+            uncommitted += len(batch)
+            if uncommitted >= rows_per_transaction:
+                trans.commit()
+                trans = conn.begin()
+                uncommitted = 0
+        trans.commit()
+    finally:
+        conn.close()
+        notify_external_write("bulk", inserts_only=True, target=engine)
+    logger.info("批量写入 %d 条模拟投诉", inserted)
+    return inserted
+
+
+def write_jsonl(path: str, spec: SimulationSpec) -> int:
+    """生成数据并写入 JSONL 文件，格式与 services/fetch.py 的导入格式一致"""
+    written = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for batch in generate_batches(spec):
+            f.writelines(
+                json.dumps(
+                    {
+                        "complaint_time": row[0][:19],
+                        "content": row[1],
+                        "user_id": row[2],
+                        "complaint_category": row[3],
+                        "reply": row[4],
+                    },
+                    ensure_ascii=False,
+                )
+                + "\n"
+                for row in batch
+            )
+            written += len(batch)
+    logger.info("写入 %d 条模拟投诉到 %s", written, path)
+    return written
+
+
+def _parse_weights(value: str) -> Dict[str, float]:
+    weights = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        weights[name.strip()] = float(weight)
+    return weights
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="生成大规模模拟投诉数据")
+    parser.add_argument("--count", type=int, required=True)
+    parser.add_argument("--start", type=datetime.fromisoformat)
+    parser.add_argument("--end", type=datetime.fromisoformat)
+    parser.add_argument(
+        "--categories", type=_parse_weights, help="分类权重，如 手机=0.4,宽带=0.3"
+    )
+    parser.add_argument("--users", type=int, default=1000, help="不同用户数")
+    parser.add_argument("--reply-rate", type=float, default=0.3)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--batch-size", type=int, default=50_000)
+    parser.add_argument("--jsonl", help="写入JSONL文件而不是数据库")
+    parser.add_argument("--db-url", help="目标数据库，默认使用应用配置")
+    args = parser.parse_args(argv)
+
+    spec = SimulationSpec(
+        count=args.count,
+        start=args.start,
+        end=args.end,
+        category_weights=args.categories,
+        user_cardinality=args.users,
+        reply_rate=args.reply_rate,
+        seed=args.seed,
+        batch_size=args.batch_size,
+    )
+    started = time.perf_counter()
+    if args.jsonl:
+        count = write_jsonl(args.jsonl, spec)
+    else:
+        from utils.db import create_app_engine, engine, init_schema
+
+        target = create_app_engine(args.db_url) if args.db_url else engine
+        init_schema(target)
+        count = bulk_insert(target, spec)
+    elapsed = time.perf_counter() - started
+    print(f"生成 {count} 条，用时 {elapsed:.2f} 秒（{count / elapsed:,.0f} 条/秒）")
+
+
+if __name__ == "__main__":
+    from utils.logging import configure_logging
+
+    configure_logging()
+    main()
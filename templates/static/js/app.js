@@ -1,75 +1,290 @@
 const API_BASE = 'http://localhost:8000';
 
+// 每次滚动加载的条数（使用按列的紧凑格式）
+const PAGE_SIZE = 1000;
+// 表格固定行高，初始值与 style.css 一致，首次渲染后按实际高度校正
+let rowHeight = 42;
+// 可视区域上下额外渲染的行数，减少快速滚动时的空白
+const OVERSCAN = 10;
+// 距离底部不足该行数时加载下一页
+const PREFETCH_ROWS = 50;
+
+// 表格数据全部保存在数组中，DOM 只渲染可视区域内的行
+let complaints = [];
+let indexById = new Map();
+let hasMore = false;
+let loadingPage = false;
+let loadGeneration = 0;
+let renderedRange = [-1, -1];
+let pendingTableRender = false;
+
+let categoryCounts = {};
+let showingSearch = false;
+let feedConnected = false;
+let pendingChartRender = false;
+
+function escapeHtml(value) {
+    return String(value ?? '').replace(/[&<>"']/g, ch => ({
+        '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'
+    })[ch]);
+}
+
+function complaintRowHtml(complaint, index) {
+    const time = new Date(complaint.complaint_time).toLocaleString();
+    return `<tr data-index="${index}">`
+        + `<td>${escapeHtml(complaint.complaint_category)}</td>`
+        + `<td>${escapeHtml(complaint.user_id)}</td>`
+        + `<td>${escapeHtml(time)}</td>`
+        + `<td title="${escapeHtml(complaint.content)}">${escapeHtml(complaint.content)}</td>`
+        + `<td>${escapeHtml(complaint.reply || '未回复')}</td>`
+        + `<td><button data-action="view">查看</button></td>`
+        + `</tr>`;
+}
+
+function spacerRowHtml(height) {
+    return height > 0 ? `<tr class="spacer-row" style="height:${height}px"><td colspan="6"></td></tr>` : '';
+}
+
+function renderVisibleRows(force = false) {
+    const container = document.querySelector('.complaint-table-container');
+    const tbody = document.getElementById('complaintList');
+    const headerHeight = container.querySelector('thead').offsetHeight;
+    const scrollTop = Math.max(0, container.scrollTop - headerHeight);
+    const start = Math.max(0, Math.floor(scrollTop / rowHeight) - OVERSCAN);
+    const end = Math.min(
+        complaints.length,
+        Math.ceil((scrollTop + container.clientHeight) / rowHeight) + OVERSCAN
+    );
+    if (!force && start === renderedRange[0] && end === renderedRange[1]) return;
+    renderedRange = [start, end];
+
+    let html = spacerRowHtml(start * rowHeight);
+    for (let i = start; i < end; i++) {
+        html += complaintRowHtml(complaints[i], i);
+    }
+    html += spacerRowHtml((complaints.length - end) * rowHeight);
+    tbody.innerHTML = html;
+
+    const firstRow = tbody.querySelector('tr[data-index]');
+    if (firstRow && firstRow.offsetHeight && firstRow.offsetHeight !== rowHeight) {
+        rowHeight = firstRow.offsetHeight;
+        scheduleTableRender(true);
+    }
+    document.getElementById('loadedCount').textContent =
+        ` (已加载${complaints.length}条${hasMore ? '，滚动加载更多' : ''})`;
+}
+
+function scheduleTableRender(force = false) {
+    // 同一帧内的多次滚动或增量更新只渲染一次
+    if (force) renderedRange = [-1, -1];
+    if (pendingTableRender) return;
+    pendingTableRender = true;
+    requestAnimationFrame(() => {
+        pendingTableRender = false;
+        renderVisibleRows();
+    });
+}
+
+function reindex() {
+    indexById = new Map(complaints.map((complaint, index) => [complaint.id, index]));
+}
+
+function setComplaints(list, more) {
+    complaints = list;
+    hasMore = more;
+    reindex();
+    document.querySelector('.complaint-table-container').scrollTop = 0;
+    scheduleTableRender(true);
+}
+
+function columnsToRows(columns) {
+    const names = Object.keys(columns);
+    const count = names.length ? columns[names[0]].length : 0;
+    const rows = new Array(count);
+    for (let i = 0; i < count; i++) {
+        const row = {};
+        for (const name of names) row[name] = columns[name][i];
+        rows[i] = row;
+    }
+    return rows;
+}
+
+async function fetchPage(skip) {
+    const response = await fetch(`${API_BASE}/complaints/?skip=${skip}&limit=${PAGE_SIZE}&format=columns`);
+    if (!response.ok) throw new Error(`HTTP ${response.status}`);
+    return columnsToRows(await response.json());
+}
+
 async function loadComplaints() {
+    const generation = ++loadGeneration;
+    loadingPage = true;
     try {
-        const response = await fetch(`${API_BASE}/complaints/`);
-        const data = await response.json();
-
-        const tbody = document.getElementById('complaintList');
-        tbody.innerHTML = data.map(complaint => `
-            <tr ondblclick="showComplaintDetails('${complaint.complaint_category}', '${complaint.user_id}', '${new Date(complaint.complaint_time).toLocaleString()}', '${complaint.content.replace(/'/g, "\\'").replace(/\n/g, "\\n")}', '${complaint.reply ? complaint.reply.replace(/'/g, "\\'").replace(/\n/g, "\\n") : ''}')">
-                <td>${complaint.complaint_category}</td>
-                <td>${complaint.user_id}</td>
-                <td>${new Date(complaint.complaint_time).toLocaleString()}</td>
-                <td>${complaint.content}</td>
-                <td>${complaint.reply || '未回复'}</td>
-                <td><button onclick="showComplaintDetails('${complaint.complaint_category}', '${complaint.user_id}', '${new Date(complaint.complaint_time).toLocaleString()}', '${complaint.content.replace(/'/g, "\\'").replace(/\n/g, "\\n")}', '${complaint.reply ? complaint.reply.replace(/'/g, "\\'").replace(/\n/g, "\\n") : ''}')">查看</button></td>
-            </tr>
-        `).join('');
+        const rows = await fetchPage(0);
+        if (generation !== loadGeneration) return;
+        showingSearch = false;
+        setComplaints(rows, rows.length === PAGE_SIZE);
     } catch (error) {
         console.error('加载投诉列表失败:', error);
+    } finally {
+        if (generation === loadGeneration) loadingPage = false;
     }
 }
 
-async function loadStatistics() {
+async function loadNextPage() {
+    if (!hasMore || loadingPage || showingSearch) return;
+    const generation = loadGeneration;
+    loadingPage = true;
     try {
-        const response = await fetch(`${API_BASE}/statistics/`);
-        const data = await response.json();
+        const rows = await fetchPage(complaints.length);
+        if (generation !== loadGeneration) return;
+        for (const row of rows) {
+            // 翻页期间实时推送可能已追加过同一条记录
+            if (indexById.has(row.id)) continue;
+            indexById.set(row.id, complaints.length);
+            complaints.push(row);
+        }
+        hasMore = rows.length === PAGE_SIZE;
+        scheduleTableRender(true);
+    } catch (error) {
+        console.error('加载更多投诉失败:', error);
+    } finally {
+        if (generation === loadGeneration) loadingPage = false;
+    }
+}
 
-        const totalCount = Object.values(data).reduce((sum, count) => sum + count, 0);
-        document.getElementById('totalComplaints').textContent = ` (共${totalCount}条)`;
+function handleTableScroll() {
+    scheduleTableRender();
+    const container = document.querySelector('.complaint-table-container');
+    const remaining = container.scrollHeight - container.scrollTop - container.clientHeight;
+    if (remaining < PREFETCH_ROWS * rowHeight) loadNextPage();
+}
 
-        const chartContainer = document.getElementById('categoryChart');
-        chartContainer.innerHTML = '';
+function handleTableClick(event) {
+    const row = event.target.closest('tr[data-index]');
+    if (!row) return;
+    if (event.type === 'click' && !event.target.closest('[data-action="view"]')) return;
+    showComplaintDetails(complaints[Number(row.dataset.index)]);
+}
 
-        const categories = Object.entries(data).sort((a, b) => b[1] - a[1]);
-        const maxCount = Math.max(...categories.map(([_, count]) => count), 0);
+function renderStatistics() {
+    const totalCount = Object.values(categoryCounts).reduce((sum, count) => sum + count, 0);
+    document.getElementById('totalComplaints').textContent = ` (共${totalCount}条)`;
 
-        const chartInner = document.createElement('div');
-        chartInner.classList.add('chart-inner');
+    const chartContainer = document.getElementById('categoryChart');
+    chartContainer.innerHTML = '';
 
-        const maxLabelValue = maxCount <= 0 ? 1 : maxCount;
+    const categories = Object.entries(categoryCounts).sort((a, b) => b[1] - a[1]);
+    const maxCount = Math.max(...categories.map(([_, count]) => count), 0);
 
-        const barsContainer = document.createElement('div');
-        barsContainer.classList.add('chart-bars-container');
+    const chartInner = document.createElement('div');
+    chartInner.classList.add('chart-inner');
 
-        categories.forEach(([category, count]) => {
-            const barWrapper = document.createElement('div');
-            barWrapper.classList.add('chart-bar-wrapper');
+    const maxLabelValue = maxCount <= 0 ? 1 : maxCount;
 
-            const bar = document.createElement('div');
-            bar.classList.add('chart-bar');
-            const barHeight = (count / maxLabelValue) * (chartContainer.clientHeight - 50);
-            bar.style.height = `${barHeight}px`;
-            bar.setAttribute('data-count', count);
+    const barsContainer = document.createElement('div');
+    barsContainer.classList.add('chart-bars-container');
 
-            const label = document.createElement('div');
-            label.classList.add('chart-label');
-            label.textContent = category;
+    categories.forEach(([category, count]) => {
+        const barWrapper = document.createElement('div');
+        barWrapper.classList.add('chart-bar-wrapper');
 
-            barWrapper.appendChild(bar);
-            barWrapper.appendChild(label);
-            barsContainer.appendChild(barWrapper);
-        });
+        const bar = document.createElement('div');
+        bar.classList.add('chart-bar');
+        const barHeight = (count / maxLabelValue) * (chartContainer.clientHeight - 50);
+        bar.style.height = `${barHeight}px`;
+        bar.setAttribute('data-count', count);
+
+        const label = document.createElement('div');
+        label.classList.add('chart-label');
+        label.textContent = category;
+
+        barWrapper.appendChild(bar);
+        barWrapper.appendChild(label);
+        barsContainer.appendChild(barWrapper);
+    });
 
-        chartInner.appendChild(barsContainer);
-        chartContainer.appendChild(chartInner);
+    chartInner.appendChild(barsContainer);
+    chartContainer.appendChild(chartInner);
+}
 
+async function loadStatistics() {
+    try {
+        const response = await fetch(`${API_BASE}/statistics/`);
+        categoryCounts = await response.json();
+        renderStatistics();
     } catch (error) {
         console.error('加载统计信息失败:', error);
     }
 }
 
+function scheduleChartRender() {
+    // 同一帧内的多个增量只重绘一次图表
+    if (pendingChartRender) return;
+    pendingChartRender = true;
+    requestAnimationFrame(() => {
+        pendingChartRender = false;
+        renderStatistics();
+    });
+}
+
+function applyDelta(delta) {
+    Object.entries(delta.counts).forEach(([category, change]) => {
+        const count = (categoryCounts[category] || 0) + change;
+        if (count > 0) {
+            categoryCounts[category] = count;
+        } else {
+            delete categoryCounts[category];
+        }
+    });
+    scheduleChartRender();
+
+    // 搜索结果不随实时变更改动，点击刷新后回到完整列表
+    if (showingSearch) return;
+
+    if (delta.deleted.length) {
+        const deleted = new Set(delta.deleted);
+        complaints = complaints.filter(complaint => !deleted.has(complaint.id));
+        reindex();
+    }
+    delta.updated.forEach(updated => {
+        const index = indexById.get(updated.id);
+        if (index !== undefined) complaints[index] = updated;
+    });
+    // 还有未加载的页时新增记录会在翻到末尾时加载，这里只在已加载全部数据时追加
+    if (!hasMore) {
+        delta.inserted.forEach(inserted => {
+            if (indexById.has(inserted.id)) return;
+            indexById.set(inserted.id, complaints.length);
+            complaints.push(inserted);
+        });
+    }
+    scheduleTableRender(true);
+}
+
+function connectFeed() {
+    if (!window.EventSource) return;
+    const source = new EventSource(`${API_BASE}/events/complaints`);
+    let reconnecting = false;
+
+    source.addEventListener('open', () => {
+        // 断线重连期间可能漏掉事件，重连后全量加载一次
+        if (reconnecting) {
+            if (!showingSearch) loadComplaints();
+            loadStatistics();
+        }
+        feedConnected = true;
+    });
+    source.addEventListener('error', () => {
+        feedConnected = false;
+        reconnecting = true;
+    });
+    source.addEventListener('delta', event => applyDelta(JSON.parse(event.data)));
+    source.addEventListener('reset', () => {
+        if (!showingSearch) loadComplaints();
+        loadStatistics();
+    });
+}
+
 async function simulateData() {
     try {
         const response = await fetch(`${API_BASE}/simulate/`, {
@@ -77,8 +292,11 @@ async function simulateData() {
         });
         if (!response.ok) throw new Error('模拟数据生成失败');
         alert('成功生成10条模拟数据！');
-        await loadComplaints();
-        await loadStatistics();
+        // 实时推送已连接时由增量事件更新，无需重新加载
+        if (!feedConnected) {
+            await loadComplaints();
+            await loadStatistics();
+        }
     } catch (error) {
         alert(`错误：${error.message}`);
     }
@@ -91,7 +309,7 @@ async function handleSearch() {
 
     try {
         const [complaintsData, analysisData] = await Promise.all([
-            fetch(`${API_BASE}/complaints/?q=${encodeURIComponent(query)}`)
+            fetch(`${API_BASE}/complaints/?q=${encodeURIComponent(query)}&limit=${PAGE_SIZE}`)
                 .then(res => res.ok ? res.json() : []),
             fetch(`${API_BASE}/analyze/`, {
                 method: 'POST',
@@ -109,30 +327,22 @@ async function handleSearch() {
         // 清空查询结果区域
         outputDiv.innerHTML = '';
 
-        // 更新投诉列表
-        const tbody = document.getElementById('complaintList');
-        tbody.innerHTML = complaints.map(complaint => `
-            <tr ondblclick="showComplaintDetails('${complaint.complaint_category}', '${complaint.user_id}', '${new Date(complaint.complaint_time).toLocaleString()}', '${complaint.content.replace(/'/g, "\\'").replace(/\n/g, "\\n")}', '${complaint.reply ? complaint.reply.replace(/'/g, "\\'").replace(/\n/g, "\\n") : ''}')">
-                <td>${complaint.complaint_category}</td>
-                <td>${complaint.user_id}</td>
-                <td>${new Date(complaint.complaint_time).toLocaleString()}</td>
-                <td>${complaint.content}</td>
-                <td>${complaint.reply || '未回复'}</td>
-                <td><button onclick="showComplaintDetails('${complaint.complaint_category}', '${complaint.user_id}', '${new Date(complaint.complaint_time).toLocaleString()}', '${complaint.content.replace(/'/g, "\\'").replace(/\n/g, "\\n")}', '${complaint.reply ? complaint.reply.replace(/'/g, "\\'").replace(/\n/g, "\\n") : ''}')">查看</button></td>
-            </tr>
-        `).join('');
+        // 更新投诉列表，搜索结果只显示一页
+        showingSearch = true;
+        loadGeneration++;
+        setComplaints(complaints, false);
     } catch (error) {
         outputDiv.innerHTML = `<div class="error">查询失败: ${error.message}</div>`;
         console.error("查询失败:", error);
     }
 }
 
-function showComplaintDetails(category, userId, time, content, reply) {
-    document.getElementById('modalCategory').textContent = category;
-    document.getElementById('modalUserId').textContent = userId;
-    document.getElementById('modalTime').textContent = time;
-    document.getElementById('modalContent').textContent = content;
-    document.getElementById('modalReply').textContent = reply || '未回复';
+function showComplaintDetails(complaint) {
+    document.getElementById('modalCategory').textContent = complaint.complaint_category;
+    document.getElementById('modalUserId').textContent = complaint.user_id;
+    document.getElementById('modalTime').textContent = new Date(complaint.complaint_time).toLocaleString();
+    document.getElementById('modalContent').textContent = complaint.content;
+    document.getElementById('modalReply').textContent = complaint.reply || '未回复';
     document.getElementById('complaintModal').style.display = 'flex';
 }
 
@@ -176,9 +386,18 @@ function showAnalysisResult(analysis) {
 }
 
 document.addEventListener('DOMContentLoaded', () => {
-    // Initial data load
+    // Initial data load, then keep current via the live feed
     loadComplaints();
     loadStatistics();
+    connectFeed();
+
+    // 虚拟滚动与表格事件委托
+    const tableContainer = document.querySelector('.complaint-table-container');
+    tableContainer.addEventListener('scroll', handleTableScroll, { passive: true });
+    window.addEventListener('resize', () => scheduleTableRender(true));
+    const complaintList = document.getElementById('complaintList');
+    complaintList.addEventListener('click', handleTableClick);
+    complaintList.addEventListener('dblclick', handleTableClick);
 
     // Button listeners
     document.querySelector('.simulate-btn').addEventListener('click', simulateData);
@@ -0,0 +1,113 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeComplaintSite:
+    """本地模拟的分页投诉站点，用于测试爬虫
+
+    /page/<n> 返回第 n 页的投诉记录和下一页链接，响应带 ETag 和 Last-Modified，
+    条件请求命中时返回 304。通过 statuses 队列控制每次请求返回的错误状态码，
+    并记录请求次数、请求时间和最大并发数。
+    """
+
+    LAST_MODIFIED = "Mon, 02 Jun 2025 08:00:00 GMT"
+
+    def __init__(self, pages=5, per_page=10, delay=0.0):
+        self.pages = pages
+        self.per_page = per_page
+        self.delay = delay
+        self.statuses = []
+        self.requests = []  # (path, 开始时间, 条件请求头)
+        self.not_modified = 0
+        self.max_active = 0
+        self._active = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url(self, page):
+        return f"{self.base_url}/page/{page}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def count(self, path):
+        return sum(1 for p, _, _ in self.requests if p == path)
+
+    def page_body(self, page):
+        items = [
+            {
+                "complaint_time": f"2025-06-01 {page % 24:02d}:{i:02d}:00",
+                "content": f"第{page}页投诉{i}",
+                "user_id": f"user_{i}",
+                "complaint_category": "宽带",
+            }
+            for i in range(self.per_page)
+        ]
+        body = {"items": items}
+        if page + 1 < self.pages:
+            body["next"] = f"/page/{page + 1}"
+        return body
+
+    def _handler(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                with site._lock:
+                    site._active += 1
+                    site.max_active = max(site.max_active, site._active)
+                    site.requests.append(
+                        (self.path, time.monotonic(), self.headers.get("If-None-Match"))
+                    )
+                    status = site.statuses.pop(0) if site.statuses else 200
+                try:
+                    if site.delay:
+                        time.sleep(site.delay)
+                    self._respond(status)
+                finally:
+                    with site._lock:
+                        site._active -= 1
+
+            def _respond(self, status):
+                prefix = "/page/"
+                if not self.path.startswith(prefix) or status != 200:
+                    self.send_response(404 if status == 200 else status)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                page = int(self.path[len(prefix):])
+                etag = f'"page-{page}"'
+                if self.headers.get("If-None-Match") == etag:
+                    with site._lock:
+                        site.not_modified += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                data = json.dumps(site.page_body(page), ensure_ascii=False).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.send_header("ETag", etag)
+                self.send_header("Last-Modified", site.LAST_MODIFIED)
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
@@ -0,0 +1,135 @@
+import glob
+import importlib.util
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.orm import Session
+
+import services.archive
+from services.archive import ARCHIVE_PARTS_READ, ComplaintArchive, archive_complaints
+from utils.db import Complaint, create_app_engine, init_schema
+
+NOW = datetime(2025, 6, 15, 12, 0)
+
+
+@unittest.skipUnless(importlib.util.find_spec("pyarrow"), "未安装 pyarrow")
+class TestComplaintArchive(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.engine = create_app_engine(f"sqlite:///{os.path.join(self.tmp.name, 'test.db')}")
+        init_schema(self.engine)
+        self.archive = ComplaintArchive(os.path.join(self.tmp.name, "archive"), scan_interval=0)
+        # 2025年1月到4月每月10条，另有最近的5条
+        rows = [
+            {
+                "complaint_time": datetime(2025, month, 1 + i),
+                "content": f"{month}月投诉{i}",
+                "user_id": "user_1",
+                "complaint_category": "宽带" if i % 2 else "手机",
+            }
+            for month in range(1, 5)
+            for i in range(10)
+        ]
+        rows += [
+            {
+                "complaint_time": NOW - timedelta(days=i),
+                "content": f"最近投诉{i}",
+                "user_id": "user_2",
+                "complaint_category": "固话",
+            }
+            for i in range(5)
+        ]
+        with self.engine.begin() as conn:
+            conn.execute(insert(Complaint), rows)
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.tmp.cleanup()
+
+    def _archive(self):
+        # 早于 2025-04-01 的整月记录移入归档
+        return archive_complaints(self.engine, self.archive, max_age_days=60, now=NOW)
+
+    def test_archive_moves_whole_months(self):
+        self.assertEqual(self._archive(), 30)
+        with self.engine.connect() as conn:
+            self.assertEqual(conn.scalar(select(func.count(Complaint.id))), 15)
+        self.assertEqual(
+            [(p.month.year, p.month.month) for p in self.archive.parts()],
+            [(2025, 1), (2025, 2), (2025, 3)],
+        )
+        self.assertEqual(self._archive(), 0)
+
+    def test_concurrent_changes_not_lost(self):
+        """读取后被修改的记录留在投诉表中，被删除的记录不写入归档"""
+        move_part = services.archive._move_part
+
+        def change_then_move(engine, part, ids, fingerprints):
+            if part.month.month == 2:
+                with engine.begin() as conn:
+                    conn.execute(
+                        update(Complaint).where(Complaint.content == "2月投诉3").values(reply="已回复")
+                    )
+                    conn.execute(delete(Complaint).where(Complaint.content == "2月投诉4"))
+            return move_part(engine, part, ids, fingerprints)
+
+        with patch("services.archive._move_part", change_then_move):
+            self.assertEqual(self._archive(), 28)
+        self.assertEqual(self.archive.count(datetime(2025, 2, 1), datetime(2025, 3, 1)), 8)
+        with self.engine.connect() as conn:
+            row = conn.execute(select(Complaint).where(Complaint.content == "2月投诉3")).one()
+        self.assertEqual(row.reply, "已回复")
+        self.assertEqual(len(glob.glob(os.path.join(self.tmp.name, "archive", "**", "*.tmp"), recursive=True)), 0)
+
+        # 下次归档时移入修改后的记录
+        self.assertEqual(self._archive(), 1)
+        rows = self.archive.rows(("content", "reply"), skip=0, limit=100)
+        self.assertIn(("2月投诉3", "已回复"), [tuple(r) for r in rows])
+
+    def test_partition_pruning(self):
+        self._archive()
+        before = ARCHIVE_PARTS_READ.value(result="scanned")
+        start, end = datetime(2025, 2, 1), datetime(2025, 3, 1)
+        # 完全落在范围内的分区只读元数据
+        self.assertEqual(self.archive.count(start, end), 10)
+        self.assertEqual(ARCHIVE_PARTS_READ.value(result="scanned"), before)
+        # 跨越边界的分区按时间过滤
+        self.assertEqual(self.archive.count(datetime(2025, 2, 6), end), 5)
+        self.assertEqual(
+            self.archive.category_counts(start, end), {"手机": 5, "宽带": 5}
+        )
+        self.assertEqual(len(self.archive.parts(datetime(2025, 5, 1))), 0)
+
+    def test_rows_and_get(self):
+        self._archive()
+        columns = ("id", "content")
+        rows = self.archive.rows(columns, skip=8, limit=4)
+        self.assertEqual([r[1] for r in rows], ["1月投诉8", "1月投诉9", "2月投诉0", "2月投诉1"])
+        self.assertEqual(self.archive.get(rows[2][0], columns)["content"], "2月投诉0")
+        self.assertIsNone(self.archive.get(10_000, columns))
+
+    def test_unified_query(self):
+        """列表和统计同时覆盖归档和投诉表"""
+        from main import complaint_statistics, query_complaints
+
+        self._archive()
+        with Session(self.engine) as db, patch("main.ARCHIVE", self.archive):
+            rows = query_complaints(db, skip=28, limit=4)
+            self.assertEqual(
+                [r[2] for r in rows], ["3月投诉8", "3月投诉9", "4月投诉0", "4月投诉1"]
+            )
+            rows = query_complaints(db, skip=35, limit=100)
+            self.assertEqual(len(rows), 10)
+
+            stats = complaint_statistics(db)
+            self.assertEqual(stats, {"手机": 20, "宽带": 20, "固话": 5})
+            stats = complaint_statistics(db, start=datetime(2025, 3, 5), end=datetime(2025, 4, 3))
+            self.assertEqual(sum(stats.values()), 8)
+
+
+if __name__ == "__main__":
+    unittest.main()
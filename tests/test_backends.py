@@ -0,0 +1,142 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from services.llm import ComplaintAnalyzer
+from utils.db import (
+    INSERT_COLUMNS,
+    Complaint,
+    _copy_value,
+    _insert_sql,
+    bulk_write,
+    create_app_engine,
+    init_schema,
+    stream_rows,
+)
+
+COMPLAINTS = Complaint.__table__
+
+ROWS = [
+    ("2024-01-01 08:00:00", "手机信号差", "user_0001", "手机", None),
+    ("2024-01-02 09:30:00", "宽带\t断网\\重连", "user_0002", "宽带", "已处理"),
+    ("2024-01-03 10:45:00", "电视\n没有画面", "user_0003", "电视", None),
+]
+
+
+class BackendContract:
+    """各数据库后端都需满足的行为，子类提供 url"""
+
+    url = None
+
+    def setUp(self):
+        self.engine = create_app_engine(self.url)
+        init_schema(self.engine)
+        with self.engine.begin() as conn:
+            conn.execute(COMPLAINTS.delete())
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def test_bulk_write_and_stream(self):
+        """批量写入后能分批读回，转义字符原样保存"""
+        with self.engine.begin() as conn:
+            bulk_write(conn, ROWS, INSERT_COLUMNS)
+        with self.engine.connect() as conn:
+            rows = list(
+                stream_rows(
+                    conn,
+                    select(COMPLAINTS.c.content, COMPLAINTS.c.reply).order_by(
+                        COMPLAINTS.c.id
+                    ),
+                    batch_size=2,
+                )
+            )
+        self.assertEqual([tuple(r) for r in rows], [(r[1], r[4]) for r in ROWS])
+
+    def test_server_defaults(self):
+        """未提供时间和用户时由数据库填充默认值"""
+        with self.engine.begin() as conn:
+            conn.execute(
+                COMPLAINTS.insert().values(content="测试", complaint_category="其它")
+            )
+            row = conn.execute(
+                select(COMPLAINTS.c.complaint_time, COMPLAINTS.c.user_id)
+            ).one()
+        self.assertIsInstance(row.complaint_time, datetime)
+        self.assertEqual(row.user_id, "anonymous")
+
+    def test_init_schema_idempotent(self):
+        init_schema(self.engine)
+        with self.engine.connect() as conn:
+            self.assertEqual(conn.scalar(select(func.count()).select_from(COMPLAINTS)), 0)
+
+
+class TestSQLiteBackend(BackendContract, unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.url = f"sqlite:///{os.path.join(self.tmp.name, 'complaints.db')}"
+        super().setUp()
+
+    def tearDown(self):
+        super().tearDown()
+        self.tmp.cleanup()
+
+    def test_analyzer_crud(self):
+        """ComplaintAnalyzer 通过 SQLAlchemy 引擎读写"""
+        path = os.path.join(self.tmp.name, "analyzer.db")
+        with ComplaintAnalyzer(path) as analyzer:
+            complaint_id = analyzer.create_complaint("手机信号差", "手机", "已处理")
+            record = analyzer.get_complaint(complaint_id)
+            self.assertEqual(record.content, "手机信号差")
+            self.assertIsInstance(record.complaint_time, datetime)
+            self.assertTrue(analyzer.update_complaint(complaint_id, reply="已回访"))
+            self.assertEqual(analyzer.get_complaint(complaint_id).reply, "已回访")
+            self.assertTrue(analyzer.delete_complaint(complaint_id))
+            self.assertIsNone(analyzer.get_complaint(complaint_id))
+
+
+@unittest.skipUnless(os.getenv("TEST_POSTGRES_URL"), "未设置 TEST_POSTGRES_URL")
+class TestPostgresBackend(BackendContract, unittest.TestCase):
+    url = os.getenv("TEST_POSTGRES_URL")
+
+    def test_trigram_index(self):
+        with self.engine.connect() as conn:
+            names = conn.exec_driver_sql(
+                "SELECT indexname FROM pg_indexes WHERE tablename = 'complaints'"
+            ).scalars()
+            self.assertIn("ix_complaints_content_trgm", list(names))
+
+
+class TestDialectHelpers(unittest.TestCase):
+    def test_insert_sql_paramstyle(self):
+        self.assertEqual(
+            _insert_sql(sqlite.dialect(), "t", ("a", "b")),
+            "INSERT INTO t (a, b) VALUES (?, ?)",
+        )
+        self.assertEqual(
+            _insert_sql(postgresql.psycopg2.dialect(), "t", ("a", "b")),
+            "INSERT INTO t (a, b) VALUES (%s, %s)",
+        )
+
+    def test_copy_value(self):
+        """COPY 文本格式转义"""
+        self.assertEqual(_copy_value(None), "\\N")
+        self.assertEqual(_copy_value("a\tb\\c\nd"), "a\\tb\\\\c\\nd")
+        self.assertEqual(_copy_value(3), "3")
+
+    def test_postgres_pool(self):
+        """非 SQLite 数据库使用连接池，只读引擎设置只读事务"""
+        try:
+            engine = create_app_engine("postgresql://u:p@localhost/db", read_only=True)
+        except ImportError:
+            self.skipTest("未安装 PostgreSQL 驱动")
+        self.assertEqual(engine.pool.size(), 10)
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    unittest.main()
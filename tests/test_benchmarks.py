@@ -0,0 +1,69 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from benchmarks.run import compare, parse_importtime, summarize
+from benchmarks.seed import copy_database, seed_database, synthetic_rows
+from utils.config import SIMULATION_CONFIG
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_synthetic_rows_reproducible(self):
+        """测试相同种子生成相同数据"""
+        first = list(synthetic_rows(50, seed=7))
+        self.assertEqual(first, list(synthetic_rows(50, seed=7)))
+        self.assertTrue(
+            all(row[3] in SIMULATION_CONFIG["categories"] for row in first)
+        )
+        self.assertTrue(
+            all(row[0].startswith("2024") for row in first)
+        )
+
+    def test_seed_database(self):
+        """测试生成并复用模拟数据库"""
+        db_path = seed_database(200, seed=99)
+        with sqlite3.connect(db_path) as conn:
+            (count,) = conn.execute("SELECT COUNT(*) FROM complaints").fetchone()
+        self.assertEqual(count, 200)
+        self.assertEqual(seed_database(200, seed=99), db_path)
+
+        # 压测写入副本，种子数据库不变；条数不符时重新生成
+        with tempfile.TemporaryDirectory() as tmp:
+            copy_path = copy_database(db_path, os.path.join(tmp, "copy.db"))
+            with sqlite3.connect(copy_path) as conn:
+                conn.execute("DELETE FROM complaints WHERE id <= 10")
+        with sqlite3.connect(db_path) as conn:
+            (count,) = conn.execute("SELECT COUNT(*) FROM complaints").fetchone()
+            self.assertEqual(count, 200)
+            conn.execute("DELETE FROM complaints WHERE id = 1")
+        seed_database(200, seed=99)
+        with sqlite3.connect(db_path) as conn:
+            (count,) = conn.execute("SELECT COUNT(*) FROM complaints").fetchone()
+        self.assertEqual(count, 200)
+
+    def test_summarize_and_compare(self):
+        """测试统计汇总和回归对比"""
+        stats = summarize([0.001, 0.002, 0.003, 0.004])
+        self.assertEqual(stats["n"], 4)
+        self.assertAlmostEqual(stats["median_ms"], 2.5)
+
+        previous = {"results": {"10": {"micro": {"q": {"median_ms": 1.0}}}}}
+        current = {"results": {"10": {"micro": {"q": {"median_ms": 2.0}}}}}
+        self.assertEqual(len(compare(previous, current)), 1)
+        self.assertEqual(compare(current, current), [])
+
+    def test_parse_importtime(self):
+        """测试解析 -X importtime 输出"""
+        stderr = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        120 |   utils.metrics\n"
+            "import time:      2000 |       5120 | main\n"
+        )
+        modules = parse_importtime(stderr)
+        self.assertEqual(modules["main"], {"self_ms": 2.0, "cumulative_ms": 5.12})
+        self.assertIn("utils.metrics", modules)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import multiprocessing
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+from utils.cache import (
+    DataVersion,
+    SQLiteCache,
+    TieredCache,
+    TTLCache,
+    create_cache_backend,
+    etag_matches,
+    make_etag,
+)
+
+
+def _incr_worker(path: str, times: int):
+    cache = SQLiteCache(path)
+    for _ in range(times):
+        cache.incr("counter")
+
+
+class TestTTLCache(unittest.TestCase):
+    def test_lru_eviction(self):
+        cache = TTLCache(max_entries=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+
+    def test_expiry(self):
+        cache = TTLCache(ttl=0.01)
+        cache.set("a", 1)
+        time.sleep(0.02)
+        self.assertIsNone(cache.get("a"))
+
+
+class TestSQLiteCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "cache.db")
+        self.cache = SQLiteCache(self.path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_redis_compatible_commands(self):
+        self.assertTrue(self.cache.ping())
+        self.assertIsNone(self.cache.get("a"))
+        self.assertTrue(self.cache.set("a", b"1"))
+        self.assertEqual(self.cache.get("a"), b"1")
+        self.assertIsNone(self.cache.set("a", "2", nx=True))
+        self.assertEqual(self.cache.get("a"), b"1")
+        self.assertEqual(self.cache.incr("n"), 1)
+        self.assertEqual(self.cache.incr("n", 5), 6)
+        self.assertEqual(self.cache.get("n"), b"6")
+        self.assertEqual(self.cache.delete("a", "missing"), 1)
+        self.cache.flushdb()
+        self.assertIsNone(self.cache.get("n"))
+
+    def test_expiry(self):
+        self.cache.set("a", b"1", ex=0.01)
+        time.sleep(0.02)
+        self.assertIsNone(self.cache.get("a"))
+        self.assertTrue(self.cache.set("a", b"2", nx=True))
+        self.assertEqual(self.cache.get("a"), b"2")
+
+    def test_shared_between_processes(self):
+        """多个进程并发递增同一个键不丢失更新"""
+        ctx = multiprocessing.get_context("spawn")
+        workers = [ctx.Process(target=_incr_worker, args=(self.path, 50)) for _ in range(2)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(self.cache.get("counter"), b"100")
+
+    def test_shared_data_version(self):
+        """同一后端上的数据版本在各实例间一致"""
+        first = DataVersion(self.cache)
+        second = DataVersion(SQLiteCache(self.path))
+        self.assertEqual(first.boot_id, second.boot_id)
+        first.bump()
+        self.assertEqual(second.get(), 1)
+        with patch("utils.cache.DATA_VERSION", first):
+            self.assertEqual(make_etag(first.get(), "/"), make_etag(second.get(), "/"))
+
+    def test_tiered_cache(self):
+        """一个进程写入的响应另一个进程可以命中"""
+        writer = TieredCache(TTLCache(ttl=60), self.cache)
+        reader = TieredCache(TTLCache(ttl=60), SQLiteCache(self.path))
+        writer.set(("/complaints/", "limit=10", 1, ""), b"[]")
+        self.assertEqual(reader.get(("/complaints/", "limit=10", 1, "")), b"[]")
+        self.assertIsNone(reader.get(("/complaints/", "limit=10", 2, "")))
+
+    def test_create_backend(self):
+        self.assertIsNone(create_cache_backend("memory"))
+        self.assertIsInstance(
+            create_cache_backend(f"sqlite:///{self.path}"), SQLiteCache
+        )
+        with self.assertRaises(ValueError):
+            create_cache_backend("memcached://localhost")
+
+
+# 进程内的数据版本，不访问服务数据库
+@patch("utils.cache.DATA_VERSION", DataVersion())
+class TestETag(unittest.TestCase):
+    def test_version_changes_etag(self):
+        version = DataVersion()
+        first = make_etag(version.get(), "/statistics/", "")
+        self.assertEqual(first, make_etag(version.get(), "/statistics/", ""))
+        self.assertNotEqual(first, make_etag(version.bump(), "/statistics/", ""))
+        self.assertNotEqual(first, make_etag(0, "/complaints/", ""))
+
+    def test_if_none_match(self):
+        etag = make_etag(1, "/complaints/", "limit=10")
+        self.assertTrue(etag_matches(etag, etag))
+        self.assertTrue(etag_matches(f'"other", W/{etag}', etag))
+        self.assertTrue(etag_matches("*", etag))
+        self.assertFalse(etag_matches('"other"', etag))
+        self.assertFalse(etag_matches(None, etag))
+
+
+if __name__ == "__main__":
+    unittest.main()
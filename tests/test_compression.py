@@ -0,0 +1,119 @@
+import gzip
+import os
+import tempfile
+import unittest
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+from utils.assets import IMMUTABLE_CACHE_CONTROL, StaticAssets
+from utils.compression import CompressionMiddleware, choose_encoding
+
+
+def make_app():
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=100)
+
+    @app.get("/small")
+    def small():
+        return PlainTextResponse("x" * 10)
+
+    @app.get("/large")
+    def large():
+        return PlainTextResponse("投诉" * 500, headers={"ETag": '"abc"'})
+
+    @app.get("/stream")
+    def stream():
+        return StreamingResponse(
+            (f"chunk{i}\n" for i in range(100)), media_type="text/plain"
+        )
+
+    @app.get("/events")
+    def events():
+        return StreamingResponse(iter(["data: 1\n\n"] * 100), media_type="text/event-stream")
+
+    return app
+
+
+class TestCompression(unittest.TestCase):
+    def setUp(self):
+        self.client = TestClient(make_app())
+
+    def test_choose_encoding(self):
+        self.assertEqual(choose_encoding("gzip, deflate"), "gzip")
+        self.assertIsNone(choose_encoding("gzip;q=0, deflate"))
+        self.assertIsNone(choose_encoding(""))
+        self.assertIsNotNone(choose_encoding("*"))
+
+    def test_threshold(self):
+        """测试小响应不压缩，大响应压缩且 ETag 变为弱校验"""
+        headers = {"Accept-Encoding": "gzip"}
+        response = self.client.get("/small", headers=headers)
+        self.assertNotIn("content-encoding", response.headers)
+
+        response = self.client.get("/large", headers=headers)
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertEqual(response.headers["etag"], 'W/"abc"')
+        self.assertIn("Accept-Encoding", response.headers["vary"])
+        self.assertEqual(response.text, "投诉" * 500)
+
+        response = self.client.get("/large", headers={"Accept-Encoding": "identity"})
+        self.assertNotIn("content-encoding", response.headers)
+
+    def test_streaming(self):
+        """测试分块响应流式压缩，不跳过事件流"""
+        response = self.client.get("/stream", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertEqual(response.text, "".join(f"chunk{i}\n" for i in range(100)))
+
+        response = self.client.get("/events", headers={"Accept-Encoding": "gzip"})
+        self.assertNotIn("content-encoding", response.headers)
+
+
+class TestStaticAssets(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        os.makedirs(os.path.join(self.tmp.name, "js"))
+        with open(os.path.join(self.tmp.name, "js", "app.js"), "w") as f:
+            f.write("console.log('投诉');\n" * 200)
+        self.page = os.path.join(self.tmp.name, "index.html")
+        with open(self.page, "w") as f:
+            f.write('<script src="static/js/app.js"></script>')
+        self.assets = StaticAssets(self.tmp.name)
+        app = FastAPI()
+        app.mount("/static", self.assets)
+        self.client = TestClient(app)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_hashed_names(self):
+        """测试页面引用替换为带哈希的文件名并长期缓存"""
+        page = self.assets.render_page(self.page).body.decode()
+        hashed = self.assets.assets["js/app.js"].hashed_path
+        self.assertIn(f"static/{hashed}", page)
+
+        response = self.client.get(f"/static/{hashed}", headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["cache-control"], IMMUTABLE_CACHE_CONTROL)
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+
+        response = self.client.get("/static/js/app.js")
+        self.assertEqual(response.headers["cache-control"], "no-cache")
+        self.assertEqual(self.client.get("/static/js/missing.js").status_code, 404)
+
+    def test_precompressed_and_etag(self):
+        """测试预压缩内容和条件请求"""
+        asset = self.assets.assets["js/app.js"]
+        self.assertEqual(gzip.decompress(asset.encoded["gzip"]), asset.body)
+
+        response = self.client.get("/static/js/app.js")
+        response = self.client.get(
+            "/static/js/app.js", headers={"If-None-Match": response.headers["etag"]}
+        )
+        self.assertEqual(response.status_code, 304)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,150 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+from functools import partial
+
+from sqlalchemy import func, select
+
+from services.crawler import Checkpoint, Crawler
+from services.fetch import import_records
+from tests.fake_site import FakeComplaintSite
+from utils.db import Complaint, create_app_engine, init_schema
+
+
+class TestCrawler(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.engine = create_app_engine(f"sqlite:///{os.path.join(self.tmp.name, 'test.db')}")
+        init_schema(self.engine)
+        self.checkpoint_path = os.path.join(self.tmp.name, "checkpoint.json")
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.tmp.cleanup()
+
+    def _crawl(self, seeds, **options):
+        options.setdefault("delay", 0)
+        options.setdefault("flush_interval", 0.05)
+        crawler = Crawler(
+            seeds,
+            partial(import_records, target=self.engine),
+            checkpoint=Checkpoint(self.checkpoint_path),
+            **options,
+        )
+        return asyncio.run(crawler.run())
+
+    def _count(self):
+        with self.engine.connect() as conn:
+            return conn.scalar(select(func.count(Complaint.id)))
+
+    def test_crawl_and_conditional_recrawl(self):
+        with FakeComplaintSite(pages=5, per_page=10) as site:
+            stats = self._crawl([site.url(0)], batch_size=15)
+            self.assertEqual(stats.pages, 5)
+            self.assertEqual(stats.imported, 50)
+            self.assertEqual(self._count(), 50)
+
+            # 第二次爬取按保存的链接对全部页面发送条件请求，全部命中 304，不重复导入
+            stats = self._crawl([site.url(0)])
+            self.assertEqual(stats.not_modified, 5)
+            self.assertEqual(site.not_modified, 5)
+            for i in range(5):
+                self.assertEqual(site.count(f"/page/{i}"), 2)
+            self.assertEqual(stats.imported, 0)
+            self.assertEqual(self._count(), 50)
+
+    def test_duplicates_skipped_without_validators(self):
+        with FakeComplaintSite(pages=2, per_page=5) as site:
+            self._crawl([site.url(0)])
+            with open(self.checkpoint_path, encoding="utf-8") as f:
+                state = json.load(f)
+            state["validators"] = {}
+            with open(self.checkpoint_path, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            stats = self._crawl([site.url(0)])
+            self.assertEqual(stats.duplicates, 10)
+            self.assertEqual(self._count(), 10)
+
+    def test_per_host_concurrency(self):
+        with FakeComplaintSite(pages=8, per_page=1, delay=0.1) as site:
+            self._crawl([site.url(i) for i in range(8)], per_host=2)
+            self.assertEqual(len(site.requests), 8)
+            self.assertEqual(site.max_active, 2)
+
+    def test_politeness_delay(self):
+        with FakeComplaintSite(pages=4, per_page=1) as site:
+            self._crawl([site.url(i) for i in range(4)], per_host=4, delay=0.1)
+            starts = sorted(t for _, t, _ in site.requests)
+            gaps = [b - a for a, b in zip(starts, starts[1:])]
+            self.assertGreaterEqual(min(gaps), 0.08)
+
+    def test_resume_from_checkpoint(self):
+        with FakeComplaintSite(pages=4, per_page=3) as site:
+            # 模拟上次中断：前两页已完成，第 2 页待抓取
+            checkpoint = Checkpoint(self.checkpoint_path)
+            checkpoint.done = {site.url(0), site.url(1)}
+            checkpoint.pending = [site.url(2)]
+            checkpoint.save()
+
+            stats = self._crawl([site.url(0)])
+            self.assertTrue(stats.resumed)
+            self.assertEqual(site.count("/page/0"), 0)
+            self.assertEqual(site.count("/page/2"), 1)
+            self.assertEqual(self._count(), 6)
+            self.assertEqual(Checkpoint(self.checkpoint_path).pending, [])
+
+    def test_retry_on_server_error(self):
+        with FakeComplaintSite(pages=1, per_page=2) as site:
+            site.statuses = [503]
+            stats = self._crawl([site.url(0)])
+            self.assertEqual(site.count("/page/0"), 2)
+            self.assertEqual(stats.errors, 0)
+            self.assertEqual(self._count(), 2)
+
+    def test_failing_sink_keeps_pages_pending(self):
+        """写入失败时中止，页面留在检查点中，下次继续时重新抓取"""
+
+        def broken(items):
+            raise RuntimeError("database is locked")
+
+        with FakeComplaintSite(pages=3, per_page=2) as site:
+            crawler = Crawler(
+                [site.url(0)], broken, checkpoint=Checkpoint(self.checkpoint_path), delay=0
+            )
+            with self.assertRaises(RuntimeError):
+                asyncio.run(crawler.run())
+            checkpoint = Checkpoint(self.checkpoint_path)
+            self.assertTrue(checkpoint.pending)
+            self.assertFalse(checkpoint.done)
+
+            stats = self._crawl([site.url(0)])
+            self.assertTrue(stats.resumed)
+            self.assertEqual(self._count(), 6)
+
+    def test_failed_flush_retried(self):
+        """写入失败的记录放回缓冲，之后的写入重试，不丢失"""
+        calls = []
+
+        def flaky(items):
+            calls.append(len(items))
+            if len(calls) == 1:
+                raise RuntimeError("database is locked")
+            return import_records(items, target=self.engine)
+
+        with FakeComplaintSite(pages=3, per_page=2) as site:
+            crawler = Crawler(
+                [site.url(0)],
+                flaky,
+                checkpoint=Checkpoint(self.checkpoint_path),
+                delay=0,
+                batch_size=2,
+            )
+            stats = asyncio.run(crawler.run())
+            self.assertEqual(stats.errors, 1)
+            self.assertEqual(stats.imported, 6)
+            self.assertEqual(self._count(), 6)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,149 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from utils.db import (
+    Base,
+    Complaint,
+    DatabaseVersion,
+    SnapshotRefresher,
+    _listen_sqlite_connect,
+    create_read_engine,
+    data_version,
+    notify_external_write,
+)
+
+
+class TestSQLiteEngines(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "complaints.db")
+        self.writer = create_engine(
+            f"sqlite:///{self.path}", connect_args={"check_same_thread": False}
+        )
+        _listen_sqlite_connect(self.writer, read_only=False)
+        Base.metadata.create_all(bind=self.writer)
+        self.reader = create_read_engine(self.writer)
+        self.Session = sessionmaker(bind=self.writer)
+
+    def tearDown(self):
+        self.reader.dispose()
+        self.writer.dispose()
+        self.tmp.cleanup()
+
+    def add(self, content: str):
+        with self.Session() as db:
+            db.add(
+                Complaint(
+                    complaint_time=datetime(2025, 1, 1),
+                    content=content,
+                    user_id="db_user",
+                    complaint_category="宽带",
+                )
+            )
+            db.commit()
+
+    def count(self, engine) -> int:
+        with engine.connect() as conn:
+            return conn.execute(text("SELECT COUNT(*) FROM complaints")).scalar()
+
+    def test_wal_enabled(self):
+        with self.writer.connect() as conn:
+            mode = conn.execute(text("PRAGMA journal_mode")).scalar()
+        self.assertEqual(mode, "wal")
+
+    def test_read_engine_is_read_only(self):
+        """测试只读连接池开启 query_only，写入被拒绝"""
+        self.assertIsNot(self.reader, self.writer)
+        with self.reader.connect() as conn:
+            self.assertEqual(conn.execute(text("PRAGMA query_only")).scalar(), 1)
+            with self.assertRaises(OperationalError):
+                conn.execute(text("DELETE FROM complaints"))
+
+    def test_memory_database_shares_engine(self):
+        memory = create_engine("sqlite:///:memory:")
+        self.assertIs(create_read_engine(memory), memory)
+
+    def test_long_read_does_not_block_writes(self):
+        """测试只读连接上的长事务不阻塞写入，且读到事务开始时的一致视图"""
+        self.add("第一条")
+        with self.reader.connect() as conn:
+            conn.exec_driver_sql("BEGIN")
+            before = conn.execute(text("SELECT COUNT(*) FROM complaints")).scalar()
+            self.add("第二条")
+            during = conn.execute(text("SELECT COUNT(*) FROM complaints")).scalar()
+            conn.exec_driver_sql("COMMIT")
+        self.assertEqual((before, during), (1, 1))
+        self.assertEqual(self.count(self.reader), 2)
+
+    def test_data_version_shared_across_processes(self):
+        """命令行等其它进程提交的写入使本进程的数据版本变化"""
+        version = DatabaseVersion(self.writer)
+        before = version.get()
+        epoch = version.epoch
+        subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                "from utils.db import notify_external_write; notify_external_write('import')",
+            ],
+            check=True,
+            env={**os.environ, "DATABASE_URL": f"sqlite:///{self.path}"},
+        )
+        self.assertEqual(version.get(), before + 1)
+        self.assertEqual(version.epoch, epoch)
+        self.assertEqual(DatabaseVersion(self.writer).epoch, epoch)
+
+    def test_data_version_per_engine(self):
+        """会话提交只递增所写数据库的数据版本，同一引擎共用一个版本实例"""
+        other = create_engine("sqlite:///:memory:")
+        self.assertIs(data_version(self.writer), data_version(self.writer))
+        self.assertIsNot(data_version(other), data_version(self.writer))
+        before = data_version(self.writer).get()
+        self.add("版本测试")
+        self.assertEqual(data_version(self.writer).get(), before + 1)
+        with self.writer.connect() as conn:
+            self.assertIs(data_version(conn), data_version(self.writer))
+
+    def test_external_write_to_other_database(self):
+        """写入服务数据库以外的库只递增该库的版本，不通知本进程的观察者"""
+        calls = []
+        before = data_version(self.writer).get()
+        with patch("utils.db._write_observers", [calls.append]):
+            notify_external_write("import", inserts_only=True, target=self.writer)
+            self.assertEqual(calls, [])
+            self.assertEqual(data_version(self.writer).get(), before + 1)
+            with patch("utils.db.engine", self.writer):
+                notify_external_write("import", inserts_only=True)
+        self.assertEqual(len(calls), 1)
+
+    def test_snapshot_refresh(self):
+        """测试快照通过备份API生成，刷新后才能看到新数据"""
+        self.add("快照前")
+        snapshot = SnapshotRefresher(
+            self.path, os.path.join(self.tmp.name, "snapshot.db"), interval=3600
+        )
+        snapshot.refresh()
+        self.add("快照后")
+        self.assertEqual(self.count(snapshot.engine), 1)
+        snapshot.refresh()
+        self.assertEqual(self.count(snapshot.engine), 2)
+        self.assertEqual(snapshot.generation, 2)
+
+        with sqlite3.connect(snapshot.snapshot_path) as conn:
+            (mode,) = conn.execute("PRAGMA journal_mode").fetchone()
+        self.assertEqual(mode, "delete")
+        snapshot.engine.dispose()
+
+
+if __name__ == "__main__":
+    unittest.main()
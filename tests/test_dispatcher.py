@@ -0,0 +1,172 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from services.dispatcher import (
+    DISPATCHED,
+    DispatchedChain,
+    LLMDispatcher,
+    LoadShedError,
+    Priority,
+    TokenBucket,
+    _Ticket,
+    llm_priority,
+)
+from services.instrumentation import FALLBACKS
+from services.llm import ComplaintAnalyzer
+
+DEADLINES = {Priority.INTERACTIVE: 60, Priority.BATCH: 60, Priority.BACKGROUND: 60}
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_refill(self):
+        bucket = TokenBucket(60, capacity=1)
+        now = time.monotonic()
+        self.assertEqual(bucket.wait_time(1, now), 0)
+        bucket.take(1)
+        self.assertAlmostEqual(bucket.wait_time(1, now), 1.0, places=2)
+        self.assertAlmostEqual(bucket.wait_time(1, now + 0.5), 0.5, places=2)
+
+    def test_oversized_request(self):
+        """单次请求超过桶容量时按满桶计算"""
+        bucket = TokenBucket(60)
+        self.assertEqual(bucket.fit(1000), 60)
+        self.assertTrue(TokenBucket(0).unlimited)
+
+
+class TestLLMDispatcher(unittest.TestCase):
+    def _drain(self, dispatcher, tickets):
+        """每次补充一个请求配额，记录放行顺序"""
+        now = dispatcher.requests._updated
+        order = []
+        for _ in tickets:
+            dispatcher.requests.tokens = 1
+            dispatcher._dispatch(now)
+            order.extend(t for t in tickets if t.granted and t not in order)
+        return order
+
+    def test_priority_and_round_robin(self):
+        """不同优先级严格按序放行，同级不同来源轮流放行"""
+        dispatcher = LLMDispatcher(60, 0, DEADLINES)
+        dispatcher.requests.tokens = 0
+        tickets = [
+            _Ticket(Priority.BACKGROUND, "cleanup", 1, float("inf")),
+            _Ticket(Priority.BATCH, "backfill", 1, float("inf")),
+            _Ticket(Priority.BATCH, "backfill", 1, float("inf")),
+            _Ticket(Priority.BATCH, "reclassify", 1, float("inf")),
+            _Ticket(Priority.INTERACTIVE, "analysis", 1, float("inf")),
+        ]
+        for ticket in tickets:
+            dispatcher._enqueue(ticket)
+        self.assertEqual(dispatcher.depth(), 5)
+        self.assertEqual(dispatcher.depth(Priority.BATCH), 3)
+
+        order = self._drain(dispatcher, tickets)
+        self.assertEqual(
+            [(t.priority, t.flow) for t in order],
+            [
+                (Priority.INTERACTIVE, "analysis"),
+                (Priority.BATCH, "backfill"),
+                (Priority.BATCH, "reclassify"),
+                (Priority.BATCH, "backfill"),
+                (Priority.BACKGROUND, "cleanup"),
+            ],
+        )
+        self.assertEqual(dispatcher.depth(), 0)
+
+    def test_token_limit(self):
+        """token 配额不足时排队，补充后放行"""
+        dispatcher = LLMDispatcher(0, 600, DEADLINES)
+        dispatcher.tokens.tokens = 0
+        start = time.monotonic()
+        dispatcher.acquire(5, flow="test")
+        self.assertGreaterEqual(time.monotonic() - start, 0.4)
+        self.assertEqual(dispatcher.depth(), 0)
+
+    def test_shed_when_expected_wait_exceeds_deadline(self):
+        dispatcher = LLMDispatcher(60, 0, {**DEADLINES, Priority.INTERACTIVE: 0.5})
+        dispatcher.requests.tokens = 0
+        before = DISPATCHED.value(priority="interactive", outcome="shed")
+        start = time.monotonic()
+        with self.assertRaises(LoadShedError):
+            dispatcher.acquire(1, flow="test")
+        self.assertLess(time.monotonic() - start, 0.1)
+        self.assertEqual(DISPATCHED.value(priority="interactive", outcome="shed"), before + 1)
+        self.assertEqual(dispatcher.depth(), 0)
+
+    def test_shed_after_deadline(self):
+        """排队期间被更高优先级插队，超过截止时间后放弃"""
+        dispatcher = LLMDispatcher(120, 0, {**DEADLINES, Priority.BACKGROUND: 0.8})
+        dispatcher.requests.tokens = 0
+        errors = []
+
+        def background():
+            with llm_priority(Priority.BACKGROUND, "cleanup"):
+                try:
+                    dispatcher.acquire(1, flow="test")
+                except LoadShedError as e:
+                    errors.append(e)
+
+        worker = threading.Thread(target=background)
+        worker.start()
+        with dispatcher._lock:
+            for _ in range(3):
+                dispatcher._enqueue(_Ticket(Priority.INTERACTIVE, "analysis", 1, float("inf")))
+        worker.join(5)
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(dispatcher.depth(Priority.BACKGROUND), 0)
+
+    def test_unlimited(self):
+        dispatcher = LLMDispatcher(0, 0, DEADLINES)
+        for _ in range(100):
+            dispatcher.acquire(10_000, flow="test")
+        self.assertEqual(dispatcher.depth(), 0)
+
+    @patch.dict(os.environ, {"LLM_RPM": "30", "LLM_DEADLINE_BATCH": "5"})
+    def test_from_env(self):
+        dispatcher = LLMDispatcher.from_env()
+        self.assertEqual(dispatcher.requests.rate, 0.5)
+        self.assertEqual(dispatcher.deadlines[Priority.BATCH], 5.0)
+        self.assertEqual(Priority.parse(" Background "), Priority.BACKGROUND)
+
+
+class TestLoadShedFallback(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+
+    def tearDown(self):
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    @patch.dict(
+        os.environ,
+        {"LLM_MODE": "online", "API_KEY": "test", "MODEL_NAME": "test-model"},
+    )
+    def test_shed_falls_back_to_template(self):
+        """调用被丢弃时回退到正则分类和模板回复，不等待模型"""
+        dispatcher = LLMDispatcher(60, 0, {**DEADLINES, Priority.BATCH: 0.1})
+        with ComplaintAnalyzer(self.db_path) as analyzer:
+            dispatcher.requests.tokens = 0
+            dispatcher.requests._updated = time.monotonic()
+            model = MagicMock()
+            analyzer.classification_chain = DispatchedChain(model, "classification", dispatcher)
+            analyzer.reply_chain = DispatchedChain(model, "reply", dispatcher)
+            before = FALLBACKS.value(chain="reply", reason="shed")
+
+            with llm_priority(Priority.BATCH):
+                result = analyzer.analyze("手机信号差")
+                self.assertEqual(analyzer.classify_complaint("天气不错"), "其它")
+
+            self.assertEqual(result.category, "手机")
+            self.assertEqual(
+                result.reply, analyzer.templates.get("手机", analyzer.templates["其它"])
+            )
+            model.invoke.assert_not_called()
+            self.assertEqual(FALLBACKS.value(chain="reply", reason="shed"), before + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,171 @@
+import asyncio
+import json
+import threading
+import unittest
+from datetime import datetime
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from utils.db import Base, Complaint
+from utils.cache import DataVersion
+from utils.events import COMPLAINT_FEED, EventBroker, VersionWatcher, sse_stream
+
+
+def parse(message: bytes):
+    lines = dict(line.split(": ", 1) for line in message.decode().strip().split("\n"))
+    return lines["event"], json.loads(lines["data"])
+
+
+class TestEventBroker(unittest.TestCase):
+    def test_publish_from_thread(self):
+        """测试从其它线程发布的事件投递到订阅者的事件循环"""
+
+        async def scenario():
+            broker = EventBroker("test")
+            subscriber = broker.subscribe()
+            thread = threading.Thread(target=broker.publish, args=("delta", {"a": 1}))
+            thread.start()
+            thread.join()
+            message = await asyncio.wait_for(subscriber.queue.get(), 1)
+            broker.unsubscribe(subscriber)
+            return message
+
+        self.assertEqual(parse(asyncio.run(scenario())), ("delta", {"a": 1}))
+
+    def test_overflow_sends_reset(self):
+        """测试订阅者积压溢出时只保留一条 reset 事件"""
+
+        async def scenario():
+            broker = EventBroker("test", queue_size=2)
+            subscriber = broker.subscribe()
+            for i in range(5):
+                broker.publish("delta", {"i": i})
+            await asyncio.sleep(0)
+            messages = []
+            while not subscriber.queue.empty():
+                messages.append(parse(subscriber.queue.get_nowait())[0])
+            return messages
+
+        self.assertIn("reset", asyncio.run(scenario()))
+
+    def test_sse_stream(self):
+        """测试事件流输出重连间隔、心跳和事件，关闭后退订"""
+
+        async def scenario():
+            broker = EventBroker("test")
+            stream = sse_stream(broker, heartbeat=0.01)
+            first = await stream.__anext__()
+            heartbeat = await stream.__anext__()
+            broker.publish("delta", {"x": 1})
+            event = await stream.__anext__()
+            await stream.aclose()
+            return first, heartbeat, event, len(broker._subscribers)
+
+        first, heartbeat, event, remaining = asyncio.run(scenario())
+        self.assertTrue(first.startswith(b"retry:"))
+        self.assertEqual(heartbeat, b": ping\n\n")
+        self.assertEqual(parse(event), ("delta", {"x": 1}))
+        self.assertEqual(remaining, 0)
+
+    def test_external_writes_reset(self):
+        """其它进程的写入在下一次检查时推送 reset，本进程登记过的写入不推送"""
+
+        async def scenario():
+            broker = EventBroker("test")
+            version = DataVersion()
+            watcher = VersionWatcher(broker, version)
+            subscriber = broker.subscribe()
+            watcher.poll()
+            watcher.local(version.bump())  # 本进程的写入
+            watcher.poll()
+            watcher.poll()
+            await asyncio.sleep(0)
+            local_events = subscriber.queue.qsize()
+
+            version.bump()  # 其它进程的写入
+            watcher.poll()
+            watcher.poll()
+            await asyncio.sleep(0)
+            message = await asyncio.wait_for(subscriber.queue.get(), 1)
+            broker.unsubscribe(subscriber)
+            return local_events, message
+
+        local_events, message = asyncio.run(scenario())
+        self.assertEqual(local_events, 0)
+        self.assertEqual(parse(message), ("reset", {"reason": "external"}))
+
+
+class TestComplaintFeed(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine(
+            "sqlite:///:memory:",
+            connect_args={"check_same_thread": False},
+            poolclass=StaticPool,
+        )
+        Base.metadata.create_all(bind=self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def collect(self, action):
+        async def scenario():
+            subscriber = COMPLAINT_FEED.subscribe()
+            try:
+                action()
+                await asyncio.sleep(0)
+                messages = []
+                while not subscriber.queue.empty():
+                    messages.append(parse(subscriber.queue.get_nowait()))
+                return messages
+            finally:
+                COMPLAINT_FEED.unsubscribe(subscriber)
+
+        return asyncio.run(scenario())
+
+    def test_orm_changes_published_as_deltas(self):
+        """测试ORM增删改在提交后推送为增量事件和分类计数变化"""
+        db = self.Session()
+
+        def create():
+            db.add(
+                Complaint(
+                    complaint_time=datetime(2025, 1, 1),
+                    content="宽带断网",
+                    user_id="feed_user",
+                    complaint_category="宽带",
+                )
+            )
+            db.commit()
+
+        [(event, data)] = self.collect(create)
+        self.assertEqual(event, "delta")
+        self.assertEqual(data["inserted"][0]["content"], "宽带断网")
+        self.assertEqual(data["counts"], {"宽带": 1})
+        complaint_id = data["inserted"][0]["id"]
+
+        def update():
+            complaint = db.get(Complaint, complaint_id)
+            complaint.complaint_category = "固话"
+            db.commit()
+
+        [(event, data)] = self.collect(update)
+        self.assertEqual(data["updated"][0]["complaint_category"], "固话")
+        self.assertEqual(data["counts"], {"宽带": -1, "固话": 1})
+
+        def delete():
+            db.delete(db.get(Complaint, complaint_id))
+            db.commit()
+
+        [(event, data)] = self.collect(delete)
+        self.assertEqual(data["deleted"], [complaint_id])
+        self.assertEqual(data["counts"], {"固话": -1})
+
+        self.assertEqual(self.collect(db.commit), [])
+        db.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
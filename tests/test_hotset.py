@@ -0,0 +1,128 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+
+from services.archive import ComplaintArchive
+from services.hotset import ComplaintHotSet
+from utils.db import Complaint, create_app_engine, init_schema, notify_external_write
+
+NOW = datetime.now().replace(minute=0, second=0, microsecond=0)
+
+
+class TestComplaintHotSet(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.engine = create_app_engine(f"sqlite:///{os.path.join(self.tmp.name, 'test.db')}")
+        init_schema(self.engine)
+        # 40天前的20条只在数据库中，最近两天每小时一条进入内存热数据
+        rows = [
+            {
+                "complaint_time": NOW - timedelta(days=40, hours=i),
+                "content": f"早期投诉{i}",
+                "user_id": "user_1",
+                "complaint_category": "手机",
+                "reply": None,
+            }
+            for i in range(20)
+        ]
+        rows += [
+            {
+                "complaint_time": NOW - timedelta(hours=i),
+                "content": f"近期投诉{i}",
+                "user_id": f"user_{i % 3}",
+                "complaint_category": ("宽带", "固话", "手机")[i % 3],
+                "reply": "已处理" if i % 2 else None,
+            }
+            for i in range(48)
+        ]
+        with self.engine.begin() as conn:
+            conn.execute(insert(Complaint), rows)
+        self.hot = ComplaintHotSet(days=7, reload_interval=3600)
+        self.hot.attach(self.engine)
+        self.hot.reload()
+        self.archive = ComplaintArchive(os.path.join(self.tmp.name, "archive"), scan_interval=0)
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.tmp.cleanup()
+
+    def _query(self, hotset, fn, *args, **kwargs):
+        with Session(self.engine) as db, patch("main.HOTSET", hotset), patch(
+            "main.ARCHIVE", self.archive
+        ):
+            result = fn(db, *args, **kwargs)
+        # 数据库返回 Row，内存热数据返回普通元组
+        return [tuple(r) for r in result] if fn.__name__ == "query_complaints" else result
+
+    def _compare(self, fn, *args, **kwargs):
+        """内存热数据和数据库给出相同结果"""
+        expected = self._query(ComplaintHotSet(days=0), fn, *args, **kwargs)
+        actual = self._query(self.hot, fn, *args, **kwargs)
+        self.assertEqual(actual, expected)
+        return actual
+
+    def test_queries_match_database(self):
+        from main import complaint_statistics, complaint_timeline, query_complaints
+
+        start = NOW - timedelta(days=1)
+        rows = self._compare(query_complaints, start=start, skip=3, limit=10)
+        self.assertEqual(len(rows), 10)
+        self._compare(query_complaints, start=start, end=NOW - timedelta(hours=5), limit=100)
+        self.assertEqual(sum(self._compare(complaint_statistics).values()), 68)
+        self._compare(complaint_statistics, start=start)
+        self._compare(complaint_statistics, start=NOW - timedelta(days=60), end=NOW)
+        counts = self._compare(
+            complaint_timeline, NOW - timedelta(days=45), NOW + timedelta(days=1), timedelta(days=1)
+        )
+        self.assertEqual(sum(counts), 68)
+
+    def test_recent_reads_skip_database(self):
+        with patch.object(Session, "execute", side_effect=AssertionError("不应查询数据库")):
+            rows = self.hot.rows(("id", "content", "reply"), NOW - timedelta(hours=3))
+            _, counts = self.hot.category_counts(NOW - timedelta(hours=3))
+        self.assertEqual([r[1] for r in rows], ["近期投诉0", "近期投诉1", "近期投诉2", "近期投诉3"])
+        self.assertEqual([r[2] for r in rows], [None, "已处理", None, "已处理"])
+        self.assertEqual(sum(counts.values()), 4)
+        # 早于覆盖范围的查询交给数据库
+        self.assertIsNone(self.hot.rows(("id",), NOW - timedelta(days=30)))
+
+    def test_orm_writes_synced(self):
+        start = NOW - timedelta(hours=1)
+        generation = self.hot.generation
+        with Session(self.engine) as db:
+            complaint = Complaint(
+                complaint_time=NOW, content="新投诉", user_id="user_9", complaint_category="宽带"
+            )
+            db.add(complaint)
+            db.commit()
+            self.assertIn("新投诉", [r[0] for r in self.hot.rows(("content",), start)])
+
+            complaint.complaint_category = "固话"
+            db.commit()
+            _, counts = self.hot.category_counts(start)
+            self.assertEqual(counts, {"宽带": 1, "固话": 2})
+
+            db.delete(complaint)
+            db.commit()
+            self.assertNotIn("新投诉", [r[0] for r in self.hot.rows(("content",), start)])
+        self.assertEqual(self.hot.generation, generation)
+
+    def test_statement_write_triggers_reload(self):
+        start = NOW - timedelta(hours=1)
+        with self.engine.begin() as conn:
+            conn.execute(update(Complaint).values(complaint_category="其它"))
+        with patch("utils.db.engine", self.engine):
+            notify_external_write()
+        self.assertIsNone(self.hot.rows(("id",), start))
+        self.hot.reload()
+        _, counts = self.hot.category_counts(start)
+        self.assertEqual(counts, {"其它": 2})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from services.incidents import IncidentTracker, MinHasher
+from utils.db import Complaint, create_app_engine, data_version, init_schema
+
+
+def _rows(contents, moment=None, category="宽带"):
+    moment = moment or datetime.now()
+    return [
+        {"complaint_time": moment, "content": c, "complaint_category": category}
+        for c in contents
+    ]
+
+
+class TestMinHasher(unittest.TestCase):
+    def test_similarity_estimate(self):
+        hasher = MinHasher(num_perm=128, shingle_size=2)
+        a, b, c = hasher.signatures(
+            ["城东片区宽带全部断网了", "城东片区宽带全部断网了！！", "手机话费扣费不明"]
+        )
+        self.assertGreater((a == b).mean(), 0.7)
+        self.assertLess((a == c).mean(), 0.2)
+        # 签名只取决于内容，与批次无关
+        self.assertTrue((hasher.signatures(["手机话费扣费不明"])[0] == c).all())
+
+
+class TestIncidentTracker(unittest.TestCase):
+    def setUp(self):
+        self.tracker = IncidentTracker(flush_interval=3600)
+
+    def test_near_duplicates_grouped(self):
+        self.tracker.observe(
+            _rows(
+                [
+                    "城东片区宽带全部断网了",
+                    "城东片区宽带全部断网了，什么时候恢复",
+                    "城东片区 宽带全部断网了",
+                    "手机话费扣费不明",
+                ]
+            )
+        )
+        self.tracker.observe(_rows(["城东片区宽带全部断网了!"]))
+        self.assertEqual(len(self.tracker), 2)
+        top = self.tracker.top()
+        self.assertEqual(len(top), 1)
+        self.assertEqual(top[0]["size"], 4)
+        self.assertEqual(top[0]["category"], "宽带")
+
+    def test_trend_and_window(self):
+        now = datetime.now().replace(minute=30)
+        content = "城西基站故障手机没有信号"
+        self.tracker.observe(_rows([content] * 2, now - timedelta(hours=1), "手机"))
+        self.tracker.observe(_rows([content] * 5, now, "手机"))
+        # 超出时间窗口的历史数据不参与聚类
+        self.tracker.observe(_rows([content] * 3, now - timedelta(days=30), "手机"))
+
+        (incident,) = self.tracker.top(hours=3, now=now)
+        self.assertEqual(incident["size"], 7)
+        self.assertEqual(incident["hourly"], [0, 2, 5])
+        self.assertEqual(incident["trend"], 3)
+        self.assertEqual(self.tracker.top(hours=1, now=now + timedelta(hours=2)), [])
+
+    def test_persistence(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_app_engine(f"sqlite:///{os.path.join(tmp, 'test.db')}")
+            try:
+                init_schema(engine)
+                self.tracker.attach(engine)
+                self.tracker.observe(_rows(["城东片区宽带全部断网了"] * 3 + ["投诉一次"]))
+                self.tracker.flush()
+
+                restored = IncidentTracker()
+                restored.attach(engine)
+                self.assertEqual(len(restored), 1)
+                restored.observe(_rows(["城东片区宽带全部断网了，什么时候恢复"]))
+                (incident,) = restored.top()
+                self.assertEqual(incident["id"], self.tracker.top()[0]["id"])
+                self.assertEqual(incident["size"], 4)
+            finally:
+                engine.dispose()
+
+    def test_catch_up_from_database(self):
+        """聚类进程按数据版本从投诉表补齐其它进程和 CLI 写入的投诉"""
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_app_engine(f"sqlite:///{os.path.join(tmp, 'test.db')}")
+            try:
+                init_schema(engine)
+                self.tracker.attach(engine)
+                self.assertEqual(self.tracker.top(), [])
+
+                now = datetime.now()
+                with engine.begin() as conn:
+                    conn.execute(
+                        insert(Complaint),
+                        [
+                            {"user_id": "u", **row}
+                            for row in _rows(["补齐测试：南区光纤被挖断"] * 2, now)
+                        ],
+                    )
+                data_version(engine).bump()
+                (incident,) = self.tracker.top()
+                self.assertEqual(incident["sample"], "补齐测试：南区光纤被挖断")
+                self.assertEqual(incident["size"], 2)
+                # 已补齐的投诉不重复计数
+                data_version(engine).bump()
+                self.assertEqual(self.tracker.top()[0]["size"], 2)
+
+                self.tracker.flush()
+                follower = IncidentTracker()
+                follower.follow(engine)
+                (persisted,) = follower.top()
+                self.assertEqual(persisted["id"], incident["id"])
+                self.assertEqual(persisted["hourly"], incident["hourly"])
+            finally:
+                engine.dispose()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,10 +1,12 @@
 import os
 import sqlite3
+import subprocess
+import sys
 import tempfile
 import unittest
 from unittest.mock import MagicMock, patch
 
-from services.llm import ComplaintAnalysisResult, ComplaintAnalyzer
+from services.llm import ComplaintAnalysisOutput, ComplaintAnalysisResult, ComplaintAnalyzer
 
 
 class TestComplaintAnalyzer(unittest.TestCase):
@@ -117,6 +119,61 @@ class TestComplaintAnalyzer(unittest.TestCase):
                 result = analyzer.classify_complaint("网络连接问题")
                 self.assertEqual(result, "宽带")
 
+    @patch.dict(
+        os.environ,
+        {
+            "LLM_MODE": "online",
+            "LLM_COMBINED": "true",
+            "API_KEY": "test",
+            "MODEL_NAME": "test-model",
+        },
+    )
+    def test_combined_analysis(self):
+        """测试合并模式单次调用返回分类和回复"""
+        with ComplaintAnalyzer(self.db_path) as analyzer:
+            analyzer.analysis_chain = MagicMock()
+            analyzer.analysis_chain.invoke.return_value = ComplaintAnalysisOutput(
+                category="宽带", reply="重启光猫后测试网速"
+            )
+            analyzer.classification_chain = MagicMock()
+            analyzer.reply_chain = MagicMock()
+
+            result = analyzer.analyze("家里上网很慢")
+            self.assertIsInstance(result, ComplaintAnalysisResult)
+            self.assertIsNone(result.complaint_id)
+            self.assertEqual(result.category, "宽带")
+            self.assertEqual(result.reply, "重启光猫后测试网速")
+            analyzer.analysis_chain.invoke.assert_called_once()
+            analyzer.classification_chain.invoke.assert_not_called()
+            analyzer.reply_chain.invoke.assert_not_called()
+
+    @patch.dict(
+        os.environ,
+        {
+            "LLM_MODE": "online",
+            "LLM_COMBINED": "true",
+            "API_KEY": "test",
+            "MODEL_NAME": "test-model",
+        },
+    )
+    def test_combined_analysis_fallback(self):
+        """测试合并模式返回无效分类或解析失败时回退到两步流程"""
+        with ComplaintAnalyzer(self.db_path) as analyzer:
+            analyzer.analysis_chain = MagicMock()
+            analyzer.analysis_chain.invoke.return_value = ComplaintAnalysisOutput(
+                category="电视", reply="无效回复"
+            )
+            analyzer.reply_chain = MagicMock()
+            analyzer.reply_chain.invoke.return_value = "检查手机信号设置"
+
+            result = analyzer.analyze("手机信号差")
+            self.assertEqual(result.category, "手机")
+            self.assertEqual(result.reply, "检查手机信号设置")
+
+            analyzer.analysis_chain.invoke.side_effect = ValueError("parse error")
+            result = analyzer.analyze("手机信号差")
+            self.assertEqual(result.category, "手机")
+
     def test_context_manager(self):
         """测试上下文管理器关闭连接"""
         analyzer = ComplaintAnalyzer(self.db_path)
@@ -225,6 +282,22 @@ class TestComplaintAnalyzer(unittest.TestCase):
             category = analyzer._classify_with_regex("手机和宽带都有问题")
             self.assertIn(category, ["手机", "宽带"])
 
+    def test_lazy_langchain_import(self):
+        """导入服务和 mock 模式的分析器不加载 LangChain"""
+        code = (
+            "import sys, main\n"
+            "main.ComplaintAnalyzer(sys.argv[1]).classify_complaint('手机信号差')\n"
+            "print(sorted(m for m in ('langchain_core', 'langchain_openai') if m in sys.modules))"
+        )
+        result = subprocess.run(
+            [sys.executable, "-c", code, self.db_path],
+            capture_output=True,
+            text=True,
+            env={**os.environ, "LLM_MODE": "mock"},
+            check=True,
+        )
+        self.assertEqual(result.stdout.strip().splitlines()[-1], "[]")
+
 
 if __name__ == "__main__":
     unittest.main()
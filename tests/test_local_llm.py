@@ -0,0 +1,151 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from services.local_llm import LOCAL_FALLBACKS, LocalChain, LocalModel
+from services.llm import ComplaintAnalyzer
+from services.resilience import CallTimeoutError
+from tests.fake_openai import FakeOpenAIServer
+
+
+class RecordingBackend:
+    """按提示词返回固定结果，并记录每个批次"""
+
+    def __init__(self, result="宽带", error=None):
+        self.result = result
+        self.error = error
+        self.batches = []
+
+    def generate_batch(self, prompts, max_tokens):
+        self.batches.append(list(prompts))
+        if self.error:
+            raise self.error
+        return [self.result for _ in prompts]
+
+
+class SlowBackend(RecordingBackend):
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+
+    def generate_batch(self, prompts, max_tokens):
+        time.sleep(self.delay)
+        return super().generate_batch(prompts, max_tokens)
+
+
+class TestLocalModel(unittest.TestCase):
+    def test_concurrent_requests_batched(self):
+        backend = RecordingBackend()
+        model = LocalModel(backend, max_batch=8, batch_wait=0.2)
+        prompts = [f"投诉{i % 4}" for i in range(8)]
+        results = [None] * len(prompts)
+        barrier = threading.Barrier(len(prompts))
+
+        def call(i):
+            barrier.wait()
+            results[i] = model.generate(prompts[i], timeout=5)
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(len(prompts))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(results, ["宽带"] * 8)
+        # 同时到达的请求合并成一批，相同提示词只生成一次
+        self.assertEqual(len(backend.batches), 1)
+        self.assertEqual(sorted(backend.batches[0]), ["投诉0", "投诉1", "投诉2", "投诉3"])
+
+    def test_error_propagates(self):
+        model = LocalModel(RecordingBackend(error=RuntimeError("内存不足")), batch_wait=0)
+        with self.assertRaises(RuntimeError):
+            model.generate("投诉", timeout=5)
+
+    def test_missing_results_fail(self):
+        """后端返回的结果少于提示词时，缺少结果的请求失败而不是一直等待"""
+        backend = RecordingBackend()
+        backend.generate_batch = lambda prompts, max_tokens: ["宽带"]
+        model = LocalModel(backend, max_batch=2, batch_wait=0.2)
+        first, second = model.submit("投诉1"), model.submit("投诉2")
+        self.assertEqual(first.result(5), "宽带")
+        with self.assertRaises(RuntimeError):
+            second.result(5)
+
+    def test_generate_timeout(self):
+        model = LocalModel(SlowBackend(0.5), batch_wait=0)
+        start = time.monotonic()
+        with self.assertRaises(CallTimeoutError):
+            LocalChain(model, "{text}", "text", timeout=0.1).invoke("网速慢")
+        self.assertLess(time.monotonic() - start, 0.4)
+
+    def test_chain_formats_template(self):
+        backend = RecordingBackend()
+        model = LocalModel(backend, batch_wait=0)
+        LocalChain(model, "投诉内容：{text}", "text").invoke("网速慢")
+        LocalChain(model, "{text}|{category}", "text").invoke({"text": "网速慢", "category": "宽带"})
+        self.assertEqual(backend.batches, [["投诉内容：网速慢"], ["网速慢|宽带"]])
+
+
+class TestLocalAnalyzer(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp.name, "test.db")
+        self.backend = RecordingBackend()
+        self.model = LocalModel(self.backend, batch_wait=0)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_local_mode(self):
+        with patch.dict(os.environ, {"LLM_MODE": "local"}), patch(
+            "services.llm.get_local_model", return_value=self.model
+        ), ComplaintAnalyzer(self.db_path) as analyzer:
+            result = analyzer.analyze("家里上网一直连不上")
+        self.assertEqual(result.category, "宽带")
+        self.assertEqual(result.reply, "宽带")
+        self.assertEqual(len(self.backend.batches), 2)
+
+    def test_local_timeout_falls_back_to_regex(self):
+        """本地生成超过截止时间时回退到正则分类"""
+        model = LocalModel(SlowBackend(1.0), batch_wait=0)
+        with patch.dict(os.environ, {"LLM_MODE": "local", "LOCAL_LLM_TIMEOUT": "0.1"}), patch(
+            "services.llm.get_local_model", return_value=model
+        ), ComplaintAnalyzer(self.db_path) as analyzer:
+            start = time.monotonic()
+            self.assertEqual(analyzer.classify_complaint("手机信号差"), "手机")
+            self.assertLess(time.monotonic() - start, 0.8)
+
+    def test_local_mode_without_model(self):
+        with patch.dict(os.environ, {"LLM_MODE": "local"}), patch(
+            "services.llm.get_local_model", return_value=None
+        ), ComplaintAnalyzer(self.db_path) as analyzer:
+            self.assertEqual(analyzer.mode, "mock")
+            self.assertEqual(analyzer.classify_complaint("家里上网一直连不上"), "其它")
+
+    def test_remote_failure_falls_back_to_local(self):
+        """远程模型出错时改用本地模型，而不是正则和模板"""
+        with FakeOpenAIServer() as server:
+            server.default_status = 500
+            env = {
+                "LLM_MODE": "online",
+                "API_KEY": "test",
+                "BASE_URL": server.base_url,
+                "MODEL_NAME": "fake-model",
+                "LLM_MAX_RETRIES": "0",
+            }
+            with patch.dict(os.environ, env), patch(
+                "services.llm.get_local_model", return_value=self.model
+            ), ComplaintAnalyzer(self.db_path) as analyzer:
+                before = LOCAL_FALLBACKS.value(chain="classification", reason="error")
+                self.assertEqual(analyzer.classify_complaint("家里上网一直连不上"), "宽带")
+                self.assertEqual(
+                    LOCAL_FALLBACKS.value(chain="classification", reason="error"), before + 1
+                )
+            self.assertEqual(server.request_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
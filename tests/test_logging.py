@@ -0,0 +1,99 @@
+import json
+import logging
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from utils.logging import (
+    JsonFormatter,
+    SamplingFilter,
+    SizeAndTimeRotatingFileHandler,
+    _log_path,
+    _sampling_rates,
+    configure_logging,
+)
+
+
+class TestLogging(unittest.TestCase):
+    def test_configure_idempotent(self):
+        """测试重复配置不会重复添加处理器"""
+        configure_logging()
+        count = len(logging.getLogger().handlers)
+        configure_logging()
+        configure_logging()
+        self.assertEqual(len(logging.getLogger().handlers), count)
+
+    def test_log_path_per_process(self):
+        """多进程部署时每个进程写各自的日志文件"""
+        with patch.dict(os.environ, {"LOG_PER_PROCESS": "false"}):
+            self.assertEqual(os.path.basename(_log_path()), "app.log")
+        with patch.dict(os.environ, {"LOG_PER_PROCESS": "true"}):
+            self.assertEqual(os.path.basename(_log_path()), f"app-{os.getpid()}.log")
+
+    def test_json_formatter(self):
+        """测试结构化JSON输出和延迟插值"""
+        record = logging.LogRecord(
+            "services.llm", logging.INFO, __file__, 1, "分类: %s", ("宽带",), None
+        )
+        payload = json.loads(JsonFormatter().format(record))
+        self.assertEqual(payload["message"], "分类: 宽带")
+        self.assertEqual(payload["logger"], "services.llm")
+        self.assertEqual(payload["level"], "INFO")
+
+    def test_sampling_filter(self):
+        """测试按模块采样INFO日志，WARNING始终保留"""
+        sampler = SamplingFilter({"noisy": 0.0})
+
+        def make(name, level):
+            return logging.LogRecord(name, level, __file__, 1, "msg", (), None)
+
+        self.assertFalse(sampler.filter(make("noisy", logging.INFO)))
+        self.assertTrue(sampler.filter(make("noisy", logging.WARNING)))
+        self.assertTrue(sampler.filter(make("other", logging.INFO)))
+
+    def test_sampling_rates(self):
+        """测试默认不采样，环境变量中格式错误的项被忽略"""
+        with patch.dict(os.environ, {"LOG_SAMPLING": ""}):
+            self.assertEqual(_sampling_rates(), {})
+        with patch.dict(
+            os.environ, {"LOG_SAMPLING": "main=0.1, services.llm=abc,services.fetch,=0.5,x=2"}
+        ):
+            self.assertEqual(_sampling_rates(), {"main": 0.1})
+
+    def test_size_rotation(self):
+        """测试文件超过大小上限时轮转"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "app.log")
+            handler = SizeAndTimeRotatingFileHandler(
+                path, maxBytes=200, backupCount=2, encoding="utf-8"
+            )
+            try:
+                for i in range(20):
+                    handler.emit(
+                        logging.LogRecord(
+                            "t", logging.INFO, __file__, 1, "x" * 50, (), None
+                        )
+                    )
+            finally:
+                handler.close()
+            self.assertTrue(os.path.exists(path + ".1"))
+
+    def test_time_rotation(self):
+        """测试超过时间间隔时轮转"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "app.log")
+            handler = SizeAndTimeRotatingFileHandler(
+                path, interval=0, maxBytes=0, backupCount=2, encoding="utf-8"
+            )
+            try:
+                record = logging.LogRecord("t", logging.INFO, __file__, 1, "x", (), None)
+                handler.emit(record)
+                handler.emit(record)
+            finally:
+                handler.close()
+            self.assertTrue(os.path.exists(path + ".1"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,31 +1,64 @@
+import os
 import random
+import tempfile
 import unittest
 from datetime import datetime
+from unittest.mock import patch
 
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 
-from main import Base, SessionLocal, app
+from main import app, get_analytics_db, get_analyzer, get_db, get_read_db
+from services.incidents import IncidentTracker
+from services.llm import ComplaintAnalyzer
+from services.simulate import SIMULATE_API_MAX_COUNT
+from utils.cache import DATA_VERSION
+from utils.db import Base, data_version
+from utils.db import engine as app_engine
 
-# 配置测试数据库
+# 配置测试数据库，StaticPool 保证所有会话共用同一个内存数据库连接
 SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
 engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
+def override_get_db():
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
 class TestComplaintAPI(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
         Base.metadata.create_all(bind=engine)
         # 使用内存数据库覆盖原数据库配置
-        app.dependency_overrides[SessionLocal] = TestingSessionLocal
+        for dependency in (get_db, get_read_db, get_analytics_db):
+            app.dependency_overrides[dependency] = override_get_db
+        # ETag 和响应缓存使用测试数据库的数据版本，分析器使用临时数据库，不访问服务数据库
+        DATA_VERSION.attach(data_version(engine))
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.analyzer = ComplaintAnalyzer(db_path=os.path.join(cls.tmp.name, "analyzer.db"))
+        app.dependency_overrides[get_analyzer] = lambda: cls.analyzer
+        cls.analyzer_patch = patch("main.get_analyzer", lambda: cls.analyzer)
+        cls.analyzer_patch.start()
         cls.client = TestClient(app)
 
     @classmethod
     def tearDownClass(cls):
+        cls.analyzer_patch.stop()
+        cls.analyzer.engine.dispose()
+        cls.tmp.cleanup()
+        DATA_VERSION.attach(data_version(app_engine))
+        app.dependency_overrides.clear()
         Base.metadata.drop_all(bind=engine)
         engine.dispose()
 
@@ -120,6 +153,75 @@ class TestComplaintAPI(unittest.TestCase):
         categories = {item["complaint_category"] for item in response.json()}
         self.assertGreater(len(categories), 1)  # 确保生成多个品类
 
+    @patch.dict(os.environ, {"ADMIN_TOKEN": "secret"})
+    def test_simulate_bulk_endpoint(self):
+        spec = {"count": 500, "seed": 1, "category_weights": {"固话": 1}}
+        response = self.client.post("/simulate/bulk", json=spec)
+        self.assertEqual(response.status_code, 403)
+
+        admin = {"X-Admin-Token": "secret"}
+        response = self.client.post("/simulate/bulk", json=spec, headers=admin)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["inserted"], 500)
+
+        response = self.client.post("/simulate/bulk", json={"count": 0}, headers=admin)
+        self.assertEqual(response.status_code, 422)
+
+        response = self.client.post(
+            "/simulate/bulk", json={"count": SIMULATE_API_MAX_COUNT + 1}, headers=admin
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_incidents(self):
+        """新增的相近投诉归为同一热点事件"""
+        tracker = IncidentTracker(flush_interval=3600)
+        tracker.attach(engine)
+        now = datetime.now().isoformat()
+        for suffix in ("", "，急！", "，已经两小时了"):
+            response = self.client.post(
+                "/complaints/",
+                json={
+                    "complaint_time": now,
+                    "content": f"北区光缆中断整个小区宽带断网{suffix}",
+                    "user_id": "incident_user",
+                    "complaint_category": "宽带",
+                },
+            )
+            self.assertEqual(response.status_code, 200)
+
+        with patch("main.INCIDENTS", tracker):
+            response = self.client.get("/incidents?hours=1&limit=200")
+        self.assertEqual(response.status_code, 200)
+        incidents = [i for i in response.json() if i["sample"].startswith("北区光缆中断")]
+        self.assertEqual(len(incidents), 1)
+        self.assertEqual(incidents[0]["size"], 3)
+        self.assertEqual(incidents[0]["hourly"], [3])
+
+    def test_timeline(self):
+        for time in ("2025-03-01T01:10:00", "2025-03-01T01:50:00", "2025-03-03T00:00:00"):
+            self.client.post(
+                "/complaints/",
+                json={
+                    "complaint_time": time,
+                    "content": "网速慢",
+                    "user_id": "timeline_user",
+                    "complaint_category": "宽带",
+                },
+            )
+        response = self.client.get(
+            "/statistics/timeline?start=2025-03-01T00:00:00&end=2025-03-01T03:00:00"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["counts"], [0, 2, 0])
+        response = self.client.get(
+            "/statistics/timeline?start=2025-03-01T00:00:00&end=2025-03-04T00:00:00&bucket=day"
+        )
+        self.assertEqual(response.json()["counts"], [2, 0, 1])
+        response = self.client.get(
+            "/statistics/timeline?start=2025-03-02T00:00:00&end=2025-03-01T00:00:00"
+        )
+        self.assertEqual(response.status_code, 400)
+
     def test_query_with_search(self):
         # 需要根据实际query_parser_chain的实现调整测试逻辑
         # 这里测试基本查询功能
@@ -152,3 +254,66 @@ class TestComplaintAPI(unittest.TestCase):
         self.assertEqual(response.status_code, 400)
         response = self.client.post("/analyze/", json=invalid_data)
         self.assertEqual(response.status_code, 400)
+
+    def test_metrics_endpoint(self):
+        """测试指标导出和 Server-Timing 响应头"""
+        response = self.client.get("/complaints/?q=手机")
+        self.assertIn("total;dur=", response.headers["Server-Timing"])
+        self.assertIn("llm-query_parser;dur=", response.headers["Server-Timing"])
+
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/plain"))
+        self.assertIn("# TYPE llm_chain_latency_seconds histogram", response.text)
+
+    def test_conditional_get(self):
+        """测试 ETag 条件请求以及写入后缓存失效"""
+        response = self.client.get("/statistics/")
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers["ETag"]
+
+        response = self.client.get("/statistics/", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+
+        self.client.post(
+            "/complaints/",
+            json={
+                "complaint_time": "2025-01-01T00:00:00",
+                "content": "缓存失效测试",
+                "user_id": "cache_test_user",
+                "complaint_category": "固话",
+            },
+        )
+        response = self.client.get("/statistics/", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+    def test_read_complaints_columns_format(self):
+        """测试按列的紧凑格式与按行格式内容一致"""
+        for i in range(3):
+            self.client.post(
+                "/complaints/",
+                json={
+                    "complaint_time": "2025-01-01T00:00:00",
+                    "content": f"列格式测试{i}",
+                    "user_id": "columns_test_user",
+                    "complaint_category": "宽带",
+                },
+            )
+        records = self.client.get("/complaints/", params={"limit": 5}).json()
+        columns = self.client.get(
+            "/complaints/", params={"limit": 5, "format": "columns"}
+        ).json()
+        self.assertEqual(columns["id"], [item["id"] for item in records])
+        self.assertEqual(
+            columns["complaint_time"], [item["complaint_time"] for item in records]
+        )
+
+    def test_index_assets(self):
+        """测试首页引用带哈希的静态资源并支持条件请求"""
+        response = self.client.get("/")
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response.text, r"static/js/app\.[0-9a-f]{10}\.js")
+        response = self.client.get("/", headers={"If-None-Match": response.headers["ETag"]})
+        self.assertEqual(response.status_code, 304)
@@ -0,0 +1,78 @@
+import unittest
+
+from langchain_openai import ChatOpenAI
+from pydantic import SecretStr
+
+from services.instrumentation import (
+    CHAIN_LATENCY,
+    COMPLETION_TOKENS,
+    PROMPT_TOKENS,
+    InstrumentedChain,
+)
+from tests.fake_openai import FakeOpenAIServer
+from utils.metrics import (
+    MetricsRegistry,
+    record_timing,
+    reset_request_timing,
+    server_timing_header,
+    start_request_timing,
+)
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    def test_prometheus_format(self):
+        """测试 Prometheus 文本格式输出"""
+        registry = MetricsRegistry()
+        counter = registry.counter("requests_total", "请求数", ("route",))
+        counter.inc(route="/a")
+        counter.inc(2, route="/a")
+        histogram = registry.histogram(
+            "latency_seconds", "耗时", ("route",), buckets=(0.1, 1.0)
+        )
+        histogram.observe(0.05, route="/a")
+        histogram.observe(0.5, route="/a")
+        histogram.observe(5, route="/a")
+
+        text = registry.render()
+        self.assertIn("# TYPE requests_total counter", text)
+        self.assertIn('requests_total{route="/a"} 3', text)
+        self.assertIn('latency_seconds_bucket{route="/a",le="0.1"} 1', text)
+        self.assertIn('latency_seconds_bucket{route="/a",le="1"} 2', text)
+        self.assertIn('latency_seconds_bucket{route="/a",le="+Inf"} 3', text)
+        self.assertIn('latency_seconds_count{route="/a"} 3', text)
+
+    def test_server_timing(self):
+        """测试请求级耗时合并为 Server-Timing 头"""
+        record_timing("ignored", 1.0)  # 请求上下文外忽略
+        token = start_request_timing()
+        try:
+            record_timing("db", 0.002)
+            record_timing("db", 0.003)
+            record_timing("llm-reply", 0.1)
+            header = server_timing_header()
+        finally:
+            reset_request_timing(token)
+        self.assertEqual(header, 'db;dur=5.0;desc="x2", llm-reply;dur=100.0')
+
+
+class TestInstrumentedChain(unittest.TestCase):
+    def test_token_accounting(self):
+        """测试通过回调统计 token 用量和耗时"""
+        with FakeOpenAIServer() as server:
+            llm = ChatOpenAI(
+                model="fake-model",
+                api_key=SecretStr("test"),
+                base_url=server.base_url,
+                max_retries=0,
+            )
+            chain = InstrumentedChain(llm, "unit_test")
+            before = CHAIN_LATENCY.count(chain="unit_test", outcome="ok")
+            chain.invoke("网速慢")
+
+        self.assertEqual(CHAIN_LATENCY.count(chain="unit_test", outcome="ok"), before + 1)
+        self.assertGreaterEqual(PROMPT_TOKENS.value(chain="unit_test"), 12)
+        self.assertGreaterEqual(COMPLETION_TOKENS.value(chain="unit_test"), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import glob
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+from main import app
+from utils.cache import SQLiteCache
+from utils.profiling import SAMPLER, ProfilerSwitch, StackSampler
+
+ADMIN = {"X-Admin-Token": "secret"}
+
+
+def busy_marker(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+class TestStackSampler(unittest.TestCase):
+    def test_dump_folded_stacks(self):
+        with tempfile.TemporaryDirectory() as directory:
+            sampler = StackSampler(interval=0.005, dump_interval=3600, directory=directory, keep=2)
+            stop = threading.Event()
+            worker = threading.Thread(target=busy_marker, args=(stop,), name="busy-worker")
+            worker.start()
+            sampler.start()
+            time.sleep(0.2)
+            sampler.stop()
+            stop.set()
+            worker.join()
+
+            files = glob.glob(os.path.join(directory, "stacks-*.folded"))
+            self.assertEqual(len(files), 1)
+            with open(files[0], encoding="utf-8") as f:
+                lines = f.read().splitlines()
+            marker = [line for line in lines if "busy_marker" in line]
+            self.assertTrue(marker)
+            stack, count = marker[0].rsplit(" ", 1)
+            self.assertTrue(stack.startswith("busy-worker;"))
+            self.assertGreater(int(count), 0)
+            self.assertGreater(sampler.samples, 0)
+
+            # 超出保留数的旧文件被清理
+            for _ in range(3):
+                sampler.sample()
+                sampler.dump()
+                time.sleep(0.01)
+            self.assertEqual(len(glob.glob(os.path.join(directory, "stacks-*.folded"))), 2)
+
+
+class TestProfilerSwitch(unittest.TestCase):
+    def test_shared_toggle(self):
+        """一个进程写入开关，其它进程读取共享后端后跟随开启和关闭"""
+        with tempfile.TemporaryDirectory() as directory:
+            backend = SQLiteCache(os.path.join(directory, "cache.db"))
+            local, other = (
+                ProfilerSwitch(StackSampler(directory=directory), backend) for _ in range(2)
+            )
+            other.sync()
+            self.assertFalse(other.sampler.running)
+
+            local.set(True, 0.005)
+            self.assertTrue(local.sampler.running)
+            other.sync()
+            self.assertTrue(other.sampler.running)
+            self.assertEqual(other.sampler.interval, 0.005)
+
+            local.set(False)
+            self.assertFalse(local.sampler.running)
+            other.sync()
+            self.assertFalse(other.sampler.running)
+
+
+@patch.dict(os.environ, {"ADMIN_TOKEN": "secret"})
+class TestRequestProfiling(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.client = TestClient(app)
+
+    def test_profile_request(self):
+        response = self.client.get("/metrics?profile=cprofile", headers=ADMIN)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["X-Profile-Status"], "200")
+        self.assertIn("function calls", response.text)
+        self.assertIn("render", response.text)
+
+        response = self.client.get("/metrics", headers={**ADMIN, "X-Profile": "cprofile"})
+        self.assertIn("function calls", response.text)
+
+        response = self.client.get("/metrics?profile=cprofile")
+        self.assertEqual(response.status_code, 403)
+
+        response = self.client.get("/metrics", headers=ADMIN)
+        self.assertNotIn("X-Profile-Status", response.headers)
+        self.assertIn("# TYPE", response.text)
+
+    def test_reject_streaming_response(self):
+        """流式响应不会被缓存到结束，分析锁随即释放"""
+        response = self.client.get("/events/complaints?profile=cprofile", headers=ADMIN)
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get("/metrics?profile=cprofile", headers=ADMIN)
+        self.assertEqual(response.status_code, 200)
+
+    def test_toggle_sampler(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with patch.object(SAMPLER, "directory", directory):
+                response = self.client.post("/admin/profiler", json={"enabled": True})
+                self.assertEqual(response.status_code, 403)
+
+                response = self.client.post(
+                    "/admin/profiler", json={"enabled": True, "interval": 0.005}, headers=ADMIN
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response.json()["running"])
+                time.sleep(0.05)
+
+                response = self.client.post("/admin/profiler", json={"enabled": False}, headers=ADMIN)
+                self.assertFalse(response.json()["running"])
+                self.assertTrue(glob.glob(os.path.join(directory, "stacks-*.folded")))
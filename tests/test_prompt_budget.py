@@ -0,0 +1,87 @@
+import os
+import random
+import tempfile
+import unittest
+from unittest.mock import MagicMock, patch
+
+from services.llm import ComplaintAnalyzer
+from services.prompt_budget import OMITTED_MARK, PromptBudget
+
+LOG = "\n".join(f"2025-01-01 12:{i:02d}:00 ERROR pppoe timeout code=691" for i in range(40))
+
+
+class TestPromptBudget(unittest.TestCase):
+    def setUp(self):
+        self.budget = PromptBudget(tokenizer_name="estimate")
+
+    def test_clean(self):
+        text = (
+            "您好！！！！！！  家里宽带　一直掉线，急急急急急。\r\n\r\n\r\n"
+            f"{LOG}\n请尽快处理。请尽快处理。请尽快处理。\n"
+            "发自我的iPhone\n-----原始邮件-----\n之前的回复 https://example.com/a"
+        )
+        cleaned = self.budget.clean(text)
+        self.assertEqual(
+            cleaned,
+            "您好！！！ 家里宽带 一直掉线，急急急。\n\n"
+            "2025-01-01 12:00:00 ERROR pppoe timeout code=691\n"
+            "2025-01-01 12:01:00 ERROR pppoe timeout code=691\n"
+            "（省略38行重复内容）\n请尽快处理。请尽快处理。",
+        )
+        # 正文中间提到"来自我的"、链接和"本邮件"时只删除链接本身
+        for text, expected in (
+            (
+                "这个问题来自我的宽带账户，网络一直掉线，请尽快处理。",
+                "这个问题来自我的宽带账户，网络一直掉线，请尽快处理。",
+            ),
+            (
+                "我打开http://example.com/a?b=1时网页打不开，宽带很慢。",
+                "我打开时网页打不开，宽带很慢。",
+            ),
+            (
+                "本邮件删除了吗？我没收到账单。\n本邮件及附件含保密信息，如误收请删除。",
+                "本邮件删除了吗？我没收到账单。",
+            ),
+        ):
+            self.assertEqual(self.budget.clean(text), expected)
+        # 只有固定内容时保留原文
+        self.assertEqual(self.budget.fit("classification", "发自我的iPhone"), "发自我的iPhone")
+
+    def test_truncate_to_budget(self):
+        random.seed(1)
+        text = "".join(chr(random.randint(0x4E00, 0x9FA5)) for _ in range(2000))
+        fitted = self.budget.fit("classification", text)
+        tokenizer = self.budget.tokenizer
+        self.assertLessEqual(tokenizer.count(fitted), self.budget.budgets["classification"])
+        head, tail = fitted.split(OMITTED_MARK)
+        self.assertTrue(text.startswith(head))
+        self.assertTrue(text.endswith(tail))
+        self.assertGreater(len(head), len(tail))
+
+        short = "手机信号差"
+        self.assertEqual(self.budget.fit("classification", short), short)
+
+    def test_query_not_rewritten(self):
+        query = "  查找用户 USER0000 的投诉！！！！  "
+        self.assertEqual(
+            self.budget.fit("query_parser", query, clean=False), "查找用户 USER0000 的投诉！！！！"
+        )
+
+
+@patch.dict(
+    os.environ,
+    {"LLM_MODE": "online", "API_KEY": "test", "MODEL_NAME": "test-model", "PROMPT_TOKENIZER": "estimate"},
+)
+class TestAnalyzerPromptBudget(unittest.TestCase):
+    def test_chain_receives_fitted_text(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with ComplaintAnalyzer(os.path.join(directory, "test.db")) as analyzer:
+                analyzer.classification_chain = MagicMock()
+                analyzer.classification_chain.invoke.return_value = "其它"
+                text = "账单金额不对\n" + LOG + "\n" + "长" * 3000
+                analyzer.classify_complaint(text)
+
+                sent = analyzer.classification_chain.invoke.call_args[0][0]
+                self.assertTrue(sent.startswith("账单金额不对\n"))
+                self.assertIn("（省略38行重复内容）", sent)
+                self.assertLess(len(sent), len(text) // 10)
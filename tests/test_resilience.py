@@ -0,0 +1,153 @@
+import time
+import unittest
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain_openai import ChatOpenAI
+from pydantic import SecretStr
+
+from services.dispatcher import DISPATCHED, DispatchedChain, LLMDispatcher, LoadShedError, Priority
+from services.resilience import (
+    CallTimeoutError,
+    CircuitBreaker,
+    CircuitOpenError,
+    ResilientChain,
+    ResiliencePolicy,
+)
+from tests.fake_openai import FakeOpenAIServer
+
+
+class TestResilientChain(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeOpenAIServer().__enter__()
+
+    def tearDown(self):
+        self.server.__exit__(None, None, None)
+
+    def _chain(self, policy, breaker=None, dispatcher=None):
+        llm = ChatOpenAI(
+            model="fake-model",
+            api_key=SecretStr("test"),
+            base_url=self.server.base_url,
+            timeout=policy.timeout,
+            max_retries=0,
+        )
+        if dispatcher is None:
+            return ResilientChain(llm | StrOutputParser(), "test", breaker, policy)
+        dispatched = DispatchedChain(llm | StrOutputParser(), "test", dispatcher)
+        return ResilientChain(dispatched.chain, "test", breaker, policy, admit=dispatched.admit)
+
+    def test_success(self):
+        """测试正常调用"""
+        chain = self._chain(ResiliencePolicy(timeout=5, max_retries=0))
+        self.assertEqual(chain.invoke("网速慢"), "宽带")
+        self.assertEqual(self.server.request_count, 1)
+
+    def test_deadline(self):
+        """测试超过截止时间立即返回超时错误"""
+        self.server.default_delay = 2.0
+        chain = self._chain(ResiliencePolicy(timeout=0.3, max_retries=0))
+        start = time.monotonic()
+        with self.assertRaises(CallTimeoutError):
+            chain.invoke("网速慢")
+        self.assertLess(time.monotonic() - start, 1.5)
+
+    def test_retry_on_server_error(self):
+        """测试5xx错误后重试成功"""
+        self.server.statuses = [500, 503]
+        chain = self._chain(
+            ResiliencePolicy(timeout=5, max_retries=2, backoff_base=0.01)
+        )
+        self.assertEqual(chain.invoke("网速慢"), "宽带")
+        self.assertEqual(self.server.request_count, 3)
+
+    def test_no_retry_on_client_error(self):
+        """测试4xx错误不重试"""
+        self.server.statuses = [400]
+        chain = self._chain(
+            ResiliencePolicy(timeout=5, max_retries=2, backoff_base=0.01)
+        )
+        with self.assertRaises(Exception):
+            chain.invoke("网速慢")
+        self.assertEqual(self.server.request_count, 1)
+
+    def test_circuit_breaker_opens(self):
+        """测试错误率过高后熔断，不再访问端点"""
+        self.server.default_status = 500
+        breaker = CircuitBreaker(
+            failure_rate=0.5, window=10, min_calls=3, reset_timeout=60
+        )
+        chain = self._chain(
+            ResiliencePolicy(timeout=5, max_retries=0, backoff_base=0.01), breaker
+        )
+        for _ in range(3):
+            with self.assertRaises(Exception):
+                chain.invoke("网速慢")
+        self.assertEqual(breaker.state, "open")
+
+        count = self.server.request_count
+        with self.assertRaises(CircuitOpenError):
+            chain.invoke("网速慢")
+        self.assertEqual(self.server.request_count, count)
+
+    def test_circuit_breaker_half_open_recovers(self):
+        """测试熔断到期后探测成功恢复"""
+        breaker = CircuitBreaker(
+            failure_rate=0.5, window=10, min_calls=1, reset_timeout=0.1
+        )
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+        time.sleep(0.15)
+        chain = self._chain(ResiliencePolicy(timeout=5, max_retries=0), breaker)
+        self.assertEqual(chain.invoke("网速慢"), "宽带")
+        self.assertEqual(breaker.state, "closed")
+
+    def test_hedged_request(self):
+        """测试首个请求过慢时对冲请求先返回"""
+        self.server.delays = [2.0, 0.0]
+        chain = self._chain(
+            ResiliencePolicy(timeout=5, max_retries=0, hedge_delay=0.2)
+        )
+        start = time.monotonic()
+        self.assertEqual(chain.invoke("网速慢"), "宽带")
+        self.assertLess(time.monotonic() - start, 1.5)
+        self.assertEqual(self.server.request_count, 2)
+
+
+    def test_retries_and_hedges_use_dispatcher_quota(self):
+        """测试每次重试和对冲请求都经调度器扣减配额，配额不足时不发出对冲请求"""
+        deadlines = {p: 60 for p in Priority}
+        dispatcher = LLMDispatcher(600, 0, deadlines)
+        self.server.statuses = [500, 503]
+        chain = self._chain(
+            ResiliencePolicy(timeout=5, max_retries=2, backoff_base=0.01), dispatcher=dispatcher
+        )
+        before = DISPATCHED.value(priority="interactive", outcome="granted")
+        self.assertEqual(chain.invoke("网速慢"), "宽带")
+        self.assertEqual(DISPATCHED.value(priority="interactive", outcome="granted"), before + 3)
+
+        # 请求配额只够首次请求，不发出对冲请求
+        dispatcher = LLMDispatcher(60, 0, deadlines)
+        dispatcher.requests.tokens = 1
+        self.server.delays = [0.5]
+        chain = self._chain(
+            ResiliencePolicy(timeout=5, max_retries=0, hedge_delay=0.1), dispatcher=dispatcher
+        )
+        self.assertEqual(chain.invoke("网速慢"), "宽带")
+        self.assertEqual(self.server.request_count, 4)
+
+        # 重试排队超过截止时间时放弃，不计入熔断
+        breaker = CircuitBreaker(min_calls=10)
+        dispatcher = LLMDispatcher(60, 0, {p: 0.05 for p in Priority})
+        dispatcher.requests.tokens = 1
+        self.server.statuses = [500]
+        chain = self._chain(
+            ResiliencePolicy(timeout=5, max_retries=1, backoff_base=0.01), breaker, dispatcher
+        )
+        with self.assertRaises(LoadShedError):
+            chain.invoke("网速慢")
+        self.assertEqual(self.server.request_count, 5)
+        self.assertEqual(list(breaker._outcomes), [False])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+import json
+import unittest
+from datetime import datetime
+
+from fastapi.encoders import jsonable_encoder
+
+from main import COMPLAINT_COLUMNS, ComplaintResponse
+from utils.serialization import dumps, rows_to_columns, rows_to_records
+
+ROWS = [
+    (1, datetime(2025, 1, 1, 8, 30), "手机信号差", "user_1", "手机", None),
+    (2, datetime(2025, 1, 2, 9, 0, 0, 123456), "宽带网速慢", "user_2", "宽带", "已处理"),
+]
+
+
+class TestSerialization(unittest.TestCase):
+    def test_records_match_pydantic_output(self):
+        """测试快速路径与 Pydantic 序列化结果一致"""
+        expected = jsonable_encoder(
+            [
+                ComplaintResponse.model_validate(dict(zip(COMPLAINT_COLUMNS, row)))
+                for row in ROWS
+            ]
+        )
+        actual = json.loads(dumps(rows_to_records(COMPLAINT_COLUMNS, ROWS)))
+        self.assertEqual(actual, expected)
+
+    def test_columns(self):
+        """测试按列的紧凑格式"""
+        data = rows_to_columns(COMPLAINT_COLUMNS, ROWS)
+        self.assertEqual(data["id"], [1, 2])
+        self.assertEqual(data["reply"], [None, "已处理"])
+        self.assertEqual(rows_to_columns(COMPLAINT_COLUMNS, [])["id"], [])
+
+    def test_dumps_non_ascii(self):
+        self.assertEqual(dumps({"手机": 1}).decode("utf-8"), '{"手机":1}')
+
+
+if __name__ == "__main__":
+    unittest.main()
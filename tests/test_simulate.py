@@ -0,0 +1,82 @@
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime
+
+from pydantic import ValidationError
+from sqlalchemy import create_engine, text
+
+from services.fetch import import_data_to_db
+from services.simulate import (
+    SimulationSpec,
+    bulk_insert,
+    generate_batches,
+    write_jsonl,
+)
+from utils.db import Base
+
+
+class TestSimulate(unittest.TestCase):
+    def test_generate_batches(self):
+        """测试批次大小、时间范围、分类分布和用户基数"""
+        spec = SimulationSpec(
+            count=2500,
+            start=datetime(2025, 1, 1),
+            end=datetime(2025, 2, 1),
+            category_weights={"手机": 1, "宽带": 1},
+            user_cardinality=20,
+            reply_rate=0.0,
+            seed=3,
+            batch_size=1000,
+        )
+        batches = list(generate_batches(spec))
+        self.assertEqual([len(b) for b in batches], [1000, 1000, 500])
+        rows = [row for batch in batches for row in batch]
+        times = [row[0] for row in rows]
+        self.assertEqual(times, sorted(times))
+        self.assertGreaterEqual(times[0], "2025-01-01")
+        self.assertLess(times[-1], "2025-02-01")
+        self.assertEqual({row[3] for row in rows}, {"手机", "宽带"})
+        self.assertLessEqual(len({row[2] for row in rows}), 20)
+        self.assertTrue(all(row[4] is None for row in rows))
+        self.assertTrue(all(row[1].startswith(f"我的{row[3]}") for row in rows))
+
+    def test_seed_reproducible(self):
+        """测试相同种子生成相同数据"""
+        spec = SimulationSpec(
+            count=100, start=datetime(2025, 1, 1), end=datetime(2025, 1, 2), seed=1
+        )
+        self.assertEqual(list(generate_batches(spec)), list(generate_batches(spec)))
+
+    def test_invalid_spec(self):
+        """测试非法参数"""
+        with self.assertRaises(ValidationError):
+            SimulationSpec(count=10, category_weights={"电视": 1})
+        with self.assertRaises(ValidationError):
+            SimulationSpec(
+                count=10, start=datetime(2025, 2, 1), end=datetime(2025, 1, 1)
+            )
+
+    def test_bulk_insert_and_jsonl(self):
+        """测试批量写入数据库以及JSONL输出可被导入"""
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bulk.db')}")
+            Base.metadata.create_all(bind=engine)
+            spec = SimulationSpec(count=3000, seed=5, batch_size=1000)
+            self.assertEqual(bulk_insert(engine, spec, rows_per_transaction=1500), 3000)
+            with engine.connect() as conn:
+                count = conn.execute(text("SELECT COUNT(*) FROM complaints")).scalar()
+            engine.dispose()
+            self.assertEqual(count, 3000)
+
+            path = os.path.join(tmp, "complaints.jsonl")
+            self.assertEqual(write_jsonl(path, SimulationSpec(count=50, seed=5)), 50)
+            with open(path, encoding="utf-8") as f:
+                first = json.loads(f.readline())
+            self.assertEqual(len(first["complaint_time"]), 19)
+            self.assertTrue(import_data_to_db(path, os.path.join(tmp, "import.db")))
+
+
+if __name__ == "__main__":
+    unittest.main()
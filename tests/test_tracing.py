@@ -0,0 +1,103 @@
+import io
+import json
+import time
+import unittest
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from utils.tracing import (
+    DB_QUERIES_PER_REQUEST,
+    N_PLUS_ONE,
+    REQUEST_LATENCY,
+    RequestTracingMiddleware,
+    Span,
+    SpanExporter,
+)
+
+engine = create_engine("sqlite:///:memory:")
+
+app = FastAPI()
+app.add_middleware(RequestTracingMiddleware)
+
+
+@app.get("/items/{item_id}")
+def read_item(item_id: int):
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    return {"id": item_id}
+
+
+@app.get("/loop/")
+def read_loop():
+    with engine.connect() as conn:
+        for i in range(12):
+            conn.execute(text("SELECT :i"), {"i": i})
+    return {"ok": True}
+
+
+class TestRequestTracing(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.client = TestClient(app)
+
+    def test_route_metrics(self):
+        """测试按路由模板记录耗时和SQL语句数"""
+        before = REQUEST_LATENCY.count(
+            method="GET", route="/items/{item_id}", status="200"
+        )
+        response = self.client.get("/items/42")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("db;dur=", response.headers["Server-Timing"])
+        self.assertEqual(
+            REQUEST_LATENCY.count(method="GET", route="/items/{item_id}", status="200"),
+            before + 1,
+        )
+        self.assertGreaterEqual(DB_QUERIES_PER_REQUEST.count(route="/items/{item_id}"), 1)
+
+    def test_unmatched_route(self):
+        """测试未匹配路由归为同一标签"""
+        self.client.get("/no-such-path/123")
+        self.assertGreaterEqual(
+            REQUEST_LATENCY.count(method="GET", route="<unmatched>", status="404"), 1
+        )
+
+    def test_n_plus_one_detection(self):
+        """测试同一语句重复执行时标记 N+1"""
+        before = N_PLUS_ONE.value(route="/loop/")
+        with self.assertLogs("utils.tracing", level="WARNING") as logs:
+            self.client.get("/loop/")
+        self.assertEqual(N_PLUS_ONE.value(route="/loop/"), before + 1)
+        self.assertTrue(any("N+1" in line for line in logs.output))
+
+
+class TestSpanExporter(unittest.TestCase):
+    def test_otlp_json_lines(self):
+        """测试导出 OTLP/JSON 兼容的 span 记录"""
+        stream = io.StringIO()
+        exporter = SpanExporter(lambda: stream)
+        root = Span("GET /items/{item_id}", kind=2)
+        root.attributes["http.status_code"] = 200
+        child = Span("db.query", trace_id=root.trace_id, parent_id=root.span_id)
+        child.end()
+        root.end()
+        exporter.export([root, child])
+        exporter.shutdown()
+
+        deadline = time.time() + 2
+        while not stream.getvalue() and time.time() < deadline:
+            time.sleep(0.01)
+        record = json.loads(stream.getvalue().splitlines()[0])
+        spans = record["resourceSpans"][0]["scopeSpans"][0]["spans"]
+        self.assertEqual(len(spans), 2)
+        self.assertEqual(spans[1]["parentSpanId"], spans[0]["spanId"])
+        self.assertEqual(len(spans[0]["traceId"]), 32)
+        self.assertEqual(
+            spans[0]["attributes"][0],
+            {"key": "http.status_code", "value": {"intValue": "200"}},
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import multiprocessing
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from utils import workers
+
+
+def _try_leadership(lock_dir: str, queue):
+    workers.LOCK_DIR = lock_dir
+    queue.put(workers.acquire_leadership("snapshot"))
+
+
+class TestWorkers(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        for name, value in (
+            ("LOCK_DIR", self.tmp.name),
+            ("_completed", set()),
+            ("_leader_locks", {}),
+        ):
+            patcher = patch.object(workers, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_run_once(self):
+        calls = []
+        self.assertTrue(workers.run_once("schema", lambda: calls.append(1)))
+        self.assertFalse(workers.run_once("schema", lambda: calls.append(1)))
+        self.assertEqual(calls, [1])
+
+    def test_run_once_skipped_by_launcher(self):
+        """启动器已完成的任务，子进程通过环境变量得知后跳过"""
+        with patch.dict(os.environ, {workers.STARTUP_ENV: ""}):
+            workers.run_once("schema", lambda: None)
+            workers.export_completed()
+            workers._completed.clear()
+            calls = []
+            self.assertFalse(workers.run_once("schema", lambda: calls.append(1)))
+            self.assertEqual(calls, [])
+
+    @unittest.skipIf(workers.fcntl is None, "需要 fcntl")
+    def test_single_leader(self):
+        self.assertTrue(workers.acquire_leadership("snapshot"))
+        self.addCleanup(os.close, workers._leader_locks["snapshot"])
+        queue = multiprocessing.get_context("spawn").Queue()
+        process = multiprocessing.get_context("spawn").Process(
+            target=_try_leadership, args=(self.tmp.name, queue)
+        )
+        process.start()
+        process.join()
+        self.assertFalse(queue.get(timeout=5))
+
+
+    @unittest.skipIf(workers.fcntl is None, "需要 fcntl")
+    def test_forked_child_not_leader(self):
+        """fork 出的子进程不继承选举结果，父进程持有锁时竞选失败"""
+        self.assertTrue(workers.acquire_leadership("snapshot"))
+        self.addCleanup(os.close, workers._leader_locks["snapshot"])
+        context = multiprocessing.get_context("fork")
+        queue = context.Queue()
+        process = context.Process(target=_try_leadership, args=(self.tmp.name, queue))
+        process.start()
+        process.join()
+        self.assertFalse(queue.get(timeout=5))
+        self.assertIn("snapshot", workers._leader_locks)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+import hashlib
+import mimetypes
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from starlette.responses import Response
+
+from utils.cache import etag_matches
+from utils.compression import available_encodings, choose_encoding, compress
+
+# 带内容哈希的文件名永不变化，可以长期缓存；其它资源每次都需要协商
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+_ASSET_REF = re.compile(r"""(?P<prefix>(?:src|href)=["'])/?static/(?P<path>[^"']+)""")
+
+
+@dataclass
+class Asset:
+    """一个静态资源及其预压缩版本"""
+
+    path: str
+    media_type: str
+    body: bytes
+    digest: str
+    encoded: Dict[str, bytes] = field(default_factory=dict)
+
+    def etag(self, encoding: Optional[str] = None) -> str:
+        """不同编码的表示使用不同的 ETag"""
+        suffix = f"-{encoding}" if encoding else ""
+        return f'"{self.digest[:32]}{suffix}"'
+
+    @property
+    def hashed_path(self) -> str:
+        stem, ext = os.path.splitext(self.path)
+        return f"{stem}.{self.digest[:10]}{ext}"
+
+
+def _load(path: str, body: bytes) -> Asset:
+    media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    if media_type.startswith("text/") or media_type == "application/javascript":
+        media_type += "; charset=utf-8"
+    asset = Asset(
+        path=path,
+        media_type=media_type,
+        body=body,
+        digest=hashlib.sha256(body).hexdigest(),
+    )
+    if media_type.startswith(("text/", "application/javascript", "image/svg+xml")):
+        # 启动时以最高压缩级别预压缩一次，请求时直接返回
+        for encoding in available_encodings():
+            data = compress(body, encoding, level=11 if encoding == "br" else 9)
+            if len(data) < len(body):
+                asset.encoded[encoding] = data
+    return asset
+
+
+class StaticAssets:
+    """内存中的静态资源：内容哈希文件名、预压缩和 ETag
+
+    /static/js/app.js 与 /static/js/app.<哈希>.js 返回同一内容，前者每次协商缓存，
+    后者可被浏览器长期缓存。页面中的资源引用在启动时替换为带哈希的文件名。
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.assets: Dict[str, Asset] = {}
+        self.hashed: Dict[str, Asset] = {}
+        self.reload()
+
+    def reload(self):
+        assets = {}
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                full = os.path.join(root, name)
+                rel = os.path.relpath(full, self.directory).replace(os.sep, "/")
+                with open(full, "rb") as f:
+                    assets[rel] = _load(rel, f.read())
+        self.assets = assets
+        self.hashed = {asset.hashed_path: asset for asset in assets.values()}
+
+    def url(self, path: str) -> str:
+        asset = self.assets.get(path)
+        return f"static/{asset.hashed_path if asset else path}"
+
+    def render_page(self, path: str) -> Asset:
+        """读取 HTML 页面并把其中的静态资源引用改为带哈希的文件名"""
+        with open(path, "r", encoding="utf-8") as f:
+            html = f.read()
+        html = _ASSET_REF.sub(
+            lambda m: m.group("prefix") + self.url(m.group("path")), html
+        )
+        return _load(path, html.encode("utf-8"))
+
+    def lookup(self, path: str) -> Optional[tuple]:
+        if path in self.hashed:
+            return self.hashed[path], IMMUTABLE_CACHE_CONTROL
+        if path in self.assets:
+            return self.assets[path], REVALIDATE_CACHE_CONTROL
+        return None
+
+    async def __call__(self, scope, receive, send):
+        path = scope["path"][len(scope.get("root_path", "")):].lstrip("/")
+        if path.startswith("static/"):
+            path = path[len("static/"):]
+        found = self.lookup(path)
+        if found is None or scope["method"] not in ("GET", "HEAD"):
+            response = Response("Not Found", status_code=404)
+        else:
+            response = asset_response(scope, *found)
+        await response(scope, receive, send)
+
+
+def asset_response(scope, asset: Asset, cache_control: str) -> Response:
+    """按请求头返回 304、预压缩版本或原始内容"""
+    request_headers = {
+        k.decode("latin-1"): v.decode("latin-1") for k, v in scope["headers"]
+    }
+    encoding = choose_encoding(request_headers.get("accept-encoding", ""))
+    if encoding not in asset.encoded:
+        encoding = None
+    headers = {
+        "ETag": asset.etag(encoding),
+        "Cache-Control": cache_control,
+        "Vary": "Accept-Encoding",
+    }
+    if etag_matches(request_headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    body = asset.body
+    if encoding:
+        body = asset.encoded[encoding]
+        headers["Content-Encoding"] = encoding
+    if scope["method"] == "HEAD":
+        headers["Content-Length"] = str(len(body))
+        body = b""
+    return Response(body, media_type=asset.media_type, headers=headers)
@@ -0,0 +1,312 @@
+import hashlib
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple, Union
+
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+CACHE_REQUESTS = REGISTRY.counter(
+    "response_cache_requests_total", "读接口响应缓存查询次数", ("result",)
+)
+SHARED_CACHE_REQUESTS = REGISTRY.counter(
+    "shared_cache_requests_total", "跨进程共享缓存查询次数", ("result",)
+)
+
+# 共享缓存后端：memory（进程内，默认）、sqlite:///路径 或 redis://主机:端口/库
+CACHE_BACKEND_URL = os.getenv("CACHE_BACKEND", "memory")
+# 多进程部署未指定后端时使用的 SQLite 共享缓存
+DEFAULT_SHARED_CACHE = "sqlite:///./data/cache.db"
+SHARED_CACHE_MAX_ENTRIES = int(os.getenv("SHARED_CACHE_MAX_ENTRIES", "10000"))
+
+Value = Union[bytes, str, int, float]
+
+
+def _encode(value: Value) -> bytes:
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode("utf-8")
+
+
+class SQLiteCache:
+    """以 SQLite 文件实现的 Redis 兼容子集（get/set/incr/delete/flushdb/ping）
+
+    同一台机器上的多个工作进程打开同一文件即共享缓存，无需部署 Redis；
+    接口与 redis.Redis 一致，切换到 Redis 只需修改 CACHE_BACKEND。
+    每个线程使用独立连接，fork 后的子进程自动重新连接。
+    """
+
+    _PRUNE_EVERY = 256
+
+    def __init__(self, path: str, max_entries: int = SHARED_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL"
+            ") WITHOUT ROWID"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            # 缓存数据丢失无害，关闭同步刷盘换取写入速度
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = OFF")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def ping(self) -> bool:
+        self._conn().execute("SELECT 1")
+        return True
+
+    def get(self, name: str) -> Optional[bytes]:
+        row = self._conn().execute(
+            "SELECT value, expires_at FROM cache WHERE key = ?", (name,)
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return None
+        return _encode(row[0])
+
+    def set(
+        self, name: str, value: Value, ex: Optional[float] = None, nx: bool = False
+    ) -> Optional[bool]:
+        """写入键值；ex 为过期秒数，nx=True 时仅在键不存在（或已过期）时写入"""
+        expires_at = time.time() + ex if ex else None
+        now = time.time()
+        if nx:
+            cursor = self._conn().execute(
+                "INSERT INTO cache (key, value, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, "
+                "expires_at = excluded.expires_at "
+                "WHERE cache.expires_at IS NOT NULL AND cache.expires_at < ?",
+                (name, _encode(value), expires_at, now),
+            )
+            written = cursor.rowcount > 0
+        else:
+            self._conn().execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (name, _encode(value), expires_at),
+            )
+            written = True
+        self._writes += 1
+        if self._writes % self._PRUNE_EVERY == 0:
+            self._prune()
+        return True if written else None
+
+    def incr(self, name: str, amount: int = 1) -> int:
+        """原子递增整数值，键不存在时从0开始"""
+        row = self._conn().execute(
+            "INSERT INTO cache (key, value, expires_at) VALUES (?, ?, NULL) "
+            "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + ? "
+            "RETURNING value",
+            (name, amount, amount),
+        ).fetchone()
+        return int(row[0])
+
+    def delete(self, *names: str) -> int:
+        if not names:
+            return 0
+        marks = ", ".join("?" * len(names))
+        cursor = self._conn().execute(
+            f"DELETE FROM cache WHERE key IN ({marks})", names
+        )
+        return cursor.rowcount
+
+    def flushdb(self) -> bool:
+        self._conn().execute("DELETE FROM cache")
+        return True
+
+    def _prune(self):
+        """删除过期条目，条目过多时淘汰最早过期的带过期时间条目"""
+        conn = self._conn()
+        conn.execute(
+            "DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at < ?",
+            (time.time(),),
+        )
+        excess = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0] - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache "
+                "WHERE expires_at IS NOT NULL ORDER BY expires_at LIMIT ?)",
+                (excess,),
+            )
+
+
+def create_cache_backend(url: str = CACHE_BACKEND_URL):
+    """按地址创建共享缓存后端；memory 返回 None，表示只使用进程内缓存"""
+    if not url or url == "memory":
+        return None
+    if url.startswith("sqlite:///"):
+        return SQLiteCache(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        try:
+            import redis
+        except ImportError as e:  # redis 为可选依赖
+            raise RuntimeError("使用 Redis 缓存需要安装 redis 包") from e
+        return redis.Redis.from_url(url)
+    raise ValueError(f"不支持的缓存后端: {url}")
+
+
+class DataVersion:
+    """数据版本号：所有写路径提交后递增，读接口据此生成 ETag 和缓存键
+
+    boot_id 区分实例，避免重启后版本号归零导致旧 ETag 误匹配。
+    服务和命令行进程通过 attach 改用保存在数据库中的版本号（utils.db.DatabaseVersion），
+    任一进程写入后所有进程的缓存和 ETag 同时失效；未挂载时配置了共享后端则保存在后端中，
+    否则只在进程内有效。
+    """
+
+    def __init__(self, backend=None, key: str = "scs:data_version"):
+        self.backend = backend
+        self.key = key
+        self.store = None
+        self._value = 0
+        self._lock = threading.Lock()
+        if backend is None:
+            self._boot_id = secrets.token_hex(4)
+        else:
+            backend.set(f"{key}:boot", secrets.token_hex(4), nx=True)
+            self._boot_id = backend.get(f"{key}:boot").decode()
+
+    def attach(self, store):
+        """改用 store 保存版本号，store 提供 epoch、get() 和 bump()"""
+        self.store = store
+
+    @property
+    def boot_id(self) -> str:
+        return self.store.epoch if self.store is not None else self._boot_id
+
+    def get(self) -> int:
+        if self.store is not None:
+            return self.store.get()
+        if self.backend is not None:
+            return int(self.backend.get(self.key) or 0)
+        return self._value
+
+    def bump(self) -> int:
+        if self.store is not None:
+            return self.store.bump()
+        if self.backend is not None:
+            return self.backend.incr(self.key)
+        with self._lock:
+            self._value += 1
+            return self._value
+
+
+class TTLCache:
+    """带过期时间的LRU缓存，用于保存序列化后的响应字节"""
+
+    def __init__(self, max_entries: int = 512, ttl: float = 30.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        with self._lock:
+            self._data[key] = (time.monotonic() + (ttl or self.ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class TieredCache:
+    """进程内 TTLCache 在前、共享后端在后的两级缓存
+
+    一个工作进程生成的响应其它进程也能命中，工作进程增多时命中率不会被摊薄。
+    键中包含数据版本号，进程内副本不会因其它进程的写入而过期。
+    共享后端不可用时退化为只使用进程内缓存。
+    """
+
+    def __init__(self, local: TTLCache, backend, prefix: str = "scs:response:"):
+        self.local = local
+        self.backend = backend
+        self.prefix = prefix
+
+    def _name(self, key: Hashable) -> str:
+        raw = "\x1f".join(map(str, key)) if isinstance(key, tuple) else str(key)
+        return self.prefix + hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        try:
+            value = self.backend.get(self._name(key))
+        except Exception as e:
+            SHARED_CACHE_REQUESTS.inc(result="error")
+            logger.warning("读取共享缓存失败: %s", e)
+            return None
+        SHARED_CACHE_REQUESTS.inc(result="miss" if value is None else "hit")
+        if value is not None:
+            self.local.set(key, value)
+        return value
+
+    def set(self, key: Hashable, value: bytes, ttl: Optional[float] = None):
+        self.local.set(key, value, ttl)
+        try:
+            self.backend.set(self._name(key), value, ex=ttl or self.local.ttl)
+        except Exception as e:
+            SHARED_CACHE_REQUESTS.inc(result="error")
+            logger.warning("写入共享缓存失败: %s", e)
+
+    def clear(self):
+        self.local.clear()
+
+
+CACHE_BACKEND = create_cache_backend()
+DATA_VERSION = DataVersion(CACHE_BACKEND)
+_LOCAL_RESPONSE_CACHE = TTLCache(
+    max_entries=int(os.getenv("RESPONSE_CACHE_SIZE", "512")),
+    ttl=float(os.getenv("RESPONSE_CACHE_TTL", "30")),
+)
+RESPONSE_CACHE = (
+    _LOCAL_RESPONSE_CACHE
+    if CACHE_BACKEND is None
+    else TieredCache(_LOCAL_RESPONSE_CACHE, CACHE_BACKEND)
+)
+
+
+def make_etag(version: int, *parts: str) -> str:
+    """由数据版本和请求路径、参数生成 ETag"""
+    digest = hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()[:16]
+    return f'"{DATA_VERSION.boot_id}-{version}-{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """判断 If-None-Match 请求头是否命中当前 ETag（支持多值和弱校验前缀）"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in candidates
@@ -0,0 +1,188 @@
+import gzip
+import os
+import zlib
+from typing import List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # brotli 为可选依赖，未安装时只使用 gzip
+    brotli = None
+
+# 响应体小于该字节数时不压缩，压缩收益抵不上CPU和头部开销
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/javascript",
+    "text/",
+    "image/svg+xml",
+)
+# 流式推送需要逐条即时送达，不参与压缩
+EXCLUDED_TYPES = ("text/event-stream",)
+
+
+def available_encodings() -> Tuple[str, ...]:
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """根据 Accept-Encoding 选择编码，优先 brotli，忽略 q=0 的编码"""
+    accepted = set()
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        key, _, value = params.replace(" ", "").partition("=")
+        if key == "q":
+            try:
+                if float(value) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(name.strip())
+    for encoding in available_encodings():
+        if encoding in accepted or "*" in accepted:
+            return encoding
+    return None
+
+
+def compress(data: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    if encoding == "br":
+        return brotli.compress(
+            data, quality=BROTLI_QUALITY if level is None else level
+        )
+    return gzip.compress(data, GZIP_LEVEL if level is None else level, mtime=0)
+
+
+class _StreamCompressor:
+    """分块压缩器，每块都刷新输出，保证客户端能及时收到已生成的数据"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, chunk: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(chunk) + self._compressor.flush()
+        return self._compressor.compress(chunk) + self._compressor.flush(
+            zlib.Z_SYNC_FLUSH
+        )
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+def _is_compressible(content_type: str) -> bool:
+    if content_type.startswith(EXCLUDED_TYPES):
+        return False
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+def _set_header(headers: List[Tuple[bytes, bytes]], name: bytes, value: bytes):
+    headers[:] = [(k, v) for k, v in headers if k.lower() != name]
+    headers.append((name, value))
+
+
+def _add_vary(headers: List[Tuple[bytes, bytes]]):
+    for i, (k, v) in enumerate(headers):
+        if k.lower() == b"vary":
+            if b"accept-encoding" not in v.lower():
+                headers[i] = (k, v + b", Accept-Encoding")
+            return
+    headers.append((b"vary", b"Accept-Encoding"))
+
+
+def _weaken_etag(headers: List[Tuple[bytes, bytes]]):
+    """压缩后的表示与原始字节不同，强 ETag 改为弱 ETag"""
+    for i, (k, v) in enumerate(headers):
+        if k.lower() == b"etag" and not v.startswith(b"W/"):
+            headers[i] = (k, b"W/" + v)
+
+
+class CompressionMiddleware:
+    """按 Accept-Encoding 对响应进行 brotli/gzip 压缩
+
+    小于 minimum_size 的响应、已编码的响应（如预压缩的静态资源）以及
+    非文本类型不压缩。分块响应使用流式压缩，不缓冲整个响应体。
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept = b""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept = value
+                break
+        encoding = choose_encoding(accept.decode("latin-1"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor: Optional[_StreamCompressor] = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                lowered = {k.lower(): v for k, v in headers}
+                content_type = lowered.get(b"content-type", b"").decode("latin-1")
+                if (
+                    message["status"] < 200
+                    or message["status"] in (204, 304)
+                    or b"content-encoding" in lowered
+                    or not _is_compressible(content_type)
+                ):
+                    passthrough = True
+                    await send(message)
+                    return
+                _add_vary(headers)
+                start_message = {**message, "headers": headers}
+                return
+
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            headers = start_message["headers"] if start_message else None
+
+            if compressor is None and start_message is not None:
+                if not more_body:
+                    # 完整响应：不足阈值原样返回，否则一次性压缩
+                    if len(body) >= self.minimum_size:
+                        body = compress(body, encoding)
+                        _set_header(headers, b"content-encoding", encoding.encode())
+                        _weaken_etag(headers)
+                    _set_header(headers, b"content-length", str(len(body)).encode())
+                    await send(start_message)
+                    start_message = None
+                    await send({**message, "body": body})
+                    return
+                compressor = _StreamCompressor(encoding)
+                headers[:] = [(k, v) for k, v in headers if k.lower() != b"content-length"]
+                _set_header(headers, b"content-encoding", encoding.encode())
+                _weaken_etag(headers)
+                await send(start_message)
+                start_message = None
+
+            data = compressor.compress(body) if body else b""
+            if not more_body:
+                data += compressor.finish()
+            await send({**message, "body": data})
+
+        await self.app(scope, receive, send_wrapper)
@@ -1,12 +1,260 @@
-from sqlalchemy import Column, DateTime, Integer, String, create_engine
-from sqlalchemy.orm import declarative_base, sessionmaker
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+import weakref
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Union
 
-from utils.config import SQLALCHEMY_DATABASE_URL
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Integer,
+    LargeBinary,
+    String,
+    Table,
+    Text,
+    create_engine,
+    event,
+    func,
+    insert,
+    inspect,
+    select,
+    text,
+    update,
+)
+from sqlalchemy.engine import URL, Connection, Engine, make_url
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from sqlalchemy.orm import Session, declarative_base, sessionmaker
+from sqlalchemy.pool import NullPool, QueuePool
+
+from utils.cache import DATA_VERSION
+from utils.config import DB_POOL_CONFIG, SQLALCHEMY_DATABASE_URL, SQLITE_CONFIG
+from utils.events import COMPLAINT_FEED, FEED_WATCHER
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+BUSY_TIMEOUT_MS = int(
+    os.getenv("SQLITE_BUSY_TIMEOUT_MS", SQLITE_CONFIG["busy_timeout_ms"])
+)
+MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", SQLITE_CONFIG["mmap_size"]))
+CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", SQLITE_CONFIG["cache_size_kb"]))
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
+SNAPSHOT_REFRESH = REGISTRY.histogram(
+    "db_snapshot_refresh_seconds", "分析快照刷新耗时", ("outcome",)
 )
+
+
+def configure_sqlite_connection(conn, read_only: bool = False):
+    """设置 SQLite 连接参数
+
+    写连接启用 WAL 日志模式，读事务不再阻塞写入，写入也不阻塞读取；
+    只读连接开启 query_only，并使用内存映射和更大的页缓存加速扫描。
+    所有连接遇到锁时等待 busy_timeout，而不是立即报 database is locked。
+    """
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        if read_only:
+            cursor.execute("PRAGMA query_only = ON")
+            cursor.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+            cursor.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+        else:
+            cursor.execute("PRAGMA journal_mode = WAL")
+            cursor.execute("PRAGMA synchronous = NORMAL")
+    finally:
+        cursor.close()
+
+
+def _listen_sqlite_connect(target: Engine, read_only: bool):
+    if target.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(target, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        configure_sqlite_connection(dbapi_connection, read_only=read_only)
+
+
+def _sqlite_file(target: Engine) -> Optional[str]:
+    """文件型 SQLite 数据库的路径，内存数据库或其它数据库返回 None"""
+    if target.dialect.name != "sqlite":
+        return None
+    database = target.url.database
+    if not database or database == ":memory:" or database.startswith("file::memory:"):
+        return None
+    return database
+
+
+def _pool_option(name: str, cast):
+    return cast(os.getenv(f"DB_{name.upper()}", DB_POOL_CONFIG[name]))
+
+
+STREAM_BATCH_SIZE = _pool_option("stream_batch_size", int)
+
+
+def create_app_engine(url: Union[str, URL], read_only: bool = False) -> Engine:
+    """按数据库类型创建引擎
+
+    SQLite 设置 WAL 等连接参数；其它数据库（如 PostgreSQL）使用调优的 QueuePool，
+    只读引擎在 PostgreSQL 上把会话默认事务设为只读。
+    """
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite":
+        target = create_engine(url, connect_args={"check_same_thread": False})
+        _listen_sqlite_connect(target, read_only=read_only)
+        return target
+
+    connect_args = {}
+    if read_only and url.get_backend_name() == "postgresql":
+        connect_args["options"] = "-c default_transaction_read_only=on"
+    return create_engine(
+        url,
+        poolclass=QueuePool,
+        pool_size=_pool_option("pool_size", int),
+        max_overflow=_pool_option("max_overflow", int),
+        pool_timeout=_pool_option("pool_timeout", float),
+        pool_recycle=_pool_option("pool_recycle", int),
+        pool_pre_ping=True,
+        connect_args=connect_args,
+    )
+
+
+def _read_engine_enabled() -> bool:
+    value = os.getenv("SQLITE_READ_ENGINE")
+    if value is None:
+        return bool(SQLITE_CONFIG["read_engine"])
+    return value.lower() in ("1", "true", "yes", "on")
+
+
+def create_read_engine(writer: Engine) -> Engine:
+    """为 GET 接口创建只读连接池
+
+    设置 READ_DATABASE_URL 时连接只读副本；SQLite 文件数据库使用同一文件的只读连接；
+    内存数据库、其它数据库未配置副本或关闭时直接复用写连接池。
+    """
+    replica_url = os.getenv("READ_DATABASE_URL")
+    if replica_url:
+        return create_app_engine(replica_url, read_only=True)
+    if not _read_engine_enabled() or _sqlite_file(writer) is None:
+        return writer
+    return create_app_engine(writer.url, read_only=True)
+
+
+class SnapshotRefresher:
+    """使用 SQLite 在线备份 API 定期复制数据库，供重型分析查询读取
+
+    备份写入临时文件后原子替换快照文件；快照引擎不保留连接池，
+    每个会话都打开最新的快照。分析查询只读取快照，完全不占用主库。
+    """
+
+    def __init__(self, source_path: str, snapshot_path: str, interval: float):
+        self.source_path = source_path
+        self.snapshot_path = snapshot_path
+        self.interval = interval
+        self.generation = 0
+        self.engine = create_engine(
+            f"sqlite:///{snapshot_path}",
+            connect_args={"check_same_thread": False},
+            poolclass=NullPool,
+        )
+        _listen_sqlite_connect(self.engine, read_only=True)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def refresh(self):
+        started = time.perf_counter()
+        tmp_path = f"{self.snapshot_path}.tmp"
+        outcome = "error"
+        try:
+            source = sqlite3.connect(self.source_path)
+            target = sqlite3.connect(tmp_path)
+            try:
+                configure_sqlite_connection(source, read_only=True)
+                # 一次性复制：在 WAL 模式下相当于一个读事务，不阻塞写入
+                source.backup(target)
+                # 快照不需要 WAL，避免替换文件后残留的 -wal/-shm 与新文件混用
+                target.execute("PRAGMA journal_mode = DELETE")
+            finally:
+                target.close()
+                source.close()
+            os.replace(tmp_path, self.snapshot_path)
+            self.generation += 1
+            outcome = "ok"
+        finally:
+            SNAPSHOT_REFRESH.observe(time.perf_counter() - started, outcome=outcome)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh()
+            except (sqlite3.Error, OSError) as e:
+                logger.warning("刷新分析快照失败: %s", e)
+
+    def start(self):
+        """同步生成首个快照后在后台线程定期刷新"""
+        if self._thread is not None:
+            return
+        self.refresh()
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="db-snapshot", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    @property
+    def version(self) -> str:
+        """快照文件的修改时间，多进程部署时只有一个进程刷新快照，其它进程据此感知变化"""
+        try:
+            return str(os.stat(self.snapshot_path).st_mtime_ns)
+        except OSError:
+            return str(self.generation)
+
+
+def create_snapshot(writer: Engine) -> Optional[SnapshotRefresher]:
+    snapshot_path = os.getenv("DB_SNAPSHOT_PATH", SQLITE_CONFIG["snapshot_path"] or "")
+    source_path = _sqlite_file(writer)
+    if not snapshot_path or source_path is None:
+        return None
+    interval = float(
+        os.getenv("DB_SNAPSHOT_INTERVAL", SQLITE_CONFIG["snapshot_interval"])
+    )
+    return SnapshotRefresher(source_path, snapshot_path, interval)
+
+
+engine = create_app_engine(SQLALCHEMY_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# GET 接口使用的只读连接池
+read_engine = create_read_engine(engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+# 统计等重型分析查询使用的快照（配置 DB_SNAPSHOT_PATH 后启用），未启用时使用只读连接池
+snapshot = create_snapshot(engine)
+AnalyticsSessionLocal = sessionmaker(
+    autocommit=False,
+    autoflush=False,
+    bind=snapshot.engine if snapshot else read_engine,
+)
+
+
+def _dispose_pools_after_fork():
+    """gunicorn preload 模式下主进程已建立的连接不能在子进程中复用，fork 后丢弃连接池"""
+    for target in {engine, read_engine}:
+        target.dispose(close=False)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_dispose_pools_after_fork)
+
 Base = declarative_base()
 
 
@@ -16,8 +264,393 @@ class Complaint(Base):
     __tablename__ = "complaints"
 
     id = Column(Integer, primary_key=True, index=True)
-    complaint_time = Column(DateTime)
+    complaint_time = Column(DateTime, server_default=func.current_timestamp())
     content = Column(String)
-    user_id = Column(String)
+    user_id = Column(String, server_default="anonymous")
     complaint_category = Column(String)
     reply = Column(String)
+
+
+class Incident(Base):
+    """热点事件：内容相近的一组投诉，由 services/incidents.py 增量聚类并定期写入"""
+
+    __tablename__ = "incidents"
+
+    id = Column(String(32), primary_key=True)
+    signature = Column(LargeBinary, nullable=False)  # 首条投诉的 MinHash 签名
+    sample = Column(String, nullable=False)  # 首条投诉内容
+    category = Column(String)
+    size = Column(Integer, nullable=False)
+    first_seen = Column(DateTime, nullable=False)
+    last_seen = Column(DateTime, nullable=False, index=True)
+    hourly = Column(Text)  # 窗口内每小时投诉数，JSON {小时序号: 条数}
+
+
+# 数据版本号，只有 id=1 一行
+data_version_table = Table(
+    "data_version",
+    Base.metadata,
+    Column("id", Integer, primary_key=True),
+    Column("version", Integer, nullable=False),
+    Column("epoch", String(16), nullable=False),
+)
+
+
+class DatabaseVersion:
+    """保存在数据库中的数据版本号，每个数据库一份，通过 data_version 获取
+
+    服务工作进程、导入、爬虫、归档和模拟数据命令行写入同一数据库后都递增其中的同一行，
+    读接口的 ETag、响应缓存键和内存热数据的补齐因此能看到其它进程的写入。
+    版本行在首次使用时创建，epoch 随之随机生成，数据库重建后旧 ETag 不会误匹配。
+    写入提交后才递增版本，读到旧版本号的请求最多缓存到比版本号更新的数据，不会缓存旧数据。
+    """
+
+    def __init__(self, target: Engine):
+        self.engine = target
+        self._epoch: Optional[str] = None
+        self._lock = threading.Lock()
+
+    @property
+    def epoch(self) -> str:
+        if self._epoch is None:
+            self._ensure()
+        return self._epoch
+
+    def _ensure(self):
+        with self._lock:
+            if self._epoch is not None:
+                return
+            try:
+                data_version_table.create(self.engine, checkfirst=True)
+            except DBAPIError:  # 其它进程同时建表
+                pass
+            row = self._read_row()
+            if row is None:
+                try:
+                    with self.engine.begin() as conn:
+                        conn.execute(
+                            insert(data_version_table).values(
+                                id=1, version=0, epoch=secrets.token_hex(4)
+                            )
+                        )
+                except IntegrityError:  # 其它进程已插入
+                    pass
+                row = self._read_row()
+            self._epoch = row.epoch
+
+    def _read_row(self):
+        with self.engine.connect() as conn:
+            return conn.execute(
+                select(data_version_table.c.version, data_version_table.c.epoch).where(
+                    data_version_table.c.id == 1
+                )
+            ).first()
+
+    def get(self) -> int:
+        if self._epoch is None:
+            self._ensure()
+        row = self._read_row()
+        if row is None:  # 表已重建，版本行随之重新生成
+            self._epoch = None
+            self._ensure()
+            row = self._read_row()
+        return row.version
+
+    def _increment(self) -> Optional[int]:
+        with self.engine.begin() as conn:
+            return conn.execute(
+                update(data_version_table)
+                .where(data_version_table.c.id == 1)
+                .values(version=data_version_table.c.version + 1)
+                .returning(data_version_table.c.version)
+            ).scalar_one_or_none()
+
+    def bump(self) -> Optional[int]:
+        """递增版本号；写入已提交，递增失败只记录错误，不影响调用方"""
+        try:
+            if self._epoch is None:
+                self._ensure()
+            version = self._increment()
+            if version is None:  # 表已重建
+                self._epoch = None
+                self._ensure()
+                version = self._increment()
+            return version
+        except DBAPIError:
+            logger.exception("递增数据版本失败，读接口缓存可能暂时返回旧数据")
+            return None
+
+
+_versions: "weakref.WeakKeyDictionary[Engine, DatabaseVersion]" = weakref.WeakKeyDictionary()
+_versions_lock = threading.Lock()
+
+
+def data_version(target: Union[Engine, Connection]) -> DatabaseVersion:
+    """target 所在数据库的数据版本号，同一引擎共用一个实例
+
+    写入递增所写数据库的版本；读接口通过 utils.cache.DATA_VERSION 读取服务数据库的版本，
+    测试等使用其它数据库时可改为挂载该数据库的版本。
+    """
+    target = target.engine
+    with _versions_lock:
+        version = _versions.get(target)
+        if version is None:
+            version = _versions[target] = DatabaseVersion(target)
+        return version
+
+
+DATA_VERSION.attach(data_version(engine))
+
+
+def _bump_version(target: Union[Engine, Connection]):
+    """递增 target 的数据版本；服务读取的版本由本进程递增时登记，实时推送不会再当作其它进程的写入"""
+    version = data_version(target)
+    value = version.bump()
+    if version is DATA_VERSION.store:
+        FEED_WATCHER.local(value)
+
+
+# 批量写入的列顺序
+INSERT_COLUMNS = ("complaint_time", "content", "user_id", "complaint_category", "reply")
+
+
+def init_schema(target: Engine):
+    """创建表结构；PostgreSQL 上额外创建 pg_trgm 扩展和投诉内容的 GIN 三元组索引
+
+    三元组索引让 LIKE '%关键词%' 搜索走索引。没有创建扩展的权限时记录警告，
+    搜索退化为顺序扫描，不影响其它功能。
+    """
+    Base.metadata.create_all(bind=target)
+    if target.dialect.name != "postgresql":
+        return
+    try:
+        with target.begin() as conn:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            conn.execute(
+                text(
+                    "CREATE INDEX IF NOT EXISTS ix_complaints_content_trgm "
+                    "ON complaints USING gin (content gin_trgm_ops)"
+                )
+            )
+    except DBAPIError as e:
+        logger.warning("创建 pg_trgm 索引失败，内容搜索将不使用索引: %s", e)
+
+
+def _insert_sql(dialect, table: str, columns: Sequence[str]) -> str:
+    paramstyle = dialect.paramstyle
+    if paramstyle == "qmark":
+        marks = ", ".join("?" * len(columns))
+    elif paramstyle in ("format", "pyformat"):
+        marks = ", ".join(["%s"] * len(columns))
+    elif paramstyle == "numeric":
+        marks = ", ".join(f":{i + 1}" for i in range(len(columns)))
+    else:
+        raise ValueError(f"不支持的参数风格: {paramstyle}")
+    return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({marks})"
+
+
+def _copy_value(value) -> str:
+    """COPY 文本格式的字段编码：NULL 写作 \\N，转义反斜杠和分隔符"""
+    if value is None:
+        return "\\N"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def _copy_rows(conn: Connection, table: str, columns: Sequence[str], rows):
+    cursor = conn.connection.driver_connection.cursor()
+    sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN"
+    try:
+        if hasattr(cursor, "copy"):  # psycopg 3
+            with cursor.copy(sql) as copy:
+                for row in rows:
+                    copy.write_row(row)
+        else:  # psycopg2
+            import io
+
+            buffer = io.StringIO()
+            buffer.writelines(
+                "\t".join(_copy_value(v) for v in row) + "\n" for row in rows
+            )
+            buffer.seek(0)
+            cursor.copy_expert(sql, buffer)
+    finally:
+        cursor.close()
+
+
+def bulk_write(
+    conn: Connection,
+    rows: Sequence[Sequence[Any]],
+    columns: Sequence[str] = INSERT_COLUMNS,
+    table: str = "complaints",
+):
+    """在当前事务中批量写入行元组
+
+    PostgreSQL（psycopg/psycopg2）使用 COPY FROM STDIN，其它数据库使用 executemany。
+    """
+    if conn.dialect.name == "postgresql" and conn.dialect.driver in (
+        "psycopg",
+        "psycopg2",
+    ):
+        _copy_rows(conn, table, columns, rows)
+    else:
+        conn.exec_driver_sql(_insert_sql(conn.dialect, table, columns), list(rows))
+
+
+def stream_rows(conn: Connection, statement, batch_size: int = STREAM_BATCH_SIZE) -> Iterator:
+    """分批读取大结果集，PostgreSQL 上使用服务端游标，不把整个结果集载入客户端内存"""
+    result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(
+        statement
+    )
+    yield from result
+
+
+# 投诉写入的观察者（如内存热数据），写入提交后在写入线程中调用
+_write_observers: List[Callable[[Optional[Dict[str, Any]]], None]] = []
+
+
+def add_write_observer(observer: Callable[[Optional[Dict[str, Any]]], None]):
+    """登记投诉写入的观察者
+
+    ORM 会话提交时传入增量 {"inserted": [...], "updated": [...], "deleted": [id, ...]}，
+    只有新增的外部写入传入 inserted、updated、deleted 均为空的增量（新增由读取方按 id 补齐），
+    无法得知具体行的写入（语句级更新、删除等）传入 None。
+    """
+    _write_observers.append(observer)
+
+
+def _notify_written(changes: Optional[Dict[str, Any]]):
+    for observer in _write_observers:
+        try:
+            observer(changes)
+        except Exception:  # 观察者出错不影响已提交的写入
+            logger.exception("投诉写入观察者 %r 处理失败", observer)
+
+
+def notify_external_write(
+    reason: str = "write", inserts_only: bool = False, target: Optional[Engine] = None
+):
+    """绕过 ORM 会话的写入（Core 批量写入等）提交后调用，使缓存失效并通知客户端刷新
+
+    inserts_only 表示本次只有新增，观察者不必全量重新加载。
+    target 为写入的数据库，默认为服务数据库；写入其它数据库（独立的
+    SQLite 文件、命令行 --db-url 等）时只递增该库的数据版本，不推送也不通知本进程的观察者。
+    """
+    target = target or engine
+    _bump_version(target)
+    if target is not engine:
+        return
+    COMPLAINT_FEED.publish("reset", {"reason": reason})
+    _notify_written({"inserted": [], "updated": [], "deleted": []} if inserts_only else None)
+
+
+FEED_COLUMNS = ("id", "complaint_time", "content", "user_id", "complaint_category", "reply")
+
+
+class _FeedChanges:
+    """一个事务内的投诉变更，提交后作为一条增量事件推送"""
+
+    def __init__(self):
+        self.inserted: Dict[int, Dict[str, Any]] = {}
+        self.updated: Dict[int, Dict[str, Any]] = {}
+        self.deleted: Dict[int, str] = {}
+        self.counts: Counter = Counter()
+
+    def to_event(self) -> Dict[str, Any]:
+        return {
+            "inserted": list(self.inserted.values()),
+            "updated": list(self.updated.values()),
+            "deleted": list(self.deleted),
+            "counts": {k: v for k, v in self.counts.items() if v},
+        }
+
+
+def _feed_changes(session) -> _FeedChanges:
+    return session.info.setdefault("feed_changes", _FeedChanges())
+
+
+def _record(complaint: "Complaint") -> Dict[str, Any]:
+    return {name: getattr(complaint, name) for name in FEED_COLUMNS}
+
+
+def record_changes(session, inserted: Iterable[Dict[str, Any]]):
+    """登记语句级批量插入的行，使其提交后也以增量事件推送，而不是要求客户端全量刷新"""
+    changes = _feed_changes(session)
+    for row in inserted:
+        changes.inserted[row["id"]] = {name: row.get(name) for name in FEED_COLUMNS}
+        changes.counts[row["complaint_category"]] += 1
+    session.info.pop("statement_writes", None)
+
+
+@event.listens_for(Session, "after_flush")
+def _mark_flush_writes(session, flush_context):
+    session.info["has_writes"] = True
+    changes = None
+    for obj in session.new:
+        if isinstance(obj, Complaint):
+            changes = changes or _feed_changes(session)
+            changes.inserted[obj.id] = _record(obj)
+            changes.counts[obj.complaint_category] += 1
+    for obj in session.dirty:
+        if isinstance(obj, Complaint) and session.is_modified(obj):
+            changes = changes or _feed_changes(session)
+            history = inspect(obj).attrs.complaint_category.history
+            if history.has_changes():
+                for old in history.deleted:
+                    changes.counts[old] -= 1
+                changes.counts[obj.complaint_category] += 1
+            if obj.id in changes.inserted:
+                changes.inserted[obj.id] = _record(obj)
+            else:
+                changes.updated[obj.id] = _record(obj)
+    for obj in session.deleted:
+        if isinstance(obj, Complaint):
+            changes = changes or _feed_changes(session)
+            changes.inserted.pop(obj.id, None)
+            changes.updated.pop(obj.id, None)
+            changes.deleted[obj.id] = obj.complaint_category
+            changes.counts[obj.complaint_category] -= 1
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_statement_writes(orm_execute_state):
+    if (
+        orm_execute_state.is_insert
+        or orm_execute_state.is_update
+        or orm_execute_state.is_delete
+    ):
+        orm_execute_state.session.info["has_writes"] = True
+        orm_execute_state.session.info["statement_writes"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_data_version(session):
+    """会话提交了写操作后递增数据版本，使读接口的缓存和 ETag 失效，并推送变更
+
+    语句级写入无法得知具体行，未通过 record_changes 登记时推送 reset 事件。
+    """
+    changes = session.info.pop("feed_changes", None)
+    statement_writes = session.info.pop("statement_writes", False)
+    if session.info.pop("has_writes", False):
+        _bump_version(session.get_bind())
+        event = None if changes is None else changes.to_event()
+        if statement_writes:
+            COMPLAINT_FEED.publish("reset", {"reason": "write"})
+        elif event is not None:
+            COMPLAINT_FEED.publish("delta", event)
+        if statement_writes:
+            _notify_written(None)
+        elif event is not None:
+            _notify_written(event)
+
+
+@event.listens_for(Session, "after_rollback")
+def _clear_write_flag(session):
+    session.info.pop("has_writes", None)
+    session.info.pop("feed_changes", None)
+    session.info.pop("statement_writes", None)
@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import AsyncIterator, Awaitable, Callable, Optional, Set
+
+from utils.cache import DATA_VERSION
+from utils.metrics import REGISTRY
+from utils.serialization import dumps
+
+# 每个订阅者最多积压的事件数，超过后丢弃积压并通知客户端全量刷新
+FEED_QUEUE_SIZE = int(os.getenv("FEED_QUEUE_SIZE", "1000"))
+# 没有事件时发送心跳的间隔（秒），防止代理断开空闲连接
+FEED_HEARTBEAT = float(os.getenv("FEED_HEARTBEAT", "15"))
+# 检查其它进程写入的间隔（秒），有订阅者时按数据版本判断
+FEED_POLL_INTERVAL = float(os.getenv("FEED_POLL_INTERVAL", "2"))
+# 一次检查中数据版本跳变超过该值时不再逐个比对，直接视为其它进程写入
+FEED_POLL_MAX_GAP = 10_000
+
+logger = logging.getLogger(__name__)
+
+FEED_SUBSCRIBERS = REGISTRY.gauge(
+    "feed_subscribers", "实时推送的在线订阅者数", ("feed",)
+)
+FEED_EVENTS = REGISTRY.counter(
+    "feed_events_published_total", "发布的实时推送事件数", ("feed", "event")
+)
+FEED_OVERFLOWS = REGISTRY.counter(
+    "feed_subscriber_overflows_total", "订阅者积压溢出后被要求全量刷新的次数", ("feed",)
+)
+
+HEARTBEAT_MESSAGE = b": ping\n\n"
+
+
+def format_sse(event: str, data) -> bytes:
+    """编码为一条 Server-Sent Events 消息"""
+    return b"event: " + event.encode() + b"\ndata: " + dumps(data) + b"\n\n"
+
+
+class Subscriber:
+    """一个事件流连接，持有所在事件循环和有界队列"""
+
+    def __init__(self, broker: "EventBroker", maxsize: int):
+        self.broker = broker
+        self.loop = asyncio.get_running_loop()
+        self.queue: "asyncio.Queue[bytes]" = asyncio.Queue(maxsize)
+
+    def offer(self, message: bytes):
+        """在事件循环线程中调用；队列满时清空积压，只保留一条 reset 事件"""
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(format_sse("reset", {"reason": "overflow"}))
+            FEED_OVERFLOWS.inc(feed=self.broker.name)
+
+
+class EventBroker:
+    """进程内的发布订阅，写路径发布，事件流连接订阅
+
+    发布方可以在任意线程调用 publish，消息只序列化一次，
+    再通过 call_soon_threadsafe 投递到各订阅者所在的事件循环。
+    """
+
+    def __init__(self, name: str, queue_size: int = FEED_QUEUE_SIZE):
+        self.name = name
+        self.queue_size = queue_size
+        self._subscribers: Set[Subscriber] = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self) -> Subscriber:
+        subscriber = Subscriber(self, self.queue_size)
+        with self._lock:
+            self._subscribers.add(subscriber)
+            FEED_SUBSCRIBERS.set(len(self._subscribers), feed=self.name)
+        return subscriber
+
+    @property
+    def subscribed(self) -> bool:
+        return bool(self._subscribers)
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+            FEED_SUBSCRIBERS.set(len(self._subscribers), feed=self.name)
+
+    def publish(self, event: str, data):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        FEED_EVENTS.inc(feed=self.name, event=event)
+        if not subscribers:
+            return
+        message = format_sse(event, data)
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.offer, message)
+            except RuntimeError:  # 事件循环已关闭
+                self.unsubscribe(subscriber)
+
+
+async def sse_stream(
+    broker: EventBroker,
+    is_disconnected: Optional[Callable[[], Awaitable[bool]]] = None,
+    heartbeat: float = FEED_HEARTBEAT,
+) -> AsyncIterator[bytes]:
+    """订阅并持续输出事件，空闲时发送心跳，连接断开后退订"""
+    subscriber = broker.subscribe()
+    try:
+        yield b"retry: 3000\n\n"
+        while True:
+            try:
+                message = await asyncio.wait_for(subscriber.queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                if is_disconnected is not None and await is_disconnected():
+                    break
+                message = HEARTBEAT_MESSAGE
+            yield message
+    finally:
+        broker.unsubscribe(subscriber)
+
+
+class VersionWatcher:
+    """按数据版本发现其它进程（工作进程、命令行）的写入，向本进程的订阅者推送 reset
+
+    本进程的写入递增版本后通过 local 登记，并已推送增量；检查时出现未登记的版本，
+    且到下一次检查仍未登记（避免与本进程正在发布的写入竞争），才视为其它进程的写入。
+    没有订阅者时不读取数据版本。
+    """
+
+    def __init__(self, broker: EventBroker, version=DATA_VERSION, interval: float = FEED_POLL_INTERVAL):
+        self.broker = broker
+        self.version = version
+        self.interval = interval
+        self._last: Optional[int] = None
+        self._local: Set[int] = set()
+        self._pending: Set[int] = set()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def local(self, version: Optional[int]):
+        """登记本进程写入后的版本号"""
+        if version is None:
+            return
+        with self._lock:
+            self._local.add(version)
+
+    def poll(self):
+        if not self.broker.subscribed:
+            with self._lock:
+                self._last = None
+                self._local.clear()
+                self._pending.clear()
+            return
+        current = self.version.get()
+        with self._lock:
+            last, self._last = self._last, current
+            if last is None:
+                self._local = {v for v in self._local if v > current}
+                return
+            external = current < last or current - last > FEED_POLL_MAX_GAP  # 版本表重建或大量写入
+            external = external or bool(self._pending - self._local)
+            self._pending = set(range(last + 1, current + 1)) - self._local
+            self._local = {v for v in self._local if v > current}
+        if external:
+            self.broker.publish("reset", {"reason": "external"})
+
+    def start(self):
+        """在后台线程中定期检查；已在运行时直接返回"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        def run():
+            while True:
+                time.sleep(self.interval)
+                try:
+                    self.poll()
+                except Exception:
+                    logger.exception("检查其它进程的写入失败")
+
+        self._thread = threading.Thread(target=run, name="feed-watcher", daemon=True)
+        self._thread.start()
+
+
+# 投诉数据变更的实时推送
+COMPLAINT_FEED = EventBroker("complaints")
+# 服务数据库上其它进程写入的检查，由服务启动
+FEED_WATCHER = VersionWatcher(COMPLAINT_FEED)
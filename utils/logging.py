@@ -1,16 +1,179 @@
+import atexit
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional
 
+# 单个日志文件上限与保留份数
+LOG_MAX_BYTES = 20 * 1024 * 1024
+LOG_BACKUP_COUNT = 10
+# 按时间轮转的周期（秒），默认每天
+LOG_ROTATE_INTERVAL = 24 * 3600
+LOG_DIR = "logs"
 
-def configure_logging(level=logging.INFO):
-    """配置统一的日志格式和级别"""
-    log_dir = "logs"
-    os.makedirs(log_dir, exist_ok=True)
-    logging.basicConfig(
-        level=level,
-        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-        handlers=[
-            logging.StreamHandler(),
-            logging.FileHandler(os.path.join(log_dir, "app.log"), encoding="utf-8"),
-        ],
+# 按模块的 DEBUG/INFO 日志采样率（0-1），WARNING 及以上始终保留；默认不采样，
+# 日志量过大时通过 LOG_SAMPLING 环境变量为高频模块开启
+LOG_SAMPLING: Dict[str, float] = {}
+
+_lock = threading.Lock()
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[logging.Handler] = None
+
+
+def _sampling_rates() -> Dict[str, float]:
+    """读取采样率配置，LOG_SAMPLING 环境变量格式如 main=0.1,services.llm=1
+
+    格式错误或不在 0-1 之间的项忽略，不影响日志配置。
+    """
+    rates = dict(LOG_SAMPLING)
+    for item in os.getenv("LOG_SAMPLING", "").split(","):
+        name, _, rate = item.partition("=")
+        try:
+            value = float(rate)
+        except ValueError:
+            continue
+        if name.strip() and 0 <= value <= 1:
+            rates[name.strip()] = value
+    return rates
+
+
+class SizeAndTimeRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """文件超过 maxBytes 或距上次轮转超过 interval 秒时轮转"""
+
+    def __init__(self, filename, interval: float = LOG_ROTATE_INTERVAL, **kwargs):
+        super().__init__(filename, **kwargs)
+        self.interval = interval
+        self.rollover_at = time.time() + interval
+
+    def shouldRollover(self, record):
+        if time.time() >= self.rollover_at:
+            return True
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self):
+        super().doRollover()
+        self.rollover_at = time.time() + self.interval
+
+
+class JsonFormatter(logging.Formatter):
+    """将日志记录输出为单行JSON，便于检索和采集"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        for key, value in getattr(record, "fields", {}).items():
+            payload.setdefault(key, value)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """按模块对 DEBUG/INFO 日志采样，在请求线程上就丢弃，避免排队和格式化"""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(record.name)
+        return rate is None or random.random() < rate
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """入队时不做格式化，消息插值推迟到后台监听线程"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def _log_path() -> str:
+    """日志文件路径；LOG_PER_PROCESS=true（多进程部署）时每个进程写 app-<pid>.log，避免多个进程轮转同一文件"""
+    if os.getenv("LOG_PER_PROCESS", "false").lower() == "true":
+        return os.path.join(LOG_DIR, f"app-{os.getpid()}.log")
+    return os.path.join(LOG_DIR, "app.log")
+
+
+def _file_handler() -> logging.Handler:
+    os.makedirs(LOG_DIR, exist_ok=True)
+    handler = SizeAndTimeRotatingFileHandler(
+        _log_path(),
+        maxBytes=LOG_MAX_BYTES,
+        backupCount=LOG_BACKUP_COUNT,
+        encoding="utf-8",
     )
+    handler.setFormatter(JsonFormatter())
+    return handler
+
+
+def configure_logging(level=logging.INFO):
+    """配置统一的日志格式和级别
+
+    请求线程只把日志记录放入内存队列，格式化、JSON序列化和文件写入
+    都在后台 QueueListener 线程完成。重复调用不会重复添加处理器。
+    """
+    global _listener, _queue_handler
+    with _lock:
+        root = logging.getLogger()
+        root.setLevel(level)
+        if _listener is not None:
+            return
+
+        console = logging.StreamHandler()
+        console.setFormatter(
+            logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+        )
+        file_handler = _file_handler()
+
+        log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+        _queue_handler = _DeferredQueueHandler(log_queue)
+        _queue_handler.addFilter(SamplingFilter(_sampling_rates()))
+        root.addHandler(_queue_handler)
+
+        _listener = logging.handlers.QueueListener(
+            log_queue, console, file_handler, respect_handler_level=True
+        )
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """停止后台监听线程并刷新剩余日志"""
+    global _listener, _queue_handler
+    with _lock:
+        if _queue_handler is not None:
+            logging.getLogger().removeHandler(_queue_handler)
+            _queue_handler = None
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def _restart_listener_after_fork():
+    """fork 出的子进程（如 gunicorn preload 的工作进程）没有父进程的监听线程，
+    重新启动，否则日志会一直堆积在队列中；按进程写日志时改写子进程自己的文件"""
+    if _listener is not None:
+        if os.getenv("LOG_PER_PROCESS", "false").lower() == "true":
+            _listener.handlers = tuple(
+                _file_handler() if isinstance(h, SizeAndTimeRotatingFileHandler) else h
+                for h in _listener.handlers
+            )
+        _listener._thread = None
+        _listener.start()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_listener_after_fork)
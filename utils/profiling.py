@@ -0,0 +1,458 @@
+import asyncio
+import cProfile
+import glob
+import io
+import json
+import logging
+import os
+import pstats
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from urllib.parse import parse_qs
+
+from fastapi.routing import APIRoute
+
+from utils.cache import CACHE_BACKEND
+from utils.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# 持续采样的间隔（秒）、写出堆栈文件的间隔（秒）、输出目录和保留的文件数
+PROFILER_INTERVAL = float(os.getenv("PROFILER_INTERVAL", "0.02"))
+PROFILER_DUMP_INTERVAL = float(os.getenv("PROFILER_DUMP_INTERVAL", "60"))
+PROFILER_DIR = os.getenv("PROFILER_DIR", os.path.join("logs", "profiles"))
+PROFILER_KEEP = int(os.getenv("PROFILER_KEEP", "200"))
+# 各工作进程从共享缓存后端读取采样开关的间隔（秒）
+PROFILER_POLL_INTERVAL = float(os.getenv("PROFILER_POLL_INTERVAL", "5"))
+# 单次请求分析报告中 cProfile 输出的函数数
+PROFILE_TOP_N = int(os.getenv("PROFILE_TOP_N", "60"))
+
+PROFILED_REQUESTS = REGISTRY.counter(
+    "profiled_requests_total", "按需分析的请求数", ("mode",)
+)
+PROFILER_SAMPLES = REGISTRY.counter("profiler_samples_total", "持续采样分析器的采样次数")
+
+PROFILE_MODES = ("cprofile", "pyinstrument")
+
+
+def is_admin(token: Optional[str]) -> bool:
+    """校验管理令牌；未配置 ADMIN_TOKEN 时管理功能全部关闭"""
+    expected = os.getenv("ADMIN_TOKEN")
+    return bool(expected and token) and secrets.compare_digest(token, expected)
+
+
+def _pyinstrument_available() -> bool:
+    try:
+        import pyinstrument  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class RequestProfile:
+    """一次按需分析：在执行路由函数的线程中开启分析器，结束后生成报告"""
+
+    def __init__(self, mode: str, html: bool):
+        self.mode = mode
+        self.html = html
+        self.report: Optional[str] = None
+        self.media_type = "text/plain; charset=utf-8"
+
+    @contextmanager
+    def run(self, is_async: bool) -> Iterator[None]:
+        if self.mode == "pyinstrument":
+            from pyinstrument import Profiler
+
+            profiler = Profiler(async_mode="enabled" if is_async else "disabled")
+            profiler.start()
+            try:
+                yield
+            finally:
+                profiler.stop()
+                if self.html:
+                    self.report = profiler.output_html()
+                    self.media_type = "text/html; charset=utf-8"
+                else:
+                    self.report = profiler.output_text(unicode=True)
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                stream = io.StringIO()
+                stats = pstats.Stats(profiler, stream=stream)
+                stats.sort_stats("cumulative").print_stats(PROFILE_TOP_N)
+                self.report = stream.getvalue()
+
+
+_request_profile: ContextVar[Optional[RequestProfile]] = ContextVar(
+    "request_profile", default=None
+)
+# 同一时刻只分析一个请求：cProfile 在 Python 3.12+ 上是进程级的，并发分析会互相干扰
+_profile_lock = threading.Lock()
+
+
+def profiled(fn: Callable) -> Callable:
+    """包装路由函数，请求要求分析时在路由函数所在的线程中运行分析器
+
+    同步路由在线程池中执行，只有在这里开启分析器才能采集到路由本身的调用。
+    """
+    if asyncio.iscoroutinefunction(fn):
+
+        @wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            profile = _request_profile.get()
+            if profile is None:
+                return await fn(*args, **kwargs)
+            with profile.run(is_async=True):
+                return await fn(*args, **kwargs)
+
+        return async_wrapper
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        profile = _request_profile.get()
+        if profile is None:
+            return fn(*args, **kwargs)
+        with profile.run(is_async=False):
+            return fn(*args, **kwargs)
+
+    return wrapper
+
+
+class ProfiledRoute(APIRoute):
+    """所有路由函数都经过 profiled 包装，未要求分析时只多一次 ContextVar 读取"""
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any):
+        super().__init__(path, profiled(endpoint), **kwargs)
+
+
+def _requested_mode(scope: Dict[str, Any]) -> Optional[str]:
+    """从查询参数 profile 或请求头 X-Profile 读取分析方式，1/true 使用默认方式"""
+    values = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("profile")
+    value = values[-1] if values else None
+    if value is None:
+        for name, header in scope.get("headers", []):
+            if name == b"x-profile":
+                value = header.decode("latin-1")
+    if value is None:
+        return None
+    value = value.strip().lower()
+    if value in PROFILE_MODES:
+        return value
+    if value in ("1", "true", "yes"):
+        return "pyinstrument" if _pyinstrument_available() else "cprofile"
+    return None
+
+
+def _header(scope: Dict[str, Any], name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+class _StreamingResponse(Exception):
+    """被分析的路由返回了流式响应，中止响应并释放分析锁"""
+
+
+class ProfilingMiddleware:
+    """管理员请求带 ?profile=1（或 cprofile、pyinstrument）或 X-Profile 头时，返回分析报告代替原响应
+
+    须同时带 X-Admin-Token 头；原响应的状态码放在 X-Profile-Status 头中。
+    请求未进入路由函数（如参数校验失败）时返回原响应。
+    流式响应（如 /events/complaints）无法缓存到结束，直接中止并返回 400。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        mode = _requested_mode(scope)
+        if mode is None:
+            await self.app(scope, receive, send)
+            return
+        if not is_admin(_header(scope, b"x-admin-token")):
+            await self._respond(send, 403, "分析请求需要管理令牌")
+            return
+        if mode == "pyinstrument" and not _pyinstrument_available():
+            await self._respond(send, 400, "未安装 pyinstrument")
+            return
+        if not _profile_lock.acquire(blocking=False):
+            await self._respond(send, 409, "另一个请求正在分析")
+            return
+
+        profile = RequestProfile(mode, "text/html" in (_header(scope, b"accept") or ""))
+        token = _request_profile.set(profile)
+        messages: List[Dict[str, Any]] = []
+        status = 500
+
+        async def capture(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                content_type = dict(message.get("headers", [])).get(b"content-type", b"")
+                if content_type.startswith(b"text/event-stream"):
+                    raise _StreamingResponse()
+            elif message.get("more_body"):
+                raise _StreamingResponse()
+            messages.append(message)
+
+        streaming = False
+        try:
+            await self.app(scope, receive, capture)
+        except* _StreamingResponse:
+            streaming = True
+        finally:
+            _request_profile.reset(token)
+            _profile_lock.release()
+
+        if streaming:
+            await self._respond(send, 400, "流式响应不支持分析")
+            return
+
+        if profile.report is None:
+            for message in messages:
+                await send(message)
+            return
+        PROFILED_REQUESTS.inc(mode=mode)
+        await self._respond(
+            send, 200, profile.report, profile.media_type, [(b"x-profile-status", str(status).encode())]
+        )
+
+    @staticmethod
+    async def _respond(send, status: int, text: str, media_type: str = "text/plain; charset=utf-8", headers=()):
+        body = text.encode("utf-8")
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [
+                    (b"content-type", media_type.encode("latin-1")),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"cache-control", b"no-store"),
+                    *headers,
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+
+class StackSampler:
+    """持续采样分析器：定期采集所有线程的调用栈，按 folded 格式写出
+
+    每隔 dump_interval 秒把累计的 "线程;外层函数;…;内层函数 次数" 写入
+    directory/stacks-<pid>-<时间>-<序号>.folded，可直接交给 flamegraph.pl、speedscope 等工具；
+    只保留最新的 keep 个文件。采样在独立线程中读取 sys._current_frames，不修改被采样线程。
+    """
+
+    def __init__(
+        self,
+        interval: float = PROFILER_INTERVAL,
+        dump_interval: float = PROFILER_DUMP_INTERVAL,
+        directory: str = PROFILER_DIR,
+        keep: int = PROFILER_KEEP,
+    ):
+        self.interval = interval
+        self.dump_interval = dump_interval
+        self.directory = directory
+        self.keep = keep
+        self.samples = 0
+        self._dumps = 0
+        self._stacks: Counter = Counter()
+        self._labels: Dict[Any, str] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "interval": self.interval,
+            "dump_interval": self.dump_interval,
+            "directory": self.directory,
+            "samples": self.samples,
+        }
+
+    def start(self, interval: Optional[float] = None):
+        """开始采样；已在运行时只更新采样间隔"""
+        if interval is not None:
+            self.interval = interval
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+        logger.info("持续采样分析已开启，间隔 %.3f 秒", self.interval)
+
+    def stop(self):
+        """停止采样并写出尚未写出的样本"""
+        thread = self._thread
+        if thread is None:
+            return
+        self._stop.set()
+        thread.join()
+        self._thread = None
+        self.dump()
+        logger.info("持续采样分析已关闭")
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            path = code.co_filename
+            try:
+                relative = os.path.relpath(path)
+                if not relative.startswith(".."):
+                    path = relative
+            except ValueError:
+                pass
+            name = getattr(code, "co_qualname", code.co_name)
+            label = self._labels[code] = f"{name} ({path})".replace(";", ":")
+        return label
+
+    def sample(self):
+        own = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        stacks = []
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            labels = []
+            while frame is not None:
+                labels.append(self._label(frame.f_code))
+                frame = frame.f_back
+            labels.append(names.get(ident, str(ident)).replace(";", ":"))
+            stacks.append(";".join(reversed(labels)))
+        with self._lock:
+            self._stacks.update(stacks)
+            self.samples += 1
+        PROFILER_SAMPLES.inc()
+
+    def dump(self) -> Optional[str]:
+        """写出累计的样本并清空，没有样本时返回 None"""
+        with self._lock:
+            stacks, self._stacks = self._stacks, Counter()
+        if not stacks:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        # 同一秒内多次写出（如关闭时）用序号区分，避免覆盖
+        self._dumps += 1
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(
+            self.directory, f"stacks-{os.getpid()}-{stamp}-{self._dumps:04d}.folded"
+        )
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        os.replace(tmp_path, path)
+        self._prune()
+        return path
+
+    def _prune(self):
+        files = sorted(
+            glob.glob(os.path.join(self.directory, "stacks-*.folded")),
+            key=lambda path: (os.path.getmtime(path), path),
+        )
+        for path in files[: max(0, len(files) - self.keep)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _run(self):
+        last_dump = time.monotonic()
+        while not self._stop.wait(self.interval):
+            try:
+                self.sample()
+                if time.monotonic() - last_dump >= self.dump_interval:
+                    self.dump()
+                    last_dump = time.monotonic()
+            except Exception:
+                logger.exception("采样分析失败")
+
+
+class ProfilerSwitch:
+    """通过共享缓存后端在工作进程间同步持续采样开关
+
+    set 写入后端并立即作用于当前进程，其它进程每隔 poll_interval 秒读取一次；
+    后端中没有开关时保持 PROFILER_ENABLED 的启动设置。未配置共享后端（memory）时只作用于当前进程。
+    """
+
+    def __init__(
+        self,
+        sampler: StackSampler,
+        backend=None,
+        key: str = "scs:profiler",
+        poll_interval: float = PROFILER_POLL_INTERVAL,
+    ):
+        self.sampler = sampler
+        self.backend = backend
+        self.key = key
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def set(self, enabled: bool, interval: Optional[float] = None):
+        if self.backend is not None:
+            self.backend.set(self.key, json.dumps({"enabled": enabled, "interval": interval}))
+        self._apply(enabled, interval)
+
+    def _apply(self, enabled: bool, interval: Optional[float]):
+        if enabled:
+            self.sampler.start(interval)
+        else:
+            self.sampler.stop()
+
+    def sync(self):
+        """按后端中的开关开启或关闭本进程的采样"""
+        value = self.backend.get(self.key) if self.backend is not None else None
+        if value is None:
+            return
+        state = json.loads(value)
+        self._apply(bool(state["enabled"]), state.get("interval"))
+
+    def start(self):
+        """在后台线程中定期读取开关；未配置共享后端或已在运行时直接返回"""
+        if self.backend is None or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="profiler-switch", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        thread = self._thread
+        if thread is None:
+            return
+        self._stop.set()
+        thread.join()
+        self._thread = None
+
+    def _run(self):
+        while True:
+            try:
+                self.sync()
+            except Exception:
+                logger.exception("读取采样开关失败")
+            if self._stop.wait(self.poll_interval):
+                return
+
+
+SAMPLER = StackSampler()
+SWITCH = ProfilerSwitch(SAMPLER, CACHE_BACKEND)
@@ -0,0 +1,34 @@
+from typing import Any, Dict, List, Sequence
+
+import orjson
+from starlette.responses import Response
+
+
+def dumps(obj: Any) -> bytes:
+    """使用 orjson 序列化为 UTF-8 字节，原生支持 datetime 和非字符串键"""
+    return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+
+def rows_to_records(columns: Sequence[str], rows: Sequence[Sequence[Any]]) -> List[Dict]:
+    """列元组转换为按行的字典列表，与 ORM + Pydantic 的输出格式一致"""
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def rows_to_columns(
+    columns: Sequence[str], rows: Sequence[Sequence[Any]]
+) -> Dict[str, List]:
+    """列元组转置为按列的紧凑格式：{列名: [值, ...]}，省去每行重复的键名"""
+    if not rows:
+        return {name: [] for name in columns}
+    return {name: list(values) for name, values in zip(columns, zip(*rows))}
+
+
+class ORJSONBytesResponse(Response):
+    """直接使用 orjson 编码的 JSON 响应，跳过 jsonable_encoder"""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return dumps(content)
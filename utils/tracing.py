@@ -0,0 +1,345 @@
+import json
+import logging
+import os
+import queue
+import re
+import secrets
+import sys
+import threading
+import time
+from collections import Counter as TallyCounter
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from utils.metrics import (
+    REGISTRY,
+    record_timing,
+    reset_request_timing,
+    server_timing_header,
+    start_request_timing,
+)
+
+logger = logging.getLogger(__name__)
+
+# 慢查询阈值（毫秒）与 N+1 判定阈值（同一语句在单个请求中执行的次数）
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "10"))
+
+REQUEST_LATENCY = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP请求耗时", ("method", "route", "status")
+)
+DB_QUERY_LATENCY = REGISTRY.histogram(
+    "db_query_duration_seconds", "SQL语句执行耗时", ("route",)
+)
+DB_QUERIES_PER_REQUEST = REGISTRY.histogram(
+    "db_queries_per_request",
+    "单个请求执行的SQL语句数",
+    ("route",),
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 500),
+)
+SLOW_QUERIES = REGISTRY.counter("db_slow_queries_total", "慢查询次数", ("route",))
+N_PLUS_ONE = REGISTRY.counter(
+    "db_n_plus_one_total", "检测到疑似 N+1 查询模式的请求数", ("route",)
+)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _new_id(nbytes: int) -> str:
+    return secrets.token_hex(nbytes)
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Span:
+    """最小化的追踪片段，导出格式与 OTLP/JSON 兼容"""
+
+    def __init__(
+        self,
+        name: str,
+        trace_id: Optional[str] = None,
+        parent_id: Optional[str] = None,
+        kind: int = 1,
+    ):
+        self.name = name
+        self.trace_id = trace_id or _new_id(16)
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict[str, Any] = {}
+        self.error = False
+
+    def end(self, end_ns: Optional[int] = None):
+        self.end_ns = end_ns or time.time_ns()
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or time.time_ns()),
+            "attributes": [
+                {"key": key, "value": _otlp_value(value)}
+                for key, value in self.attributes.items()
+            ],
+            "status": {"code": 2 if self.error else 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class SpanExporter:
+    """后台线程批量写出 span，避免在请求线程上做 I/O"""
+
+    def __init__(self, stream_factory):
+        self._stream_factory = stream_factory
+        self._queue: "queue.Queue[Optional[List[Span]]]" = queue.Queue(maxsize=10000)
+        self._thread = threading.Thread(
+            target=self._run, name="span-exporter", daemon=True
+        )
+        self._thread.start()
+
+    def export(self, spans: List[Span]):
+        try:
+            self._queue.put_nowait(spans)
+        except queue.Full:
+            logger.debug("span 队列已满，丢弃本次追踪")
+
+    def _run(self):
+        stream = self._stream_factory()
+        while True:
+            spans = self._queue.get()
+            if spans is None:
+                break
+            batch = [spans]
+            while not self._queue.empty() and len(batch) < 100:
+                item = self._queue.get_nowait()
+                if item is None:
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+            for item in batch:
+                record = {
+                    "resourceSpans": [
+                        {
+                            "resource": {
+                                "attributes": [
+                                    {
+                                        "key": "service.name",
+                                        "value": {"stringValue": "scs"},
+                                    }
+                                ]
+                            },
+                            "scopeSpans": [
+                                {
+                                    "scope": {"name": "scs.tracing"},
+                                    "spans": [span.to_otlp() for span in item],
+                                }
+                            ],
+                        }
+                    ]
+                }
+                stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+            stream.flush()
+
+    def shutdown(self):
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+
+def _create_exporter() -> Optional[SpanExporter]:
+    """根据 TRACE_EXPORTER 环境变量创建导出器：file（默认写 logs/traces.jsonl）、stdout 或 none"""
+    kind = os.getenv("TRACE_EXPORTER", "none").lower()
+    if kind == "stdout":
+        return SpanExporter(lambda: sys.stdout)
+    if kind == "file":
+        path = os.getenv("TRACE_FILE", os.path.join("logs", "traces.jsonl"))
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        return SpanExporter(lambda: open(path, "a", encoding="utf-8"))
+    return None
+
+
+_exporter: Optional[SpanExporter] = None
+_exporter_lock = threading.Lock()
+_exporter_ready = False
+
+
+def get_exporter() -> Optional[SpanExporter]:
+    global _exporter, _exporter_ready
+    if not _exporter_ready:
+        with _exporter_lock:
+            if not _exporter_ready:
+                _exporter = _create_exporter()
+                _exporter_ready = True
+    return _exporter
+
+
+class RequestTrace:
+    """单个请求的追踪状态：根 span、子 span 和SQL统计"""
+
+    def __init__(self, scope: Dict[str, Any]):
+        self.scope = scope
+        method, path = scope["method"], scope["path"]
+        self.root = Span(f"{method} {path}", kind=2)
+        self.root.attributes.update({"http.method": method, "http.target": path})
+        self.spans: List[Span] = []
+        self.query_count = 0
+        self.query_seconds = 0.0
+        self.statements: TallyCounter = TallyCounter()
+
+    @property
+    def route(self) -> str:
+        """路由模板（如 /complaints/{complaint_id}），未匹配路由时归为一类，避免标签基数爆炸"""
+        route = self.scope.get("route")
+        return getattr(route, "path", None) or "<unmatched>"
+
+    def child(self, name: str) -> Span:
+        span = Span(name, trace_id=self.root.trace_id, parent_id=self.root.span_id)
+        self.spans.append(span)
+        return span
+
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar(
+    "current_trace", default=None
+)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("query_start")
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    trace = _current_trace.get()
+    if trace is None:
+        return
+
+    normalized = _WHITESPACE.sub(" ", statement).strip()
+    trace.query_count += 1
+    trace.query_seconds += elapsed
+    trace.statements[normalized] += 1
+    record_timing("db", elapsed)
+    DB_QUERY_LATENCY.observe(elapsed, route=trace.route)
+
+    span = trace.child("db.query")
+    span.start_ns = time.time_ns() - int(elapsed * 1e9)
+    span.end()
+    span.attributes.update({"db.system": conn.dialect.name, "db.statement": normalized})
+
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        SLOW_QUERIES.inc(route=trace.route)
+        logger.warning(
+            "慢查询 %.1fms [%s]: %s", elapsed * 1000, trace.route, normalized[:500]
+        )
+
+
+_instrumented = False
+
+
+def instrument_sqlalchemy():
+    """为所有 SQLAlchemy 引擎注册语句计时事件（幂等）"""
+    global _instrumented
+    if _instrumented:
+        return
+    event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+    _instrumented = True
+
+
+def _finish(trace: RequestTrace, status: int, elapsed: float):
+    route = trace.route
+    REQUEST_LATENCY.observe(
+        elapsed, method=trace.root.attributes["http.method"], route=route, status=str(status)
+    )
+    DB_QUERIES_PER_REQUEST.observe(trace.query_count, route=route)
+
+    repeated = [
+        (statement, count)
+        for statement, count in trace.statements.items()
+        if count >= N_PLUS_ONE_THRESHOLD
+    ]
+    if repeated:
+        N_PLUS_ONE.inc(route=route)
+        for statement, count in repeated:
+            logger.warning(
+                "疑似 N+1 查询 [%s]: 同一语句执行 %d 次: %s",
+                route,
+                count,
+                statement[:200],
+            )
+
+    trace.root.name = f"{trace.root.attributes['http.method']} {route}"
+    trace.root.attributes.update(
+        {
+            "http.route": route,
+            "http.status_code": status,
+            "db.query_count": trace.query_count,
+            "db.query_time_ms": round(trace.query_seconds * 1000, 3),
+        }
+    )
+    trace.root.error = status >= 500
+    trace.root.end()
+    exporter = get_exporter()
+    if exporter is not None:
+        exporter.export([trace.root, *trace.spans])
+
+
+class RequestTracingMiddleware:
+    """记录每个请求的路由耗时、SQL语句数与耗时，导出追踪并写入 Server-Timing 头"""
+
+    def __init__(self, app):
+        self.app = app
+        instrument_sqlalchemy()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace(scope)
+        trace_token = _current_trace.set(trace)
+        timing_token = start_request_timing()
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                record_timing("total", time.perf_counter() - start)
+                headers = list(message.get("headers", []))
+                headers.append(
+                    (b"server-timing", server_timing_header().encode("latin-1"))
+                )
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _finish(trace, status, time.perf_counter() - start)
+            reset_request_timing(timing_token)
+            _current_trace.reset(trace_token)
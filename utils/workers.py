@@ -0,0 +1,97 @@
+import logging
+import os
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Set
+
+try:
+    import fcntl
+except ImportError:  # Windows 没有 fcntl，只支持单进程或启动器派生的工作进程
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# 启动器在派生工作进程前完成的启动任务，通过环境变量传给子进程
+STARTUP_ENV = "SCS_STARTUP_DONE"
+LOCK_DIR = os.getenv("WORKER_LOCK_DIR", "./data")
+
+_completed: Set[str] = set()
+_leader_locks: Dict[str, int] = {}
+
+
+def _lock_path(name: str) -> str:
+    os.makedirs(LOCK_DIR, exist_ok=True)
+    return os.path.join(LOCK_DIR, f".{name}.lock")
+
+
+@contextmanager
+def file_lock(name: str) -> Iterator[None]:
+    """跨进程互斥锁，同一台机器上的工作进程依次进入"""
+    if fcntl is None:
+        yield
+        return
+    fd = os.open(_lock_path(name), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+def run_once(name: str, task: Callable[[], None]) -> bool:
+    """执行一次启动任务（如建表），返回本进程是否执行了任务
+
+    - 单进程、gunicorn preload：在主进程执行一次，fork 出的工作进程继承完成状态
+    - main.py --workers：启动器执行后通过 SCS_STARTUP_DONE 告知子进程
+    - 独立启动的多个工作进程：在文件锁内依次执行，任务需幂等
+    """
+    if name in _completed or name in os.getenv(STARTUP_ENV, "").split(","):
+        return False
+    with file_lock(f"startup-{name}"):
+        task()
+    _completed.add(name)
+    return True
+
+
+def export_completed():
+    """把已完成的启动任务写入环境变量，之后派生的工作进程不再重复执行"""
+    done = set(filter(None, os.getenv(STARTUP_ENV, "").split(","))) | _completed
+    os.environ[STARTUP_ENV] = ",".join(sorted(done))
+
+
+def acquire_leadership(name: str) -> bool:
+    """非阻塞地竞选后台任务的执行者，成功后锁持有到进程退出
+
+    用于快照刷新这类全机只需一个进程执行的后台线程。
+    """
+    if name in _leader_locks:
+        return True
+    if fcntl is None:
+        return True
+    fd = os.open(_lock_path(f"leader-{name}"), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        logger.info("后台任务 %s 已由其它进程执行", name)
+        return False
+    _leader_locks[name] = fd
+    return True
+
+
+def _forget_leadership_after_fork():
+    """fork 出的子进程不继承父进程的选举结果
+
+    锁由父进程持有，子进程关闭继承的描述符（父进程仍持有锁），之后需要重新竞选。
+    已完成的启动任务（_completed）照常继承。
+    """
+    for fd in _leader_locks.values():
+        try:
+            os.close(fd)
+        except OSError:
+            pass
+    _leader_locks.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_leadership_after_fork)